@@ -2,6 +2,7 @@ from airflow import DAG
 from airflow.operators.python import PythonOperator
 from airflow.operators.bash import BashOperator
 from datetime import datetime, timedelta
+import os
 from airflow import configuration as conf
 
 from src.db_connection import *
@@ -9,6 +10,7 @@ from src.json_to_csv import *
 from src.CSV_to_DB import *
 from src.db_to_schema import *
 from src.download_data import *
+from src.prebuild_indexes import *
 
 default_args = {
     'owner': 'your_name',
@@ -93,6 +95,14 @@ dbtoschema = PythonOperator(
     dag=dag,
 )
 
+# Embed reviews offline so the chatbot loads indexes instead of building them on first question
+prebuild_product_indexes = PythonOperator(
+    task_id='prebuild_indexes',
+    python_callable=prebuild_indexes,
+    op_kwargs={'index_root': 'Data/Indexes', 'top_n': os.getenv('PREBUILD_TOP_N')},
+    dag=dag,
+)
+
 
 
 
@@ -112,6 +122,8 @@ for task in parallel_tasks_2:
 for task in parallel_tasks_3:
         task >> dbtoschema
 
+dbtoschema >> prebuild_product_indexes
+
 
 
 
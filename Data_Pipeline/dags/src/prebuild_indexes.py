@@ -0,0 +1,272 @@
+import os
+import re
+import json
+import uuid
+import shutil
+import hashlib
+from datetime import datetime, timezone
+
+import pandas as pd
+from dotenv import load_dotenv
+from sqlalchemy import bindparam, text
+from langchain_community.vectorstores import FAISS
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from src.db_connection import *
+
+# Load environment variables from a .env file
+load_dotenv()
+
+# Local stand-in for the artifact store, synced to the serving instances
+INDEX_ROOT = os.path.join('Data', 'Indexes')
+EMBEDDING_MODEL = os.getenv("PREBUILD_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+
+# Same columns the serving side loads, so prebuilt artifacts match on-demand builds
+REVIEW_COLUMNS = ["parent_asin", "asin", "helpful_vote", "timestamp", "verified_purchase", "title", "text"]
+META_COLUMNS = ["parent_asin", "main_category", "title", "average_rating", "rating_number",
+                "features", "description", "price", "store", "categories", "details"]
+
+# Watermark, review keys and tombstones saved next to each index, in the format the serving side updates
+STATE_FILE = 'incremental.json'
+TOMBSTONE_COMPACT_RATIO = 0.2
+# Review timestamps are TEXT like '2019-10-30 18:35:35.344', only values matching this are compared
+TIMESTAMP_PATTERN = re.compile(r"^[0-9]{4}-[0-9]{2}-[0-9]{2}")
+
+
+# Function to list the products to prebuild, the most reviewed first
+def select_products(connection, top_n=None):
+    query = """SELECT parent_asin FROM userreviews
+               WHERE text IS NOT NULL
+               GROUP BY parent_asin
+               ORDER BY COUNT(*) DESC"""
+    if top_n:
+        query += " LIMIT :top_n"
+    result = connection.execute(text(query), {"top_n": top_n} if top_n else {})
+    return [row[0] for row in result.fetchall()]
+
+
+# Function to fetch the reviews of a batch of products, only those at or after the watermark if given
+def fetch_reviews(connection, asins, watermark=None):
+    query = f"SELECT {', '.join(REVIEW_COLUMNS)} FROM userreviews WHERE parent_asin IN :asins"
+    since = parse_timestamp(watermark)
+    if since is not None:
+        # Same comparison as the serving side, reviews without a date timestamp are always returned
+        query += (" AND CASE WHEN timestamp ~ '^[0-9]{4}-[0-9]{2}-[0-9]{2}' "
+                  "THEN CAST(timestamp AS TIMESTAMP) >= :watermark ELSE TRUE END")
+    review_query = text(query).bindparams(bindparam("asins", expanding=True))
+    rows = connection.execute(review_query, {"asins": asins, "watermark": since}).fetchall()
+    return pd.DataFrame(rows, columns=REVIEW_COLUMNS)
+
+
+# Function to fetch the metadata of a batch of products
+def fetch_metadata(connection, asins):
+    meta_query = text(f"SELECT {', '.join(META_COLUMNS)} FROM metadata WHERE parent_asin IN :asins"
+                      ).bindparams(bindparam("asins", expanding=True))
+    return pd.DataFrame(connection.execute(meta_query, {"asins": asins}).fetchall(), columns=META_COLUMNS)
+
+
+# Function to fetch the key of every review of a batch of products, md5 is computed by the database
+def fetch_review_keys(connection, asins):
+    key_query = text("""SELECT parent_asin, asin, timestamp, md5(text) FROM userreviews
+                        WHERE parent_asin IN :asins AND text IS NOT NULL""").bindparams(bindparam("asins", expanding=True))
+    keys = {asin: set() for asin in asins}
+    for parent_asin, asin, timestamp, digest in connection.execute(key_query, {"asins": asins}).fetchall():
+        keys[parent_asin].add(f"{asin}:{timestamp}:{digest}")
+    return keys
+
+
+# Function to compute the key of a review row, same as the serving side
+def review_key(row):
+    return f"{row['asin']}:{row['timestamp']}:{hashlib.md5(row['text'].encode()).hexdigest()}"
+
+
+# Function to read the incremental state of a prebuilt index, None if it was built before it was tracked
+def load_state(index_dir):
+    state_path = os.path.join(index_dir, STATE_FILE)
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path) as f:
+        return json.load(f)
+
+
+# Function to parse a review timestamp or watermark, None when it is not a date
+def parse_timestamp(value):
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str) or not TIMESTAMP_PATTERN.match(value.strip()):
+        return None
+    try:
+        return datetime.fromisoformat(value.strip())
+    except ValueError:
+        return None
+
+
+# Function to compute the watermark of a product's reviews, stored as a string like the serving side
+def max_timestamp(product_reviews, default=None):
+    parsed = [ts for ts in map(parse_timestamp, [default, *product_reviews['timestamp']]) if ts is not None]
+    return max(parsed).isoformat(sep=" ") if parsed else None
+
+
+# Function to read the previous manifest, indexes of another embedding model cannot be updated
+def load_manifest(index_root):
+    manifest_path = os.path.join(index_root, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    return manifest.get("products", {}) if manifest.get("embedding_model") == EMBEDDING_MODEL else {}
+
+
+# Function to apply new and deleted reviews to the previous index of a product
+def update_product(vectordb, state, product_reviews, live_keys):
+    if len(product_reviews):
+        ids = [str(uuid.uuid4()) for _ in range(len(product_reviews))]
+        vectordb.add_embeddings(
+            text_embeddings=list(zip(product_reviews['text'], product_reviews['vector'])),
+            metadatas=product_reviews.drop(columns=['text', 'vector', 'key']).to_dict('records'),
+            ids=ids,
+        )
+        state["keys"].update(zip(product_reviews['key'], ids))
+        state["watermark"] = max_timestamp(product_reviews, state["watermark"])
+
+    # Deleted reviews are hidden by a tombstone and removed once they are a large share of the index
+    for key in [key for key in state["keys"] if key not in live_keys]:
+        id_ = state["keys"].pop(key)
+        vectordb.docstore.search(id_).metadata["deleted"] = True
+        state["tombstones"].append(id_)
+    if len(state["tombstones"]) > TOMBSTONE_COMPACT_RATIO * vectordb.index.ntotal:
+        vectordb.delete(state["tombstones"])
+        state["tombstones"] = []
+    return vectordb, state
+
+
+# Function to save one product's index, its incremental state and metadata under a new version directory
+def save_product(vectordb, state, meta_df, product_dir, version):
+    version_dir = os.path.join(product_dir, version)
+    vectordb.save_local(os.path.join(version_dir, 'index'))
+    with open(os.path.join(version_dir, 'index', STATE_FILE), 'w') as f:
+        json.dump(state, f)
+    meta_df.astype(str).to_parquet(os.path.join(version_dir, 'metadata.parquet'), index=False)
+    return version_dir
+
+
+# Function to remove all but the most recent versions of a product
+def prune_versions(product_dir, keep):
+    versions = sorted(os.listdir(product_dir), reverse=True)
+    for version in versions[keep:]:
+        shutil.rmtree(os.path.join(product_dir, version), ignore_errors=True)
+
+
+# Function to publish the manifest atomically, readers never see a partial file
+def publish_manifest(manifest, index_root):
+    manifest_path = os.path.join(index_root, 'manifest.json')
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+    return manifest_path
+
+
+# Function to embed reviews for all (or the top-N) products and publish per-product FAISS indexes
+def prebuild_indexes(index_root=INDEX_ROOT, top_n=None, product_batch_size=64, encode_batch_size=256, keep_versions=2):
+    top_n = int(top_n) if top_n else None
+    version = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+
+    # Embeddings match the serving defaults, only the encode batch size is raised for throughput
+    embeddings = HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL,
+        model_kwargs={'device': 'cpu'},
+        encode_kwargs={'batch_size': encode_batch_size},
+    )
+    engine = connect_with_db()
+
+    with engine.connect() as connection:
+        asins = select_products(connection, top_n)
+    print(f"Prebuilding indexes for {len(asins)} products, version {version}")
+
+    # Products of the previous run are updated with the reviews added or deleted since, not rebuilt
+    previous = load_manifest(index_root)
+    products, updated, unchanged = {}, 0, 0
+    for start in range(0, len(asins), product_batch_size):
+        batch = asins[start:start + product_batch_size]
+        states = {asin: load_state(os.path.join(index_root, previous[asin]["index_path"]))
+                  for asin in batch if asin in previous}
+        states = {asin: state for asin, state in states.items() if state is not None}
+        new_asins = [asin for asin in batch if asin not in states]
+
+        with engine.connect() as connection:
+            meta_df = fetch_metadata(connection, batch)
+            review_dfs = [fetch_reviews(connection, new_asins)] if new_asins else []
+            if states:
+                # Products without a watermark need all their reviews, a None watermark fetches everything
+                watermarks = [parse_timestamp(state["watermark"]) for state in states.values()]
+                watermark = None if None in watermarks else min(watermarks)
+                review_dfs.append(fetch_reviews(connection, list(states), watermark))
+                live_keys = fetch_review_keys(connection, list(states))
+        review_df = pd.concat(review_dfs, ignore_index=True) if review_dfs else pd.DataFrame(columns=REVIEW_COLUMNS)
+        review_df = review_df[review_df['text'].notna()]
+        review_df = review_df.assign(key=[review_key(row) for _, row in review_df.iterrows()])
+
+        # Rows at the watermark of an updated product may already be in its index
+        indexed = [key in states[asin]["keys"] if asin in states else False
+                   for asin, key in zip(review_df['parent_asin'], review_df['key'])]
+        review_df = review_df[[not flag for flag in indexed]].drop_duplicates(subset=['parent_asin', 'key'])
+
+        # One large encode call per batch of products instead of one per product
+        vectors = embeddings.embed_documents(review_df['text'].tolist())
+        review_df = review_df.assign(vector=vectors)
+        reviews_by_product = dict(tuple(review_df.groupby('parent_asin', sort=False)))
+
+        for asin in batch:
+            product_reviews = reviews_by_product.get(asin, review_df.iloc[0:0])
+            product_meta = meta_df[meta_df['parent_asin'] == asin]
+            product_dir = os.path.join(index_root, asin)
+
+            if asin in states:
+                state = states[asin]
+                deleted = [key for key in state["keys"] if key not in live_keys[asin]]
+                metadata_path = os.path.join(index_root, previous[asin]["metadata_path"])
+                if not len(product_reviews) and not deleted and \
+                        pd.read_parquet(metadata_path).equals(product_meta.astype(str).reset_index(drop=True)):
+                    products[asin] = previous[asin]
+                    unchanged += 1
+                    continue
+                vectordb = FAISS.load_local(os.path.join(index_root, previous[asin]["index_path"]), embeddings,
+                                            allow_dangerous_deserialization=True)
+                vectordb, state = update_product(vectordb, state, product_reviews, live_keys[asin])
+                updated += 1
+            elif len(product_reviews):
+                ids = [str(uuid.uuid4()) for _ in range(len(product_reviews))]
+                vectordb = FAISS.from_embeddings(
+                    text_embeddings=list(zip(product_reviews['text'], product_reviews['vector'])),
+                    embedding=embeddings,
+                    metadatas=product_reviews.drop(columns=['text', 'vector', 'key']).to_dict('records'),
+                    ids=ids,
+                )
+                state = {"watermark": max_timestamp(product_reviews),
+                         "keys": dict(zip(product_reviews['key'], ids)), "tombstones": []}
+            else:
+                continue
+
+            version_dir = save_product(vectordb, state, product_meta, product_dir, version)
+            products[asin] = {
+                "version": version,
+                "index_path": os.path.relpath(os.path.join(version_dir, 'index'), index_root),
+                "metadata_path": os.path.relpath(os.path.join(version_dir, 'metadata.parquet'), index_root),
+                "reviews": len(state["keys"]),
+            }
+
+        print(f"Prebuilt {len(products)}/{len(asins)} products, {updated} updated and {unchanged} unchanged")
+
+    manifest = {
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "embedding_model": EMBEDDING_MODEL,
+        "products": products,
+    }
+    manifest_path = publish_manifest(manifest, index_root)
+    print(f"Published manifest {manifest_path} with {len(products)} products")
+
+    # Old versions are dropped only after the new manifest points away from them
+    for asin in products:
+        prune_versions(os.path.join(index_root, asin), keep_versions)
@@ -0,0 +1,72 @@
+"""Throughput of /dev-batch-invoke against sequential /dev-invoke calls.
+
+Sends the evaluation questions of one or more products to a running API,
+first one /dev-invoke request at a time, then as a single batch, and prints
+queries per second for both.
+
+    VERTA_API_ACCESS_TOKEN=... python benchmarks/batch_invoke.py --url http://localhost:80 --limit 20
+"""
+import os
+import json
+import time
+import argparse
+from pathlib import Path
+
+import httpx
+import pandas as pd
+
+
+def load_queries(testset_path: str, limit: int) -> list:
+    testset = pd.concat([pd.read_parquet(path) for path in Path(testset_path).glob("*.parquet")], ignore_index=True)
+    testset = testset.head(limit)
+    return [{"query": row.question, "parent_asin": row.parent_asin} for row in testset.itertuples()]
+
+
+def sequential(client: httpx.Client, queries: list, user_id: str) -> float:
+    start = time.perf_counter()
+    for query in queries:
+        response = client.post("/dev-invoke", json={
+            **query, "user_id": user_id, "log_langfuse": False, "stream_tokens": False,
+        })
+        response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def batch(client: httpx.Client, queries: list, user_id: str) -> tuple:
+    start = time.perf_counter()
+    response = client.post("/dev-batch-invoke", json={"queries": queries, "user_id": user_id})
+    response.raise_for_status()
+    return time.perf_counter() - start, response.json()["errors"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:80")
+    parser.add_argument("--testset", default="evaluation/testset")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--user-id", default="benchmark")
+    args = parser.parse_args()
+
+    queries = load_queries(args.testset, args.limit)
+    headers = {"Authorization": f"Bearer {os.environ['VERTA_API_ACCESS_TOKEN']}"}
+    with httpx.Client(base_url=args.url, headers=headers, timeout=None) as client:
+        # Products are initialized before timing, both modes then start from a warm cache
+        for asin in {query["parent_asin"] for query in queries}:
+            client.get("/initialize", params={"asin": asin, "user_id": 0}).raise_for_status()
+
+        sequential_seconds = sequential(client, queries, args.user_id)
+        batch_seconds, errors = batch(client, queries, args.user_id)
+
+    print(json.dumps({
+        "queries": len(queries),
+        "sequential_seconds": round(sequential_seconds, 4),
+        "sequential_qps": round(len(queries) / sequential_seconds, 4),
+        "batch_seconds": round(batch_seconds, 4),
+        "batch_qps": round(len(queries) / batch_seconds, 4),
+        "batch_errors": errors,
+        "speedup": round(sequential_seconds / batch_seconds, 2),
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Per-product FAISS directories vs the partitioned catalog index.
+
+Uses random vectors so only index build, storage and search are measured,
+embedding cost is the same for both layouts.
+
+    python benchmarks/catalog_index.py --sizes 10000 100000 1000000
+"""
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from langchain_community.vectorstores import FAISS
+
+from utils.catalog_index import CatalogIndex
+from utils.embeddings import _rss_bytes
+
+
+class RandomEmbeddings(Embeddings):
+    """Placeholder required by FAISS, searches are done by vector."""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def embed_documents(self, texts):
+        return np.random.rand(len(texts), self.dim).astype(np.float32).tolist()
+
+    def embed_query(self, text):
+        return np.random.rand(self.dim).astype(np.float32).tolist()
+
+
+def dir_stats(path: Path):
+    files = [f for f in path.rglob("*") if f.is_file()]
+    return len(files), sum(f.stat().st_size for f in files)
+
+
+def percentiles(latencies: list) -> dict:
+    latencies = np.asarray(latencies) * 1000
+    return {"p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 3)}
+
+
+def make_products(num_reviews: int, per_product: int, dim: int, rng):
+    for p in range(num_reviews // per_product):
+        asin = f"B{p:09d}"
+        vectors = rng.standard_normal((per_product, dim), dtype=np.float32)
+        docs = [Document(page_content=f"review {i} of {asin}", metadata={"parent_asin": asin})
+                for i in range(per_product)]
+        yield asin, vectors, docs
+
+
+def bench_per_product(root: Path, num_reviews, per_product, dim, queries, rng):
+    embeddings = RandomEmbeddings(dim)
+    start = time.perf_counter()
+    asins = []
+    for asin, vectors, docs in make_products(num_reviews, per_product, dim, rng):
+        texts = [doc.page_content for doc in docs]
+        vectordb = FAISS.from_embeddings(list(zip(texts, vectors.tolist())), embeddings,
+                                         metadatas=[doc.metadata for doc in docs])
+        vectordb.save_local(root / asin)
+        asins.append(asin)
+    build_seconds = time.perf_counter() - start
+
+    # Cold: the first question of a product loads its directory
+    rss_before = _rss_bytes()
+    loaded, cold, warm = {}, [], []
+    for asin in rng.choice(asins, size=queries):
+        query = rng.standard_normal(dim, dtype=np.float32).tolist()
+        start = time.perf_counter()
+        if asin not in loaded:
+            loaded[asin] = FAISS.load_local(root / asin, embeddings, allow_dangerous_deserialization=True)
+            loaded[asin].similarity_search_by_vector(query, k=4)
+            cold.append(time.perf_counter() - start)
+        else:
+            loaded[asin].similarity_search_by_vector(query, k=4)
+            warm.append(time.perf_counter() - start)
+
+    files, disk_bytes = dir_stats(root)
+    return {
+        "build_seconds": round(build_seconds, 3),
+        "files": files,
+        "disk_bytes": disk_bytes,
+        "rss_delta_bytes": max(_rss_bytes() - rss_before, 0),
+        "cold_query": percentiles(cold) if cold else None,
+        "warm_query": percentiles(warm) if warm else None,
+    }
+
+
+def bench_catalog(root: Path, num_reviews, per_product, dim, queries, rng):
+    index = CatalogIndex(root)
+    start = time.perf_counter()
+    asins, batch = [], []
+    for product in make_products(num_reviews, per_product, dim, rng):
+        batch.append(product)
+        asins.append(product[0])
+        if len(batch) == 1000:
+            index.add_many(batch)
+            batch = []
+    if batch:
+        index.add_many(batch)
+    build_seconds = time.perf_counter() - start
+
+    rss_before = _rss_bytes()
+    seen, cold, warm = set(), [], []
+    for asin in rng.choice(asins, size=queries):
+        query = rng.standard_normal(dim, dtype=np.float32)
+        start = time.perf_counter()
+        index.search(asin, query, k=4)
+        (warm if asin in seen else cold).append(time.perf_counter() - start)
+        seen.add(asin)
+
+    files, disk_bytes = dir_stats(root)
+    return {
+        "build_seconds": round(build_seconds, 3),
+        "files": files,
+        "disk_bytes": disk_bytes,
+        "rss_delta_bytes": max(_rss_bytes() - rss_before, 0),
+        "cold_query": percentiles(cold) if cold else None,
+        "warm_query": percentiles(warm) if warm else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--reviews-per-product", type=int, default=50)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for num_reviews in args.sizes:
+        for layout, bench in [("per_product", bench_per_product), ("catalog", bench_catalog)]:
+            root = Path(tempfile.mkdtemp(prefix=f"bench-{layout}-"))
+            try:
+                rng = np.random.default_rng(args.seed)
+                result = bench(root, num_reviews, args.reviews_per_product, args.dim, args.queries, rng)
+            finally:
+                shutil.rmtree(root, ignore_errors=True)
+            print(json.dumps({"reviews": num_reviews, "layout": layout, **result}))
+
+
+if __name__ == "__main__":
+    main()
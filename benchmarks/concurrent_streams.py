@@ -0,0 +1,67 @@
+"""Throughput of concurrent streams on one worker with sync and async nodes.
+
+Every node is replaced by the fixed-delay mocks from graph_topology.py and
+N streams are started at once on a single event loop, as one uvicorn worker
+would. Sync nodes are run by LangGraph on the default thread pool, async
+nodes yield to the event loop while they wait.
+
+    python benchmarks/concurrent_streams.py --streams 200 --llm-delay 0.5
+"""
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from dataclasses import replace
+
+from config.configuration import ConfigurationManager
+from main.graph import Graph
+from graph_topology import mock_nodes
+
+
+async def stream(graph) -> float:
+    start = time.perf_counter()
+    async for _ in graph.astream_events(
+        {"question": "Is it durable?", "meta_data": "", "retriever": ""},
+        version="v2",
+    ):
+        pass
+    return time.perf_counter() - start
+
+
+async def run(graph, streams: int) -> tuple:
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(stream(graph) for _ in range(streams)))
+    return time.perf_counter() - start, sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--llm-delay", type=float, default=0.5)
+    parser.add_argument("--retrieval-delay", type=float, default=0.05)
+    parser.add_argument("--topology", default="sequential", choices=["sequential", "parallel"])
+    args = parser.parse_args()
+
+    mock_nodes(args.llm_delay, args.retrieval_delay)
+    config = ConfigurationManager().get_prepare_base_model_config()
+
+    for async_nodes in [False, True]:
+        graph = Graph(config=replace(config, graph_topology=args.topology, async_nodes=async_nodes)).create_graph()
+        elapsed, latencies = asyncio.run(run(graph, args.streams))
+        print(json.dumps({
+            "nodes": "async" if async_nodes else "sync",
+            "streams": args.streams,
+            "elapsed_seconds": round(elapsed, 4),
+            "streams_per_second": round(args.streams / elapsed, 2),
+            "p50_seconds": round(statistics.median(latencies), 4),
+            "p95_seconds": round(latencies[int(len(latencies) * 0.95) - 1], 4),
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Query embedding throughput with and without micro-batching.
+
+N distinct questions are encoded from N threads at once, as concurrent
+retrievals on one worker would, first with batching disabled and then with
+the configured window. Questions are distinct so the query cache is not
+involved.
+
+    python benchmarks/embedding_batcher.py --concurrency 32 --window-ms 3
+"""
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.embeddings import embedding_registry, DEFAULT_EMBEDDING_MODEL
+from utils.embedding_batcher import EmbeddingBatcher
+
+
+def run(batcher: EmbeddingBatcher, questions: list, model_name: str) -> dict:
+    with ThreadPoolExecutor(max_workers=len(questions)) as pool:
+        start = time.perf_counter()
+        list(pool.map(lambda question: batcher.embed(question, model_name), questions))
+        seconds = time.perf_counter() - start
+    stats = batcher.stats()
+    return {
+        "seconds": round(seconds, 4),
+        "queries_per_second": round(len(questions) / seconds, 2),
+        "batches": stats["batches"],
+        "avg_batch_size": stats["avg_batch_size"],
+        "queue_wait_ms_avg": stats["queue_wait_ms"]["avg"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=DEFAULT_EMBEDDING_MODEL)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--window-ms", type=float, default=3.0)
+    parser.add_argument("--max-batch", type=int, default=32)
+    args = parser.parse_args()
+
+    embedding_registry.warmup([args.model])
+    questions = [f"Does the product still work after {i} weeks of daily use?" for i in range(args.concurrency)]
+    print(json.dumps({
+        "concurrency": args.concurrency,
+        "unbatched": run(EmbeddingBatcher(window_ms=0, max_batch=1), questions, args.model),
+        "batched": run(EmbeddingBatcher(window_ms=args.window_ms, max_batch=args.max_batch), questions, args.model),
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""End-to-end latency of the sequential and parallel graph topologies.
+
+Every LLM-backed node is replaced by a mock that sleeps for a fixed delay,
+retrieval by a shorter fixed delay, so the difference comes only from how
+the nodes are wired.
+
+    python benchmarks/graph_topology.py --llm-delay 0.5 --retrieval-delay 0.05
+"""
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from dataclasses import replace
+
+from langchain.schema import Document
+from langchain_core.messages import AIMessage
+
+import components.agents as agent
+import components.nodes as node
+from components.state import RouteQuery
+from config.configuration import ConfigurationManager
+from main.graph import Graph
+
+
+def mock_nodes(llm_delay: float, retrieval_delay: float):
+    def supervisor_result(state):
+        datasource = "FINISH" if state.get("documents") else "Review-Vectorstore"
+        return {"question_type": RouteQuery(datasource=datasource)}
+
+    def metadata_result(state):
+        return {"meta_summary": Document(page_content="summary", metadata={"source": "Metadata"})}
+
+    def retrieve_result(state):
+        return {"documents": [Document(page_content="review")] * 4}
+
+    def final_result(state):
+        return {"answer": AIMessage(content="answer")}
+
+    def followup_result(state):
+        return {"followup_questions": ["question?"], "answer": state["answer"]}
+
+    # Sync mocks block their thread, async mocks yield to the event loop, like the real nodes
+    def sync_node(result, delay):
+        def run(state, **kwargs):
+            time.sleep(delay)
+            return result(state)
+        return run
+
+    def async_node(result, delay):
+        async def run(state, **kwargs):
+            await asyncio.sleep(delay)
+            return result(state)
+        return run
+
+    for module, name, result, delay in [
+        (agent, "supervisor_agent", supervisor_result, llm_delay),
+        (agent, "metadata_node", metadata_result, llm_delay),
+        (agent, "retrieve", retrieve_result, retrieval_delay),
+        (node, "final_llm_node", final_result, llm_delay),
+        (node, "followup_node", followup_result, llm_delay),
+    ]:
+        setattr(module, name, sync_node(result, delay))
+        setattr(module, "a" + name, async_node(result, delay))
+
+
+async def run(graph, runs: int) -> list:
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await graph.ainvoke({"question": "Is it durable?", "meta_data": "", "retriever": ""})
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm-delay", type=float, default=0.5)
+    parser.add_argument("--retrieval-delay", type=float, default=0.05)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    mock_nodes(args.llm_delay, args.retrieval_delay)
+    config = ConfigurationManager().get_prepare_base_model_config()
+
+    for topology in ["sequential", "parallel"]:
+        graph = Graph(config=replace(config, graph_topology=topology)).create_graph()
+        latencies = asyncio.run(run(graph, args.runs))
+        print(json.dumps({
+            "topology": topology,
+            "mean_seconds": round(statistics.mean(latencies), 4),
+            "p50_seconds": round(statistics.median(latencies), 4),
+            "max_seconds": round(max(latencies), 4),
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Parity and throughput of the onnx-int8 embedding backend against PyTorch fp32.
+
+For every evaluation question whose product has a cached fp32 index, the
+top-k reviews found with fp32 query embeddings are the reference. Recall@k
+is measured for int8 queries against the existing fp32 index (what serving
+sees after switching backends without a rebuild) and against an index
+rebuilt with int8 review embeddings. Throughput is measured on the reviews
+of those indexes (index build) and on the questions one at a time (query
+latency).
+
+    python benchmarks/onnx_embeddings.py --k 4 --limit 200
+"""
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import json
+import time
+import argparse
+from pathlib import Path
+
+import faiss
+import numpy as np
+import pandas as pd
+from langchain_community.vectorstores import FAISS
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from config.configuration import ConfigurationManager
+from utils.onnx_embeddings import OnnxEmbeddings
+
+
+def load_questions(testset_path: str, faiss_dir: Path, limit: int) -> pd.DataFrame:
+    questions = pd.concat([pd.read_parquet(path, columns=["question", "parent_asin"])
+                           for path in Path(testset_path).glob("*.parquet")], ignore_index=True)
+    questions = questions[[(faiss_dir / asin / "index.faiss").exists() for asin in questions["parent_asin"]]]
+    return questions.head(limit)
+
+
+def embed(model, texts: list) -> np.ndarray:
+    return np.asarray(model.embed_documents(texts), dtype=np.float32)
+
+
+def recall(reference: np.ndarray, found: np.ndarray) -> float:
+    return float(np.mean([len(set(r) & set(f)) / len(r) for r, f in zip(reference, found)]))
+
+
+def throughput(model, texts: list, questions: list) -> dict:
+    start = time.perf_counter()
+    embed(model, texts)
+    build_seconds = time.perf_counter() - start
+
+    latencies = []
+    for question in questions:
+        start = time.perf_counter()
+        model.embed_query(question)
+        latencies.append(time.perf_counter() - start)
+    return {
+        "index_build_texts_per_second": round(len(texts) / build_seconds, 2),
+        "query_p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "query_p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--output", default=None, help="Optional path of a JSON report")
+    args = parser.parse_args()
+
+    config = ConfigurationManager().get_prepare_base_model_config()
+    testset_path = ConfigurationManager().get_test_ingestion_config().testset_path
+    questions = load_questions(testset_path, Path(config.faiss_dir), args.limit)
+    if questions.empty:
+        raise SystemExit(f"No evaluation question has a cached index under {config.faiss_dir}, initialize some products first")
+
+    fp32 = HuggingFaceEmbeddings(model_name=config.embedding_model)
+    int8 = OnnxEmbeddings(config.embedding_model, config.onnx_dir)
+
+    query_recalls, rebuild_recalls, texts = [], [], []
+    for asin, group in questions.groupby("parent_asin"):
+        vectordb = FAISS.load_local(str(Path(config.faiss_dir) / asin), fp32, allow_dangerous_deserialization=True)
+        k = min(args.k, vectordb.index.ntotal)
+        product_texts = [vectordb.docstore.search(vectordb.index_to_docstore_id[i]).page_content
+                         for i in range(vectordb.index.ntotal)]
+        texts.extend(product_texts)
+
+        _, reference = vectordb.index.search(embed(fp32, group["question"].tolist()), k)
+        int8_queries = embed(int8, group["question"].tolist())
+        _, found = vectordb.index.search(int8_queries, k)
+        query_recalls.append((recall(reference, found), len(group)))
+
+        rebuilt = faiss.IndexFlatL2(int8.dimension)
+        rebuilt.add(embed(int8, product_texts))
+        _, found = rebuilt.search(int8_queries, k)
+        rebuild_recalls.append((recall(reference, found), len(group)))
+
+    def weighted(recalls):
+        return round(sum(value * n for value, n in recalls) / sum(n for _, n in recalls), 4)
+
+    report = {
+        "questions": len(questions),
+        "products": questions["parent_asin"].nunique(),
+        "k": args.k,
+        "dimension": {"torch": len(fp32.embed_query("dimension")), "onnx-int8": int8.dimension},
+        "recall_at_k": {
+            "int8_queries_fp32_index": weighted(query_recalls),
+            "int8_queries_int8_index": weighted(rebuild_recalls),
+        },
+        "torch": throughput(fp32, texts, questions["question"].tolist()),
+        "onnx-int8": throughput(int8, texts, questions["question"].tolist()),
+        "onnx_model_bytes": int8.model_bytes,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,15 @@
 import os
 import asyncio
-from sqlalchemy import text
-import pandas as pd
 import streamlit as st
 
 from langfuse.callback import CallbackHandler
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.document_loaders import DataFrameLoader
 
 from utils import database as db
+from utils.repository import fetch_product_data
+from utils.embeddings import DEFAULT_EMBEDDING_MODEL
+from utils.index_builder import build_vector_store
+from utils.query_embeddings import query_embedding_cache
 from pipeline.stage_01_prepare_base_model import PrepareBaseTrainingPipeline
 
 from dotenv import load_dotenv
@@ -52,35 +52,18 @@ engine = db.connect_with_db(credentials)
 ## Function to load data and create retriever, with caching
 @st.cache_resource
 def create_retriever(asin, _engine):
-    with _engine.begin() as connection:
-        try:
-            review_query = text(f"""
-                        SELECT parent_asin, asin, helpful_vote, timestamp, verified_purchase, title, text
-                        FROM userreviews ur 
-                        WHERE ur.parent_asin = '{asin}';
-                    """)
-            review_result = connection.execute(review_query)
-            review_df = pd.DataFrame(review_result.fetchall(), columns=review_result.keys())
-
-            meta_query = text(f"""
-                     SELECT parent_asin, main_category, title, average_rating, rating_number, features, description, price, store, categories, details
-                     FROM metadata md 
-                     WHERE md.parent_asin = '{asin}';
-                """)
-            meta_result = connection.execute(meta_query)
-            meta_df = pd.DataFrame(meta_result.fetchall(), columns=meta_result.keys())
-
-        except Exception as e:
-            print(e)
-            return None, None, None
+    try:
+        review_df, meta_df = fetch_product_data(_engine, asin)
+    except Exception as e:
+        print(e)
+        return None, None, None
 
     # Load the Reviews
     loader = DataFrameLoader(review_df)
     review_docs = loader.load()
 
-    # Create and return the retriever
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    vectordb = FAISS.from_documents(documents=review_docs, embedding=embeddings)
+    # Create and return the retriever, reviews embedded before are read from the embedding store
+    vectordb = build_vector_store(review_docs, DEFAULT_EMBEDDING_MODEL, query_embedding_cache.wrap())
     retriever = vectordb.as_retriever()
     return retriever, review_df, meta_df
 
@@ -1,28 +1,146 @@
-import pandas as pd
-from langchain_groq import ChatGroq
+import json
+import time
+import threading
+from pathlib import Path
+from collections import Counter
+import numpy as np
 from langchain.schema import Document
-from langchain_openai import ChatOpenAI
-from langchain_community.vectorstores import FAISS
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_core.output_parsers import StrOutputParser
 
 from constants import MEMBERS, OPTIONS
 from components.state import MultiAgentState, RouteQuery
+from utils.embeddings import DEFAULT_EMBEDDING_MODEL
+from utils.query_embeddings import query_embedding_cache
+from utils.vector_cache import vector_store_cache
+from utils.incremental_index import is_live
+from utils.catalog_index import get_catalog_index
+from utils.metadata_store import ProductMetadata, metadata_store
+from utils.summary_cache import summary_cache
+from utils.llm_registry import llm_registry
+from utils.executor import execution_layer
+from utils.router_model import CentroidRouterModel
+from logger import logger
 
+ROUTERS = ("llm", "centroid")
 
-def supervisor_agent(state: MultiAgentState, prompt, model):
-    question = state["question"]
-    documents = state["documents"]
 
+class RoutingEngine:
+    """Chooses the supervisor route, without an LLM call when it can.
+
+    With the `llm` router every decision is made by the LLM supervisor. With
+    the `centroid` router the route after retrieval is FINISH (the only
+    member already ran) and the first route comes from the nearest-centroid
+    model when its confidence reaches the threshold. Otherwise the LLM
+    supervisor decides, and its decision is logged as training data.
+    """
+
+    def __init__(self):
+        self._config = None
+        self._model = None
+        self._model_mtime = None
+        self.routes = Counter()
+        self.fallbacks = 0
+        self._latency = {}
+        self._lock = threading.Lock()
+
+
+    def configure(self, router: str, model_path, threshold: float, log_path, embedding_model: str):
+        if router not in ROUTERS:
+            raise ValueError(f"Unknown router {router}, expected one of {ROUTERS}")
+        self._config = dict(router=router, model_path=Path(model_path), threshold=threshold,
+                            log_path=Path(log_path), embedding_model=embedding_model)
+        self._model, self._model_mtime = None, None
+
+
+    def _load_config(self) -> dict:
+        if self._config is None:
+            from config.configuration import ConfigurationManager
+            config = ConfigurationManager().get_prepare_base_model_config()
+            self.configure(config.router, config.router_model_path, config.router_confidence_threshold,
+                           config.router_log_path, config.embedding_model)
+        return self._config
+
+
+    def _load_model(self):
+        # Reloaded when the training stage writes a new model
+        model_path = self._config["model_path"]
+        if not model_path.exists():
+            return None
+        mtime = model_path.stat().st_mtime
+        if mtime != self._model_mtime:
+            model = CentroidRouterModel.load(model_path)
+            if model.embedding_model != self._config["embedding_model"]:
+                logger.warning(f"Router model uses {model.embedding_model}, expected "
+                               f"{self._config['embedding_model']}, falling back to the LLM supervisor")
+                model = None
+            self._model, self._model_mtime = model, mtime
+        return self._model
+
+
+    def local_route(self, state: MultiAgentState):
+        """(datasource, source) decided locally, or None to ask the LLM supervisor."""
+        config = self._load_config()
+        if config["router"] == "llm":
+            return None
+        # Retrieval can return nothing, running it again would not change that
+        if state.get("retrieved") or state["documents"]:
+            return "FINISH", "rule"
+
+        model = self._load_model()
+        if model is not None:
+            vector = query_embedding_cache.embed(state["question"], config["embedding_model"])
+            datasource, confidence = model.predict(vector)
+            if confidence >= config["threshold"]:
+                return datasource, "centroid"
+        self.fallbacks += 1
+        return None
+
+
+    def log_decision(self, question: str, has_documents: bool, datasource: str):
+        log_path = self._load_config()["log_path"]
+        record = {"question": question, "has_documents": has_documents,
+                  "datasource": datasource, "created_at": time.time()}
+        with self._lock:
+            log_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(log_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+
+    def record(self, source: str, latency: float, datasource: str):
+        with self._lock:
+            stat = self._latency.setdefault(source, {"decisions": 0, "total": 0.0, "max": 0.0})
+            stat["decisions"] += 1
+            stat["total"] += latency
+            stat["max"] = max(stat["max"], latency)
+            self.routes[datasource] += 1
+
+
+    def stats(self) -> dict:
+        return {
+            "router": self._config["router"] if self._config else None,
+            "model_loaded": self._model is not None,
+            "fallbacks": self.fallbacks,
+            "routes": dict(self.routes),
+            "sources": {
+                source: {
+                    "decisions": stat["decisions"],
+                    "latency_avg_seconds": round(stat["total"] / stat["decisions"], 6),
+                    "latency_max_seconds": round(stat["max"], 6),
+                }
+                for source, stat in self._latency.items()
+            },
+        }
+
+
+routing_engine = RoutingEngine()
+
+
+def _supervisor_chain(prompt, model):
     system_prompt = (
         prompt
     )
 
-    if 'gpt' in model: 
-        llm = ChatOpenAI(model_name=model)
-    else:
-        llm = ChatGroq(model_name=model)
+    llm = llm_registry.get(model)
 
     prompt = ChatPromptTemplate.from_messages(
         [
@@ -37,87 +155,195 @@ def supervisor_agent(state: MultiAgentState, prompt, model):
         ]
     ).partial(options=str(OPTIONS), members=", ".join(MEMBERS))
 
-    supervisor_chain = prompt | llm.with_structured_output(RouteQuery)
-    question_type = supervisor_chain.invoke({"question": question, 'document': documents})
+    return prompt | llm.with_structured_output(RouteQuery)
+
+
+def supervisor_agent(state: MultiAgentState, prompt, model):
+    question = state["question"]
+    documents = state["documents"]
+
+    start = time.perf_counter()
+    local = routing_engine.local_route(state)
+    if local is not None:
+        datasource, source = local
+        question_type = RouteQuery(datasource=datasource)
+    else:
+        supervisor_chain = _supervisor_chain(prompt, model)
+        question_type = supervisor_chain.invoke({"question": question, 'document': documents})
+        source = "llm"
+        routing_engine.log_decision(question, bool(documents), question_type.datasource)
+    routing_engine.record(source, time.perf_counter() - start, question_type.datasource)
 
     return {'question_type' : question_type}
 
 
-def metadata_node(state: MultiAgentState, prompt, model):
+async def asupervisor_agent(state: MultiAgentState, prompt, model):
+    question = state["question"]
+    documents = state["documents"]
 
-    if 'gpt' in model: 
-        llm = ChatOpenAI(model_name=model)
+    start = time.perf_counter()
+    # The local route may embed the question, it runs on the I/O pool
+    local = await execution_layer.run_io(routing_engine.local_route, state)
+    if local is not None:
+        datasource, source = local
+        question_type = RouteQuery(datasource=datasource)
     else:
-        llm = ChatGroq(model_name=model)
-
-    meta_df = state['meta_data']
-
-    if isinstance(meta_df, str):
-        meta_df = pd.read_csv(meta_df)
-    
-    modified_details = meta_df['details'].astype(str).str.replace('{', '[')
-    
-    # Answer question
-    meta_system_prompt = ( 
-        prompt.format(
-            main_category=(meta_df.at[0, 'main_category']),
-            title=(meta_df.at[0, 'title']),
-            average_rating=(meta_df.at[0, 'average_rating']),
-            rating_number=(meta_df.at[0, 'rating_number']),
-            features=(meta_df.at[0, 'features']),
-            description=(meta_df.at[0, 'description']),
-            price=(meta_df.at[0, 'price']),
-            store=(meta_df.at[0, 'store']),
-            categories=(meta_df.at[0, 'categories']),
-            details=(modified_details.at[0]),
-        )
-    )
+        supervisor_chain = _supervisor_chain(prompt, model)
+        question_type = await supervisor_chain.ainvoke({"question": question, 'document': documents})
+        source = "llm"
+        await execution_layer.run_io(routing_engine.log_decision, question, bool(documents), question_type.datasource)
+    routing_engine.record(source, time.perf_counter() - start, question_type.datasource)
+
+    return {'question_type' : question_type}
 
-    meta_system_prompt = meta_system_prompt.replace('{', '{{').replace('}', '}}')
+
+def _total_tokens(message) -> int:
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return usage.get("total_tokens", 0)
+    return message.response_metadata.get("token_usage", {}).get("total_tokens", 0)
+
+
+def _metadata_chain(meta_data: ProductMetadata, model):
+    llm = llm_registry.get(model)
 
     meta_qa_prompt = ChatPromptTemplate.from_messages(
                     [
-                        ("system", meta_system_prompt),
+                        ("system", meta_data.prompt),
                     ]
                 )
-    parser = StrOutputParser()
-    meta_chain = meta_qa_prompt | llm | parser
+    return meta_qa_prompt | llm
+
+
+def summarize_metadata(meta_data: ProductMetadata, prompt, model) -> Document:
+    # The summary only changes with the metadata row, the model or the prompt
+    cached = summary_cache.get(meta_data, model, prompt)
+    if cached is not None:
+        return cached
+
+    meta_chain = _metadata_chain(meta_data, model)
 
     try:
         # Meta Summary
-        meta_results = meta_chain.invoke({'input': ''})
-        meta_results = Document(page_content=meta_results, metadata={"source": "Metadata"})
+        message = meta_chain.invoke({'input': ''})
+        meta_results = Document(page_content=message.content, metadata={"source": "Metadata"})
+        summary_cache.put(meta_data, model, prompt, message.content, _total_tokens(message))
         
     except Exception as error:
-        print(error)
+        logger.error(f"Error summarizing metadata for ASIN: {meta_data.parent_asin} - {error}")
         content = "Metadata: Unable to generate result"
         meta_results = Document(page_content=content, metadata={"source": "Metadata"})
 
-    return {'meta_summary': meta_results}
+    return meta_results
+
+
+async def asummarize_metadata(meta_data: ProductMetadata, prompt, model) -> Document:
+    # SQLite lookups are blocking, they run on the I/O pool instead of the event loop
+    cached = await execution_layer.run_io(summary_cache.get, meta_data, model, prompt)
+    if cached is not None:
+        return cached
+
+    meta_chain = _metadata_chain(meta_data, model)
+
+    try:
+        message = await meta_chain.ainvoke({'input': ''})
+        meta_results = Document(page_content=message.content, metadata={"source": "Metadata"})
+        await execution_layer.run_io(summary_cache.put, meta_data, model, prompt,
+                                     message.content, _total_tokens(message))
+
+    except Exception as error:
+        logger.error(f"Error summarizing metadata for ASIN: {meta_data.parent_asin} - {error}")
+        content = "Metadata: Unable to generate result"
+        meta_results = Document(page_content=content, metadata={"source": "Metadata"})
+
+    return meta_results
+
+
+def _load_metadata(meta_data, prompt) -> ProductMetadata:
+    # The metadata prompt is rendered once per product and cached with its record
+    if isinstance(meta_data, str):
+        return metadata_store.load(meta_data, prompt)
+    if not isinstance(meta_data, ProductMetadata):
+        return ProductMetadata.from_frame(meta_data, prompt)
+    return meta_data
+
 
+def metadata_node(state: MultiAgentState, prompt, model):
+    meta_data = _load_metadata(state['meta_data'], prompt)
+
+    return {'meta_summary': summarize_metadata(meta_data, prompt, model)}
+
+
+async def ametadata_node(state: MultiAgentState, prompt, model):
+    # Reading Parquet and rendering the prompt are offloaded, only the LLM call is awaited on the loop
+    meta_data = await execution_layer.run_io(_load_metadata, state['meta_data'], prompt)
+
+    return {'meta_summary': await asummarize_metadata(meta_data, prompt, model)}
 
-def retrieve(state: MultiAgentState):
+
+def _load_retriever(retriever, embedding_model, backend):
+    # Suggested follow-ups are asked verbatim again and again, their embeddings come from the cache
+    embeddings = query_embedding_cache.wrap(embedding_model)
+    if backend == "catalog":
+        # The path is <catalog_dir>/<asin>, search is restricted to that product
+        path = Path(retriever)
+        return get_catalog_index(path.parent).as_retriever(path.name, embeddings)
+    vectordb = vector_store_cache.load(retriever, embeddings)
+    if vectordb.tombstones:
+        return vectordb.as_retriever(search_kwargs={"filter": is_live, "fetch_k": 4 + vectordb.tombstones})
+    return vectordb.as_retriever()
+
+
+def retrieve(state: MultiAgentState, embedding_model=DEFAULT_EMBEDDING_MODEL, backend="product"):
     """
     Retrieve documents
 
     Args:
         state (dict): The current graph state
+        embedding_model (str): Name of the shared embedding model used to load the index
+        backend (str): "product" for per-product indexes, "catalog" for the partitioned catalog index
 
     Returns:
-        state (dict): New key added to state, documents, that contains retrieved documents
+        state (dict): New keys added to state, documents, that contains retrieved documents,
+            and retrieved, set even when nothing was found
     """
     question = state["question"]
     retriever = state["retriever"]
 
     # Load the database
     if isinstance(retriever, str):
-        embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        vectordb = FAISS.load_local(retriever, embeddings, allow_dangerous_deserialization=True)
-        retriever = vectordb.as_retriever()
+        retriever = _load_retriever(retriever, embedding_model, backend)
        
     # Retrieval
     documents = retriever.invoke(question)
 
-    return {"documents": documents}
+    return {"documents": documents, "retrieved": True}
+
+
+async def aretrieve(state: MultiAgentState, embedding_model=DEFAULT_EMBEDDING_MODEL, backend="product"):
+    """
+    Async variant of retrieve, index loading runs on the I/O pool and the
+    query embedding and search run through the retriever's ainvoke.
+    """
+    question = state["question"]
+    retriever = state["retriever"]
+
+    if isinstance(retriever, str):
+        retriever = await execution_layer.run_io(_load_retriever, retriever, embedding_model, backend)
+
+    documents = await retriever.ainvoke(question)
+
+    return {"documents": documents, "retrieved": True}
+
 
+def retrieve_many(retriever: str, vectors: np.ndarray, embedding_model=DEFAULT_EMBEDDING_MODEL, backend="product", k=4) -> list:
+    """Retrieve documents for several embedded questions about one product with a single index search."""
+    if backend == "catalog":
+        path = Path(retriever)
+        return get_catalog_index(path.parent).search_many(path.name, vectors, k)
 
+    vectordb = vector_store_cache.load(retriever, query_embedding_cache.wrap(embedding_model))
+    _, indices = vectordb.index.search(np.asarray(vectors, dtype=np.float32), k + vectordb.tombstones)
+    documents = [[vectordb.docstore.search(vectordb.index_to_docstore_id[i]) for i in row if i != -1]
+                 for row in indices]
+    return [[doc for doc in row if is_live(doc.metadata)][:k] for row in documents]
@@ -1,8 +1,7 @@
-from langchain_groq import ChatGroq
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 
 from components.state import MultiAgentState
+from utils.llm_registry import llm_registry
 
 def route_question(state):
     source = state['question_type']
@@ -12,15 +11,8 @@ def route_question(state):
         return "FINISH"
 
 
-def final_llm_node(state: MultiAgentState, prompt, model):
-    question = state["question"]
-    documents = state["documents"]
-    meta_summary = state["meta_summary"]
-
-    if 'gpt' in model: 
-        llm = ChatOpenAI(model_name=model)
-    else:
-        llm = ChatGroq(model_name=model)
+def _final_chain(meta_summary, prompt, model):
+    llm = llm_registry.get(model)
 
     system_prompt = (
         f"{prompt.format(product=meta_summary.page_content)}"
@@ -33,23 +25,35 @@ def final_llm_node(state: MultiAgentState, prompt, model):
                         ("human", "{input}")
                     ]
                 )
-    question_answer_chain = qa_prompt | llm
+    return qa_prompt | llm
+
+
+def final_llm_node(state: MultiAgentState, prompt, model):
+    question = state["question"]
+    documents = state["documents"]
+    meta_summary = state["meta_summary"]
+
+    question_answer_chain = _final_chain(meta_summary, prompt, model)
 
     generation = question_answer_chain.invoke({"context": documents, "input": question})
 
     return {"answer": generation}
 
 
-def followup_node(state: MultiAgentState, prompt, model):
-    documents = state['documents']
-    meta_summary = state['meta_summary']
-    question = state['question']
-    answer = state['answer']
-    
-    if 'gpt' in model: 
-        llm = ChatOpenAI(model_name=model)
-    else:
-        llm = ChatGroq(model_name=model)
+async def afinal_llm_node(state: MultiAgentState, prompt, model):
+    question = state["question"]
+    documents = state["documents"]
+    meta_summary = state["meta_summary"]
+
+    question_answer_chain = _final_chain(meta_summary, prompt, model)
+
+    generation = await question_answer_chain.ainvoke({"context": documents, "input": question})
+
+    return {"answer": generation}
+
+
+def _followup_chain(prompt, model):
+    llm = llm_registry.get(model)
 
     system_prompt = (
         prompt
@@ -60,8 +64,26 @@ def followup_node(state: MultiAgentState, prompt, model):
                     ]
                 )
     
-    followup_chain = follow_prompt | llm
-    followup = followup_chain.invoke({'question': question, 'answer': answer.content, 'product': meta_summary, 'context': documents[-3:]}) # just consider last three document list 
+    return follow_prompt | llm
+
+
+def _followup_inputs(state: MultiAgentState) -> dict:
+    # just consider last three document list
+    return {'question': state['question'], 'answer': state['answer'].content,
+            'product': state['meta_summary'], 'context': state['documents'][-3:]}
+
+
+def followup_node(state: MultiAgentState, prompt, model):
+    followup_chain = _followup_chain(prompt, model)
+    followup = followup_chain.invoke(_followup_inputs(state))
     followup_questions = followup.content.replace("\\n", "\n").split("\n")
     
-    return {'followup_questions': followup_questions, "answer": answer}       
\ No newline at end of file
+    return {'followup_questions': followup_questions, "answer": state['answer']}
+
+
+async def afollowup_node(state: MultiAgentState, prompt, model):
+    followup_chain = _followup_chain(prompt, model)
+    followup = await followup_chain.ainvoke(_followup_inputs(state))
+    followup_questions = followup.content.replace("\\n", "\n").split("\n")
+
+    return {'followup_questions': followup_questions, "answer": state['answer']}
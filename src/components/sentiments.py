@@ -1,20 +1,16 @@
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_groq import ChatGroq
 from langchain_core.output_parsers import StrOutputParser
-from langchain_openai import ChatOpenAI
 
 from logger import logger
+from utils.llm_registry import llm_registry
 
 
 def prob_sentiment_model(model_name, prompt):
-    if 'gpt' in model_name:
-        llm = ChatOpenAI(model_name=model_name)
-    else:
-        try:
-            llm = ChatGroq(model_name=model_name)
-        except:
-            llm = ChatGroq(model_name="llama-3.1-8b-instant")
-            logger.warning(f"Incorrect Sentiment Model name {model_name}, using 'llama-3.1-8b-instant'")
+    try:
+        llm = llm_registry.get(model_name)
+    except:
+        llm = llm_registry.get("llama-3.1-8b-instant")
+        logger.warning(f"Incorrect Sentiment Model name {model_name}, using 'llama-3.1-8b-instant'")
 
     system_prompt = (
         prompt
@@ -31,14 +27,11 @@ def prob_sentiment_model(model_name, prompt):
 
 
 def sentiment_model(model_name, prompt):
-    if 'gpt' in model_name:
-        llm = ChatOpenAI(model_name=model_name)
-    else:
-        try:
-            llm = ChatGroq(model_name=model_name)
-        except:
-            llm = ChatGroq(model_name="llama-3.1-8b-instant")
-            logger.warning(f"Incorrect Sentiment Model name {model_name}, using 'llama-3.1-8b-instant'")
+    try:
+        llm = llm_registry.get(model_name)
+    except:
+        llm = llm_registry.get("llama-3.1-8b-instant")
+        logger.warning(f"Incorrect Sentiment Model name {model_name}, using 'llama-3.1-8b-instant'")
 
     system_prompt = (
         prompt
@@ -16,6 +16,7 @@ class MultiAgentState(TypedDict):
     meta_summary: Document
     question_type: str
     documents: Annotated[List[str], add]
+    retrieved: bool
     answer: str 
     followup_questions: list[str]
 
@@ -2,7 +2,7 @@ from pathlib import Path
 
 from constants import CONFIG_FILE_PATH, PROMPTS_FILE_PATH
 from utils.common import read_yaml, create_directories
-from entity.config_entity import (EvaluationConfig, PrepareBaseModelConfig, TestIngestionConfig, BiasDetectionConfig)
+from entity.config_entity import (EvaluationConfig, PrepareBaseModelConfig, TestIngestionConfig, BiasDetectionConfig, DatabaseConfig, LLMConfig)
 
 
 class ConfigurationManager:
@@ -24,6 +24,47 @@ class ConfigurationManager:
             cache_dir=config.cache_dir,
             faiss_dir=config.faiss_dir,
             meta_dir=config.meta_dir,
+            embedding_model=config.embedding_model,
+            embedding_backend=config.embedding_backend,
+            onnx_dir=config.onnx_dir,
+            embedding_rebuild=config.embedding_rebuild,
+            vector_cache_max_bytes=config.vector_cache_max_bytes,
+            metadata_cache_entries=config.metadata_cache_entries,
+            query_embedding_cache_entries=config.query_embedding_cache_entries,
+            embedding_batch_window_ms=config.embedding_batch_window_ms,
+            embedding_batch_max_size=config.embedding_batch_max_size,
+            summary_cache_path=config.summary_cache_path,
+            embedding_store_path=config.embedding_store_path,
+            embedding_store_max_bytes=config.embedding_store_max_bytes,
+            cache_max_bytes=config.cache_max_bytes,
+            cache_ttl_seconds=config.cache_ttl_seconds,
+            cache_sweep_interval_seconds=config.cache_sweep_interval_seconds,
+            incremental_updates=config.incremental_updates,
+            tombstone_compact_ratio=config.tombstone_compact_ratio,
+            io_workers=config.io_workers,
+            cpu_workers=config.cpu_workers,
+            cpu_start_method=config.cpu_start_method,
+            prebuilt_manifest=config.prebuilt_manifest,
+            retrieval_backend=config.retrieval_backend,
+            catalog_dir=config.catalog_dir,
+            graph_topology=config.graph_topology,
+            async_nodes=config.async_nodes,
+            router=config.router,
+            router_model_path=config.router_model_path,
+            router_confidence_threshold=config.router_confidence_threshold,
+            router_log_path=config.router_log_path,
+            answer_cache_enabled=config.answer_cache_enabled,
+            answer_cache_entries=config.answer_cache_entries,
+            answer_cache_ttl_seconds=config.answer_cache_ttl_seconds,
+            answer_cache_threshold=config.answer_cache_threshold,
+            prefetch_mode=config.prefetch_mode,
+            prefetch_followups=config.prefetch_followups,
+            prefetch_max_concurrent=config.prefetch_max_concurrent,
+            prefetch_foreground_limit=config.prefetch_foreground_limit,
+            prefetch_ttl_seconds=config.prefetch_ttl_seconds,
+            prefetch_idle_seconds=config.prefetch_idle_seconds,
+            batch_max_queries=config.batch_max_queries,
+            batch_max_concurrency=config.batch_max_concurrency,
             supervisor_model=config.supervisor_model,
             metadata_model=config.metadata_model,
             base_model=config.base_model,
@@ -91,4 +132,31 @@ class ConfigurationManager:
             prompt_sentiment=self.prompts.SENTIMENT_PROMPT,
             prompt_prob_sentiment=self.prompts.SENTIMENT_PROBABILITY_PROMPT,
         )
-        return bias_detection_config
\ No newline at end of file
+        return bias_detection_config
+
+
+    def get_database_config(self) -> DatabaseConfig:
+        config = self.config.database
+
+        database_config = DatabaseConfig(
+            pool_size=config.pool_size,
+            max_overflow=config.max_overflow,
+            pool_pre_ping=config.pool_pre_ping,
+            pool_recycle_seconds=config.pool_recycle_seconds,
+            pool_timeout_seconds=config.pool_timeout_seconds,
+        )
+        return database_config
+
+
+    def get_llm_config(self) -> LLMConfig:
+        config = self.config.llm
+
+        llm_config = LLMConfig(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry_seconds=config.keepalive_expiry_seconds,
+            timeout_seconds=config.timeout_seconds,
+            connect_timeout_seconds=config.connect_timeout_seconds,
+            http2=config.http2,
+        )
+        return llm_config
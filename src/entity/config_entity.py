@@ -6,6 +6,47 @@ class PrepareBaseModelConfig:
     cache_dir: Path
     faiss_dir: Path
     meta_dir: Path
+    embedding_model: str
+    embedding_backend: str
+    onnx_dir: Path
+    embedding_rebuild: bool
+    vector_cache_max_bytes: int
+    metadata_cache_entries: int
+    query_embedding_cache_entries: int
+    embedding_batch_window_ms: float
+    embedding_batch_max_size: int
+    summary_cache_path: Path
+    embedding_store_path: Path
+    embedding_store_max_bytes: int
+    cache_max_bytes: int
+    cache_ttl_seconds: int
+    cache_sweep_interval_seconds: int
+    incremental_updates: bool
+    tombstone_compact_ratio: float
+    io_workers: int
+    cpu_workers: int
+    cpu_start_method: str
+    prebuilt_manifest: Path
+    retrieval_backend: str
+    catalog_dir: Path
+    graph_topology: str
+    async_nodes: bool
+    router: str
+    router_model_path: Path
+    router_confidence_threshold: float
+    router_log_path: Path
+    answer_cache_enabled: bool
+    answer_cache_entries: int
+    answer_cache_ttl_seconds: int
+    answer_cache_threshold: float
+    prefetch_mode: str
+    prefetch_followups: int
+    prefetch_max_concurrent: int
+    prefetch_foreground_limit: int
+    prefetch_ttl_seconds: int
+    prefetch_idle_seconds: int
+    batch_max_queries: int
+    batch_max_concurrency: int
     supervisor_model: str
     metadata_model: str
     base_model: str
@@ -42,4 +83,21 @@ class BiasDetectionConfig:
     embedding_model: str
     sentiment_model: str
     prompt_sentiment: str
-    prompt_prob_sentiment: str
\ No newline at end of file
+    prompt_prob_sentiment: str
+
+@dataclass(frozen=True)
+class DatabaseConfig:
+    pool_size: int
+    max_overflow: int
+    pool_pre_ping: bool
+    pool_recycle_seconds: int
+    pool_timeout_seconds: int
+
+@dataclass(frozen=True)
+class LLMConfig:
+    max_connections: int
+    max_keepalive_connections: int
+    keepalive_expiry_seconds: int
+    timeout_seconds: int
+    connect_timeout_seconds: int
+    http2: bool
@@ -1,20 +1,21 @@
 import os
 import json
-from sqlalchemy import text
 import torch
 import pandas as pd
 from pathlib import Path
 
 from typing import List, Dict
 from collections import Counter
-from langchain_huggingface import HuggingFaceEmbeddings
 
 from logger import logger
 from components.sentiments import sentiment_model, prob_sentiment_model
 from constants import SPARSE_DATA_PHRASES
 from entity.config_entity import BiasDetectionConfig
 from utils.common import save_json, make_serializable
-from utils.database import connect_with_db
+from utils.database import get_engine
+from utils.repository import fetch_reviews
+from utils.embeddings import embedding_registry, DEFAULT_EMBEDDING_MODEL
+from utils.query_embeddings import query_embedding_cache
 
 
 class BiasDetection:
@@ -24,10 +25,12 @@ class BiasDetection:
         self.evaluation_results = self.read_parquet(path=self.config.results_path)
 
         try:
-            self.embeddings = HuggingFaceEmbeddings(model_name=self.config.embedding_model)
+            self.embeddings = embedding_registry.get(self.config.embedding_model)
+            self.embedding_model = self.config.embedding_model
         except:
-            self.embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-            logger.warning(f"Incorrect Embedding Model name {self.config.embedding_model}, using 'all-MiniLM-L6-v2'")
+            self.embeddings = embedding_registry.get(DEFAULT_EMBEDDING_MODEL)
+            self.embedding_model = DEFAULT_EMBEDDING_MODEL
+            logger.warning(f"Incorrect Embedding Model name {self.config.embedding_model}, using '{DEFAULT_EMBEDDING_MODEL}'")
         
         self.sentiment_analyzer = sentiment_model(
             model_name=self.config.sentiment_model, 
@@ -46,26 +49,12 @@ class BiasDetection:
 
 
     def load_product_reviews(self, asin: str):
-        credentials = {
-            'INSTANCE_CONNECTION_NAME': os.getenv("INSTANCE_CONNECTION_NAME"),
-            'DB_USER': os.getenv("DB_USER"),
-            'DB_PASS': os.getenv("DB_PASS"),
-            'DB_NAME': os.getenv("DB_NAME")
-        }
-        self.engine = connect_with_db(credentials=credentials)
-
-        with self.engine.begin() as connection:
-            try:
-                # Fetch reviews
-                review_query = text(f"""
-                    SELECT parent_asin, asin, helpful_vote, timestamp, verified_purchase, title, text
-                    FROM userreviews ur 
-                    WHERE ur.parent_asin = '{asin}';
-                """)
-                review_result = connection.execute(review_query)
-                review_df = pd.DataFrame(review_result.fetchall(), columns=review_result.keys())
-            except Exception as e:
-                print("Exception: {}".format(e))
+        self.engine = get_engine()
+
+        try:
+            review_df = fetch_reviews(self.engine, asin)
+        except Exception as e:
+            print("Exception: {}".format(e))
 
         review_df["text"] = review_df.apply(lambda row: f"title: {row['title']}\ncontent: {row['text']}", axis=1)
 
@@ -108,7 +97,8 @@ class BiasDetection:
 
     def sparse_data_acknowledged(self, response: str) -> bool:
         response_embedding = self.embeddings.embed_query(response)
-        phrase_embeddings = [self.embeddings.embed_query(phrase) for phrase in SPARSE_DATA_PHRASES]
+        # The phrases are the same for every response, they are embedded once through the query cache
+        phrase_embeddings = [query_embedding_cache.embed(phrase, self.embedding_model) for phrase in SPARSE_DATA_PHRASES]
         similarities = torch.tensor([torch.cosine_similarity(torch.tensor(response_embedding), torch.tensor(embeddings), dim=0) for embeddings in phrase_embeddings])
 
         max_similarity = torch.max(similarities).item()
@@ -1,5 +1,6 @@
 from functools import partial
 
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import END, StateGraph, START
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph.state import CompiledStateGraph
@@ -16,33 +17,55 @@ class Graph:
         self.config = config
 
     
-    def create_graph(self, isMemory=False) -> CompiledStateGraph:
+    def node(self, func, afunc, **kwargs):
+        # Async runs (ainvoke, astream_events) use afunc, invoke keeps the sync function
+        if self.config.async_nodes:
+            return RunnableLambda(partial(func, **kwargs), afunc=partial(afunc, **kwargs))
+        return partial(func, **kwargs)
+
+
+    def create_graph(self, isMemory=False, followups=True) -> CompiledStateGraph:
         memory = MemorySaver()
         builder = StateGraph(MultiAgentState)
 
-        builder.add_node("Metadata", partial(agent.metadata_node, 
-                                             prompt=self.config.prompt_metadata, 
-                                             model=self.config.metadata_model))
-        builder.add_node("Review-Vectorstore", agent.retrieve)
-        builder.add_node("supervisor", partial(agent.supervisor_agent, 
-                                               prompt=self.config.prompt_supervisor, 
-                                               model=self.config.supervisor_model))
-        builder.add_node("generate", partial(node.final_llm_node,
-                                             prompt=self.config.prompt_base_model, 
-                                             model=self.config.base_model))
-        builder.add_node("final", partial(node.followup_node,
-                                         prompt=self.config.prompt_followup, 
-                                         model=self.config.followup_model))
-
-        for member in MEMBERS:
-            builder.add_edge(member, "supervisor")
-
-        builder.add_conditional_edges("supervisor", node.route_question, CONDITIONAL_MAP)
-
-        builder.add_edge(START, "Metadata")
-        builder.add_edge("Metadata", "supervisor")
-        builder.add_edge("generate", "final")
-        builder.add_edge("final", END)
+        builder.add_node("Metadata", self.node(agent.metadata_node, agent.ametadata_node,
+                                               prompt=self.config.prompt_metadata, 
+                                               model=self.config.metadata_model))
+        builder.add_node("Review-Vectorstore", self.node(agent.retrieve, agent.aretrieve,
+                                                         embedding_model=self.config.embedding_model,
+                                                         backend=self.config.retrieval_backend))
+        builder.add_node("generate", self.node(node.final_llm_node, node.afinal_llm_node,
+                                               prompt=self.config.prompt_base_model, 
+                                               model=self.config.base_model))
+        if followups:
+            builder.add_node("final", self.node(node.followup_node, node.afollowup_node,
+                                                prompt=self.config.prompt_followup, 
+                                                model=self.config.followup_model))
+
+        if self.config.graph_topology == "parallel":
+            # Metadata and retrieval don't depend on each other, run both and join before generate
+            builder.add_edge(START, "Metadata")
+            builder.add_edge(START, "Review-Vectorstore")
+            builder.add_edge(["Metadata", "Review-Vectorstore"], "generate")
+        else:
+            builder.add_node("supervisor", self.node(agent.supervisor_agent, agent.asupervisor_agent,
+                                                     prompt=self.config.prompt_supervisor, 
+                                                     model=self.config.supervisor_model))
+
+            for member in MEMBERS:
+                builder.add_edge(member, "supervisor")
+
+            builder.add_conditional_edges("supervisor", node.route_question, CONDITIONAL_MAP)
+
+            builder.add_edge(START, "Metadata")
+            builder.add_edge("Metadata", "supervisor")
+
+        if followups:
+            builder.add_edge("generate", "final")
+            builder.add_edge("final", END)
+        else:
+            # Answer-only graph, follow-up questions are not generated
+            builder.add_edge("generate", END)
 
         graph = builder.compile(checkpointer=memory) if isMemory else builder.compile()
         
@@ -0,0 +1,41 @@
+from pathlib import Path
+
+from logger import logger
+from components.agents import summarize_metadata
+from entity.config_entity import PrepareBaseModelConfig
+from utils.metadata_store import metadata_store
+from utils.prebuilt import PrebuiltIndexes
+from utils.summary_cache import summary_cache
+
+
+class MetadataSummaries:
+    """Fill the metadata summary cache ahead of traffic.
+
+    Covers the products cached by the API and the ones prebuilt by the data
+    pipeline, products with an up to date summary are skipped.
+    """
+
+    def __init__(self, config: PrepareBaseModelConfig):
+        self.config = config
+        summary_cache.configure(self.config.summary_cache_path)
+
+
+    def metadata_paths(self) -> list:
+        paths = {path.stem: path for path in Path(self.config.meta_dir).glob("[!.]*.parquet")}
+
+        prebuilt = PrebuiltIndexes(self.config.prebuilt_manifest, self.config.embedding_model)
+        for asin, artifact in prebuilt.products().items():
+            paths.setdefault(asin, artifact.metadata_path)
+
+        return list(paths.values())
+
+
+    def summarize(self):
+        paths = self.metadata_paths()
+        logger.info(f"Summarizing metadata of {len(paths)} products")
+
+        for path in paths:
+            record = metadata_store.load(path, self.config.prompt_metadata)
+            summarize_metadata(record, self.config.prompt_metadata, self.config.metadata_model)
+
+        logger.info(f"Metadata summaries: {summary_cache.stats()}")
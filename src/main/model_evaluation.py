@@ -14,22 +14,26 @@ from datasets import Dataset
 from urllib.parse import urlparse
 import pandas as pd
 from pathlib import Path
-from sqlalchemy import text
 from langgraph.graph.state import CompiledStateGraph
 from langfuse.callback import CallbackHandler
 from langchain_community.document_loaders import DataFrameLoader
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
 from urllib.parse import urlparse
 from entity.config_entity import EvaluationConfig, PrepareBaseModelConfig
 from utils.common import save_json, save_parquet
-from utils.database import connect_with_db
+from utils.database import get_engine
+from utils.repository import fetch_product_data
+from utils.embeddings import embedding_registry
+from utils.embedding_store import embedding_store
+from utils.index_builder import build_vector_store
+from utils.vector_cache import vector_store_cache
 
 
 class Evaluation:
     def __init__(self, config: EvaluationConfig, base_config: PrepareBaseModelConfig, graph: CompiledStateGraph):
         self.config = config
         self.base_config = base_config
+        embedding_registry.configure(base_config.embedding_backend, base_config.onnx_dir)
+        embedding_store.configure(base_config.embedding_store_path, base_config.embedding_store_max_bytes)
         self.app = graph
         self.vector_store_cache = []
         self.results = pd.DataFrame()
@@ -59,36 +63,12 @@ class Evaluation:
         return test_df[:30]
 
     def load_product_data(self, asin: str):
-        credentials = {
-            'INSTANCE_CONNECTION_NAME': os.getenv("INSTANCE_CONNECTION_NAME"),
-            'DB_USER': os.getenv("DB_USER"),
-            'DB_PASS': os.getenv("DB_PASS"),
-            'DB_NAME': os.getenv("DB_NAME")
-        }
-        self.engine = connect_with_db(credentials=credentials)
-
-        with self.engine.begin() as connection:
-            try:
-                # Fetch reviews
-                review_query = text(f"""
-                    SELECT parent_asin, asin, helpful_vote, timestamp, verified_purchase, title, text
-                    FROM userreviews ur 
-                    WHERE ur.parent_asin = '{asin}';
-                """)
-                review_result = connection.execute(review_query)
-                review_df = pd.DataFrame(review_result.fetchall(), columns=review_result.keys())
-                
-                # Fetch metadata
-                meta_query = text(f"""
-                    SELECT parent_asin, main_category, title, average_rating, rating_number, features, description, price, store, categories, details
-                    FROM metadata md 
-                    WHERE md.parent_asin = '{asin}';
-                """)
-                meta_result = connection.execute(meta_query)
-                meta_df = pd.DataFrame(meta_result.fetchall(), columns=meta_result.keys())
-                
-            except Exception as e:
-                print("Exception: {}".format(e))
+        self.engine = get_engine()
+
+        try:
+            review_df, meta_df = fetch_product_data(self.engine, asin)
+        except Exception as e:
+            print("Exception: {}".format(e))
 
         return review_df, meta_df
     
@@ -99,32 +79,32 @@ class Evaluation:
         loader = DataFrameLoader(review_df)
         review_docs = loader.load()
 
-        embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        vectordb = FAISS.from_documents(documents=review_docs, embedding=embeddings)
-        return vectordb
+        return build_vector_store(review_docs, self.base_config.embedding_model)
 
 
     def generate_response(self):
         test_df = self.load_test_data()
         
         for index, row in test_df.iterrows():
-            cache_key = f"{row['file_hash']}-{row['parent_asin']}"
-            
-            if cache_key not in self.vector_store_cache:
-                review_df, meta_df = self.load_product_data(row['parent_asin'])
+            asin = row['parent_asin']
+            session_id = f"{row['file_hash']}-{asin}"
+            retriever = Path(f"{self.base_config.faiss_dir}/{asin}")
+            meta_df = Path(f"{self.base_config.meta_dir}/{asin}.parquet")
+
+            # Review artifacts are product-scoped and shared by every test question of the product
+            if asin not in self.vector_store_cache:
+                review_df, product_meta_df = self.load_product_data(asin)
                 vector_db = self.create_vector_store(review_df)
-                vector_db.save_local(f"{self.base_config.faiss_dir}/{cache_key}")
-                meta_df.to_csv(f"{self.base_config.meta_dir}/{cache_key}.csv", index=False)
-                self.vector_store_cache.append(cache_key)
-
-            retriever = Path(f"{self.base_config.faiss_dir}/{cache_key}")
-            meta_df = Path(f"{self.base_config.meta_dir}/{cache_key}.csv")
+                vector_db.save_local(retriever)
+                vector_store_cache.invalidate(retriever)
+                product_meta_df.astype(str).to_parquet(meta_df, index=False)
+                self.vector_store_cache.append(asin)
 
             lang_config = {}
             run_id = str(uuid.uuid4())
             langfuse_handler = CallbackHandler(
                 user_id=f"Model-Evaluation-1",
-                session_id=f"{cache_key}"
+                session_id=session_id
             )
             lang_config.update({"callbacks": [langfuse_handler], "run_id": run_id})
 
@@ -0,0 +1,106 @@
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from logger import logger
+from components.agents import routing_engine, supervisor_agent
+from entity.config_entity import PrepareBaseModelConfig
+from utils.embeddings import embedding_registry
+from utils.router_model import CentroidRouterModel
+
+
+class RouterTraining:
+    """Train and evaluate the local supervisor router offline.
+
+    Training data are the first routing decisions (before retrieval) logged
+    by the LLM supervisor. Evaluation questions without a logged decision
+    are labelled by the LLM supervisor first, so a new deployment has data
+    to start from.
+    """
+
+    def __init__(self, config: PrepareBaseModelConfig, testset_path: Path):
+        self.config = config
+        self.testset_path = Path(testset_path)
+        embedding_registry.configure(config.embedding_backend, config.onnx_dir)
+        # Labelling must go through the LLM supervisor, never through a previous local model
+        routing_engine.configure("llm", config.router_model_path, config.router_confidence_threshold,
+                                 config.router_log_path, config.embedding_model)
+        self.metrics_path = Path(self.config.router_model_path).with_name("metrics.json")
+
+
+    def load_decisions(self) -> pd.DataFrame:
+        log_path = Path(self.config.router_log_path)
+        if not log_path.exists():
+            return pd.DataFrame(columns=["question", "datasource"])
+
+        decisions = pd.read_json(log_path, lines=True)
+        decisions = decisions[~decisions["has_documents"]]
+        return decisions.drop_duplicates("question", keep="last")[["question", "datasource"]]
+
+
+    def label_testset(self):
+        testsets = [pd.read_parquet(path, columns=["question"]) for path in self.testset_path.glob("*.parquet")]
+        if not testsets:
+            logger.warning(f"No evaluation testset found in {self.testset_path}, only logged decisions are used")
+            return
+        questions = pd.concat(testsets, ignore_index=True)["question"].drop_duplicates()
+        known = set(self.load_decisions()["question"])
+
+        new_questions = [question for question in questions if question not in known]
+        logger.info(f"Labelling {len(new_questions)} evaluation questions with the LLM supervisor")
+        for question in new_questions:
+            supervisor_agent({"question": question, "documents": []},
+                             prompt=self.config.prompt_supervisor, model=self.config.supervisor_model)
+
+
+    def embed(self, questions: list) -> np.ndarray:
+        embeddings = embedding_registry.get(self.config.embedding_model)
+        return np.asarray(embeddings.embed_documents(questions), dtype=np.float32)
+
+
+    def evaluate(self, model: CentroidRouterModel, questions: list, labels: list) -> dict:
+        metrics = model.evaluate(self.embed(questions), labels, self.config.router_confidence_threshold)
+
+        # Per-decision latency of the local route, embedding included, one question at a time
+        embeddings = embedding_registry.get(self.config.embedding_model)
+        start = time.perf_counter()
+        for question in questions:
+            model.predict(np.asarray(embeddings.embed_query(question), dtype=np.float32))
+        metrics["latency_avg_seconds"] = round((time.perf_counter() - start) / max(len(questions), 1), 6)
+        return metrics
+
+
+    def train(self, holdout: float = 0.2, seed: int = 42) -> dict:
+        decisions = self.load_decisions()
+        if decisions.empty:
+            logger.warning(f"No routing decisions in {self.config.router_log_path}, no router model trained")
+            return {}
+        if decisions["datasource"].nunique() < 2:
+            logger.warning(f"Router needs decisions for at least two routes, found {decisions['datasource'].unique()}")
+
+        decisions = decisions.sample(frac=1.0, random_state=seed)
+        # At least one decision to fit on, the holdout may be empty for a tiny log
+        split = max(int(len(decisions) * (1 - holdout)), 1)
+        train, test = decisions.iloc[:split], decisions.iloc[split:]
+
+        model = CentroidRouterModel.fit(self.embed(train["question"].tolist()), train["datasource"].tolist(),
+                                        self.config.embedding_model)
+        metrics = {
+            "train_samples": len(train),
+            "routes": decisions["datasource"].value_counts().to_dict(),
+            "threshold": self.config.router_confidence_threshold,
+            "holdout": self.evaluate(model, test["question"].tolist(), test["datasource"].tolist()),
+        }
+
+        # The served model is fitted on every logged decision
+        model = CentroidRouterModel.fit(self.embed(decisions["question"].tolist()),
+                                        decisions["datasource"].tolist(), self.config.embedding_model)
+        model.save(self.config.router_model_path)
+
+        with open(self.metrics_path, "w") as f:
+            json.dump(metrics, f, indent=2)
+        logger.info(f"Router model saved to {self.config.router_model_path}: {metrics}")
+        return metrics
@@ -7,13 +7,14 @@ from ragas.testset import TestsetGenerator
 
 import pandas as pd
 from pathlib import Path
-from sqlalchemy import text
 from langchain_community.document_loaders import DataFrameLoader
-from langchain_groq import ChatGroq
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_openai import OpenAIEmbeddings
 from entity.config_entity import TestIngestionConfig
 from utils.common import save_json, save_parquet
-from utils.database import connect_with_db
+from utils.database import get_engine
+from utils.repository import fetch_product_data
+from utils.metadata_store import ProductMetadata
+from utils.llm_registry import llm_registry
 from langchain.schema import Document
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
@@ -27,61 +28,20 @@ class TestIngestion:
 
 
     def load_product_data(self, asin: str):
-        credentials = {
-            'INSTANCE_CONNECTION_NAME': os.getenv("INSTANCE_CONNECTION_NAME"),
-            'DB_USER': os.getenv("DB_USER"),
-            'DB_PASS': os.getenv("DB_PASS"),
-            'DB_NAME': os.getenv("DB_NAME")
-        }
-        self.engine = connect_with_db(credentials=credentials)
-
-        with self.engine.begin() as connection:
-            try:
-                # Fetch reviews
-                review_query = text(f"""
-                    SELECT parent_asin, asin, helpful_vote, timestamp, verified_purchase, title, text
-                    FROM userreviews ur 
-                    WHERE ur.parent_asin = '{asin}';
-                """)
-                review_result = connection.execute(review_query)
-                review_df = pd.DataFrame(review_result.fetchall(), columns=review_result.keys())
-                
-                # Fetch metadata
-                meta_query = text(f"""
-                    SELECT parent_asin, main_category, title, average_rating, rating_number, features, description, price, store, categories, details
-                    FROM metadata md 
-                    WHERE md.parent_asin = '{asin}';
-                """)
-                meta_result = connection.execute(meta_query)
-                meta_df = pd.DataFrame(meta_result.fetchall(), columns=meta_result.keys())
-                
-            except Exception as e:
-                logger.error(f"Unable to load data for asin {asin} Exception: {e}")
+        self.engine = get_engine()
+
+        try:
+            review_df, meta_df = fetch_product_data(self.engine, asin)
+        except Exception as e:
+            logger.error(f"Unable to load data for asin {asin} Exception: {e}")
 
         return review_df, meta_df
     
     def generate_meta_summary(self, meta_df, prompt):
-        meta_llm = ChatGroq(model_name="llama-3.1-8b-instant")
-
-        modified_details = meta_df['details'].astype(str).str.replace('{', '[')
-        
-        # Answer question
-        meta_system_prompt =( 
-            prompt.format(
-                main_category=(meta_df.at[0, 'main_category']),
-                title=(meta_df.at[0, 'title']),
-                average_rating=(meta_df.at[0, 'average_rating']),
-                rating_number=(meta_df.at[0, 'rating_number']),
-                features=(meta_df.at[0, 'features']),
-                description=(meta_df.at[0, 'description']),
-                price=(meta_df.at[0, 'price']),
-                store=(meta_df.at[0, 'store']),
-                categories=(meta_df.at[0, 'categories']),
-                details=(modified_details.at[0]),
-            )
-        )
+        meta_llm = llm_registry.get("llama-3.1-8b-instant")
 
-        meta_system_prompt = meta_system_prompt.replace('{', '{{').replace('}', '}}')
+        # Same rendering as the metadata node
+        meta_system_prompt = ProductMetadata.from_frame(meta_df, prompt).prompt
 
         meta_qa_prompt = ChatPromptTemplate.from_messages(
                         [
@@ -111,8 +71,8 @@ class TestIngestion:
 
     def get_ragas_testset(self, doc, with_debugging_logs=False):    
         # generator with openai models
-        generator_llm = ChatOpenAI(model="gpt-4o-mini")
-        critic_llm = ChatOpenAI(model="gpt-4o")
+        generator_llm = llm_registry.get("gpt-4o-mini")
+        critic_llm = llm_registry.get("gpt-4o")
         embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
 
         generator = TestsetGenerator.from_langchain(
@@ -1,29 +1,55 @@
 import os
 import json
 import uuid
+import shutil
 import pandas as pd
 from pandas import DataFrame
 from pathlib import Path
-from datetime import datetime
-from sqlalchemy import text
+from typing import Optional
+from collections import Counter, defaultdict
 
 from langfuse import Langfuse
 from fastapi.responses import JSONResponse
 from langchain_community.document_loaders import DataFrameLoader
-from langchain_huggingface import HuggingFaceEmbeddings
 from fastapi import HTTPException
-from langchain_community.vectorstores import FAISS
 
 from pydantic_models.models import scoreTrace
-from utils.database import connect_with_db
+from utils.repository import product_repository
+from utils.executor import execution_layer
+from utils.index_builder import build_index, embed_reviews
+from utils.incremental_index import document_key, load_state, update_index
+from utils.catalog_index import get_catalog_index
+from utils.cache_manager import DiskCacheManager
+from utils.prebuilt import PrebuiltIndexes
+from utils.single_flight import SingleFlight
 from entity.config_entity import PrepareBaseModelConfig
 from logger import logger
 
 class Generate:
     def __init__(self, config: PrepareBaseModelConfig):
         self.config = config
-        self.vector_store_cache = []
-        self.cache_creation_times = {}
+        # Artifacts are shared per product: track which users use them and how many runs hold them
+        self.product_users = defaultdict(set)
+        self.product_refs = Counter()
+        self.index_builds = 0
+        self.index_updates = 0
+        self.reviews_added = 0
+        self.reviews_deleted = 0
+        self.index_compactions = 0
+        self.prebuilt_loads = 0
+        self.single_flight = SingleFlight()
+        self.cache_manager = DiskCacheManager(
+            faiss_dir=self.config.faiss_dir,
+            meta_dir=self.config.meta_dir,
+            max_bytes=self.config.cache_max_bytes,
+            ttl_seconds=self.config.cache_ttl_seconds,
+            sweep_interval_seconds=self.config.cache_sweep_interval_seconds,
+            in_use=self.in_use,
+            keep_expired=self.config.incremental_updates,
+        )
+        self.prebuilt = PrebuiltIndexes(self.config.prebuilt_manifest, self.config.embedding_model)
+        self.catalog_index = (get_catalog_index(self.config.catalog_dir)
+                              if self.config.retrieval_backend == "catalog" else None)
         self.langfuse = Langfuse()
 
 
@@ -41,81 +67,286 @@ class Generate:
         return test_df
 
     async def load_product_data(self, asin: str):
-        credentials = {
-            'INSTANCE_CONNECTION_NAME': os.getenv("INSTANCE_CONNECTION_NAME"),
-            'DB_USER': os.getenv("DB_USER"),
-            'DB_PASS': os.getenv("DB_PASS"),
-            'DB_NAME': os.getenv("DB_NAME")
-        }
-        self.engine = connect_with_db(credentials=credentials)
-
-        with self.engine.begin() as connection:
-            try:
-                # Log start of data fetching
-                logger.info(f"Loading product data for ASIN: {asin}")
-
-                # Fetch reviews
-                review_query = text(f"""
-                    SELECT parent_asin, asin, helpful_vote, timestamp, verified_purchase, title, text
-                    FROM userreviews ur 
-                    WHERE ur.parent_asin = '{asin}';
-                """)
-                review_result = connection.execute(review_query)
-                review_df = pd.DataFrame(review_result.fetchall(), columns=review_result.keys())
-                logger.info("Fetched review data")
-
-                # Fetch metadata
-                meta_query = text(f"""
-                    SELECT parent_asin, main_category, title, average_rating, rating_number, features, description, price, store, categories, details
-                    FROM metadata md 
-                    WHERE md.parent_asin = '{asin}';
-                """)
-                meta_result = connection.execute(meta_query)
-                meta_df = pd.DataFrame(meta_result.fetchall(), columns=meta_result.keys())
-                logger.info("Fetched metadata")
-
-            except Exception as e:
-                logger.error(f"Error loading data for ASIN: {asin} - {e}")
-                raise HTTPException(status_code=500, detail="Error loading data")
+        try:
+            # Log start of data fetching
+            logger.info(f"Loading product data for ASIN: {asin}")
+            review_df, meta_df = await product_repository.fetch_product_data(asin)
+            logger.info(f"Fetched {len(review_df)} reviews and metadata")
+
+        except Exception as e:
+            logger.error(f"Error loading data for ASIN: {asin} - {e}")
+            raise HTTPException(status_code=500, detail="Error loading data")
 
         return review_df, meta_df
 
 
-    def create_vector_store(self, review_df: DataFrame):
-        logger.info("Creating vector store from review data")
+    async def load_product_delta(self, asin: str, watermark: Optional[str]):
+        try:
+            logger.info(f"Loading reviews since {watermark} for ASIN: {asin}")
+            review_df, live_keys, meta_df = await product_repository.fetch_product_delta(asin, watermark)
+            logger.info(f"Fetched {len(review_df)} reviews since the watermark, {len(live_keys)} reviews in total")
+
+        except Exception as e:
+            logger.error(f"Error loading review delta for ASIN: {asin} - {e}")
+            raise HTTPException(status_code=500, detail="Error loading data")
+
+        return review_df, live_keys, meta_df
+
+
+    def load_review_docs(self, review_df: DataFrame):
         review_df = review_df[review_df['text'].notna()]
         loader = DataFrameLoader(review_df)
-        review_docs = loader.load()
+        return loader.load()
+
 
-        embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        vectordb = FAISS.from_documents(documents=review_docs, embedding=embeddings)
+    async def create_vector_store(self, review_df: DataFrame, path: Path):
+        logger.info("Creating vector store from review data")
+        review_docs = self.load_review_docs(review_df)
+
+        # Embedding is CPU bound, the index is built in a worker process and saved at path
+        await execution_layer.run_cpu(build_index, review_docs, path, self.config.embedding_model)
         logger.info("Vector store created successfully")
-        return vectordb
 
 
-    async def initialize(self, asin: str, user_id: str, returnPath=False):
-        cache_key = f"{user_id}-{asin}"
-        retriever_path = Path(f"{self.config.faiss_dir}/{cache_key}")
-        metadata_path = Path(f"{self.config.meta_dir}/{cache_key}.csv")
+    def product_paths(self, asin: str):
+        if self.catalog_index is not None:
+            return Path(self.config.catalog_dir) / asin, self.cache_manager.metadata_path(asin)
+        return self.cache_manager.index_path(asin), self.cache_manager.metadata_path(asin)
+
+
+    def is_cached(self, asin: str) -> bool:
+        if self.catalog_index is not None:
+            # An expired partition keeps serving until initialize has re-added the product
+            return (self.catalog_index.contains(asin)
+                    and not self.catalog_index.expired(asin, self.config.cache_ttl_seconds)
+                    and self.cache_manager.metadata_path(asin).exists())
+        return self.cache_manager.contains(asin)
+
+
+    def retriever_ready(self, asin: str) -> bool:
+        if self.catalog_index is not None:
+            return self.catalog_index.contains(asin)
+        return self.cache_manager.index_path(asin).exists()
+
+
+    def review_version(self, asin: str):
+        """Identifies the review set currently served for a product, None when it isn't built."""
+        if self.catalog_index is not None:
+            return self.catalog_index.partition_version(asin)
+        # Every build is published to a fresh version directory behind the index symlink
+        index_path = self.cache_manager.index_path(asin)
+        return Path(os.path.realpath(index_path)).name if index_path.exists() else None
+
+
+    def install_prebuilt(self, asin: str) -> bool:
+        """Copy the offline-built index of a product into the cache, if there is one."""
+        artifact = self.prebuilt.get(asin)
+        if artifact is None:
+            return False
+
+        version_path = self.cache_manager.new_version_path(asin)
+        shutil.copytree(artifact.index_path, version_path)
+        meta_df = pd.read_parquet(artifact.metadata_path)
+        self.cache_manager.publish(asin, version_path, meta_df)
+        self.prebuilt_loads += 1
+        logger.info(f"Retriever for ASIN: {asin} loaded from prebuilt version {artifact.version}")
+        return True
+
+
+    async def update_product(self, asin: str) -> bool:
+        """Bring an index already on disk up to date, embedding only the reviews added since it was built.
+
+        Returns False when there is no index, or it was built before its
+        watermark was tracked, and a full build is needed.
+        """
+        index_path = self.cache_manager.index_path(asin)
+        state = await execution_layer.run_io(load_state, index_path) if index_path.exists() else None
+        if state is None:
+            return False
+
+        review_df, live_keys, meta_df = await self.load_product_delta(asin, state["watermark"])
+        review_docs = [doc for doc in self.load_review_docs(review_df) if document_key(doc) not in state["keys"]]
+        deleted = set(state["keys"]).difference(live_keys)
+
+        if review_docs or deleted:
+            version_path = self.cache_manager.new_version_path(asin)
+            result = await execution_layer.run_cpu(update_index, index_path, version_path, review_docs, live_keys,
+                                                   self.config.embedding_model, self.config.tombstone_compact_ratio)
+            await execution_layer.run_io(self.cache_manager.publish, asin, version_path, meta_df)
+            self.reviews_added += result["added"]
+            self.reviews_deleted += result["deleted"]
+            self.index_compactions += int(result["compacted"])
+        else:
+            # Nothing changed, the served index and its version stay as they are
+            await execution_layer.run_io(self.cache_manager.publish_metadata, asin, meta_df)
+            self.cache_manager.renew(asin)
+
+        self.index_updates += 1
+        logger.info(f"Retriever for ASIN: {asin} updated, {len(review_docs)} new and {len(deleted)} deleted reviews")
+        return True
+
+
+    async def build_product(self, asin: str):
+        # An index on disk is brought up to date with the reviews added or removed since it was built
+        if self.config.incremental_updates and await self.update_product(asin):
+            return
+
+        # Most products are prebuilt by the data pipeline, only misses are embedded on demand
+        if await execution_layer.run_io(self.install_prebuilt, asin):
+            return
+
+        review_df, meta_df = await self.load_product_data(asin)
+        version_path = self.cache_manager.new_version_path(asin)
+        await self.create_vector_store(review_df, version_path)
+
+        # saving cache
+        await execution_layer.run_io(self.cache_manager.publish, asin, version_path, meta_df)
+        self.index_builds += 1
+        logger.info(f"Retriever initialized and cached for ASIN: {asin}")
 
-        if cache_key not in self.vector_store_cache:
-            review_df, meta_df = await self.load_product_data(asin)
-            vector_db = self.create_vector_store(review_df)
 
-            # saving cache
-            self.save_db(retriever_path, vector_db)
-            self.save_csv(metadata_path, meta_df)
+    async def build_catalog_product(self, asin: str):
+        review_df, meta_df = await self.load_product_data(asin)
+        review_docs = self.load_review_docs(review_df)
 
-            self.vector_store_cache.append(cache_key)
-            self.cache_creation_times[cache_key] = datetime.now()
-            logger.info(f"Retriever initialized and cached for ASIN: {asin} and User ID: {user_id}")
+        texts = [doc.page_content for doc in review_docs]
+        vectors = await execution_layer.run_cpu(embed_reviews, texts, self.config.embedding_model)
+        await execution_layer.run_io(self.catalog_index.add, asin, vectors, review_docs)
+        await execution_layer.run_io(self.cache_manager.publish_metadata, asin, meta_df)
+        self.index_builds += 1
+        logger.info(f"Product {asin} added to the catalog index")
+
+
+    async def initialize(self, asin: str, user_id: str, returnPath=False):
+        retriever_path, metadata_path = self.product_paths(asin)
+
+        if not self.is_cached(asin):
+            build = self.build_catalog_product if self.catalog_index is not None else self.build_product
+            # Concurrent requests for the same product wait on the first build
+            await self.single_flight.do(asin, build, asin)
         else:
-            logger.info(f"Retriever for ASIN: {asin} and User ID: {user_id} already cached")
+            logger.info(f"Retriever for ASIN: {asin} already cached")
+
+        self.product_users[asin].add(str(user_id))
 
         if returnPath:
             return retriever_path, metadata_path
 
 
+    def acquire(self, asin: str):
+        """Mark the product artifacts as in use by a running graph."""
+        self.product_refs[asin] += 1
+
+
+    def release(self, asin: str):
+        self.product_refs[asin] -= 1
+        if self.product_refs[asin] <= 0:
+            del self.product_refs[asin]
+
+
+    def in_use(self, asin: str) -> bool:
+        return self.product_refs[asin] > 0
+
+
+    def migrate_user_cache(self):
+        """Move legacy `<user_id>-<asin>` artifacts to the product-scoped layout.
+
+        The most recently written copy of each product is kept, the other
+        per-user copies are removed. CSV metadata is converted to Parquet.
+        """
+        faiss_dir, meta_dir = Path(self.config.faiss_dir), Path(self.config.meta_dir)
+        # A fresh container has no cache directory yet, so there is nothing to migrate
+        legacy_dirs = sorted(
+            (path for path in (faiss_dir.iterdir() if faiss_dir.exists() else ())
+             if path.is_dir() and "-" in path.name and not path.name.startswith(".")),
+            key=lambda path: path.stat().st_mtime,
+            reverse=True,
+        )
+
+        for legacy_dir in legacy_dirs:
+            legacy_key = legacy_dir.name
+            asin = legacy_key.rsplit("-", 1)[1]
+            retriever_path, metadata_path = self.product_paths(asin)
+            legacy_meta = meta_dir / f"{legacy_key}.csv"
+
+            if not retriever_path.exists() and legacy_meta.exists():
+                os.replace(legacy_dir, retriever_path)
+                self.cache_manager.publish_metadata(asin, pd.read_csv(legacy_meta))
+                os.remove(legacy_meta)
+                logger.info(f"Migrated cache {legacy_key} to product cache {asin}")
+            else:
+                shutil.rmtree(legacy_dir, ignore_errors=True)
+                if legacy_meta.exists():
+                    os.remove(legacy_meta)
+                logger.info(f"Removed duplicate user cache {legacy_key}")
+
+        for legacy_meta in meta_dir.glob("[!.]*-*.csv"):
+            os.remove(legacy_meta)
+
+        # Product metadata written before the switch to Parquet
+        for legacy_meta in meta_dir.glob("[!.]*.csv"):
+            self.cache_manager.publish_metadata(legacy_meta.stem, pd.read_csv(legacy_meta))
+            os.remove(legacy_meta)
+
+        # Product artifacts already on disk can be served without a rebuild
+        self.cache_manager.scan()
+
+
+    def check_embeddings(self, dimension: int):
+        """Compare the served embeddings with the ones the cached indexes were built with.
+
+        Indexes built with another model or dimension cannot be searched:
+        with `embedding_rebuild` they are dropped and rebuilt on demand,
+        otherwise startup fails. Indexes from the other backend of the same
+        model are kept, unless `embedding_rebuild` is set.
+        """
+        signature_path = Path(self.config.cache_dir) / "embeddings.json"
+        current = {
+            "embedding_model": self.config.embedding_model,
+            "backend": self.config.embedding_backend,
+            "dimension": dimension,
+        }
+        # Caches written before the signature was recorded were built by the torch backend
+        previous = dict(current, backend="torch")
+        if signature_path.exists():
+            with open(signature_path, "r") as f:
+                previous = json.load(f)
+
+        if previous != current:
+            compatible = (previous["embedding_model"] == current["embedding_model"]
+                          and previous["dimension"] == current["dimension"])
+            if not compatible and not self.config.embedding_rebuild:
+                raise RuntimeError(f"Cached indexes were built with {previous}, the API embeds with {current}. "
+                                   f"Set embedding_rebuild: true to rebuild them")
+            if self.config.embedding_rebuild:
+                logger.warning(f"Embeddings changed from {previous} to {current}, dropping cached indexes")
+                self.cache_manager.clear()
+                if self.catalog_index is not None:
+                    self.catalog_index.clear()
+            else:
+                logger.info(f"Keeping indexes built with {previous}, compatible with {current}")
+
+        with open(signature_path, "w") as f:
+            json.dump(current, f)
+
+
+    def stats(self) -> dict:
+        return {
+            "cached_products": self.cache_manager.stats()["entries"],
+            "index_builds": self.index_builds,
+            "index_updates": self.index_updates,
+            "reviews_added": self.reviews_added,
+            "reviews_deleted": self.reviews_deleted,
+            "index_compactions": self.index_compactions,
+            "prebuilt_loads": self.prebuilt_loads,
+            "prebuilt": self.prebuilt.stats(),
+            "users": sum(len(users) for users in self.product_users.values()),
+            "in_use": dict(self.product_refs),
+            "builds": self.single_flight.stats(),
+            "catalog": self.catalog_index.stats() if self.catalog_index is not None else None,
+        }
+
+
     async def score_feedback(self, score: scoreTrace):
         trace_id = score.run_id
         user_id = score.user_id
@@ -134,15 +365,3 @@ class Generate:
         logger.info(f"Feedback Successful, 'trace_id': {trace_id}, 'id': {id}")
         
         return JSONResponse(content={"status": "Feedback Successful", "trace_id": trace_id}, status_code=200)
-
-
-    @staticmethod
-    def save_db(path: Path, vector_db):
-        vector_db.save_local(path)
-        logger.info(f"VectorDB saved at: {path}")
-
-
-    @staticmethod
-    def save_csv(path: Path, data: DataFrame):
-        data.to_csv(path, index=False)
-        logger.info(f"Metadata saved at: {path}")
\ No newline at end of file
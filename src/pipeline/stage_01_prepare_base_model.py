@@ -23,11 +23,11 @@ class PrepareBaseTrainingPipeline:
     def __init__(self):
         pass
 
-    def graph(self, isMemory=False) -> CompiledStateGraph:
+    def graph(self, isMemory=False, followups=True) -> CompiledStateGraph:
         config = ConfigurationManager()
         prepare_base_model_config = config.get_prepare_base_model_config()
         prepare_base_model = Graph(config=prepare_base_model_config)
-        app = prepare_base_model.create_graph(isMemory=isMemory)
+        app = prepare_base_model.create_graph(isMemory=isMemory, followups=followups)
         return app
 
 
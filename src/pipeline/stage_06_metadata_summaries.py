@@ -0,0 +1,36 @@
+import os
+
+from logger import logger
+from main.metadata_summaries import MetadataSummaries
+from config.configuration import ConfigurationManager
+
+from dotenv import load_dotenv
+load_dotenv()
+
+## load the API Keys
+os.environ['OPENAI_API_KEY']=os.getenv("OPENAI_API_KEY")
+os.environ['GROQ_API_KEY']=os.getenv("GROQ_API_KEY")
+
+
+STAGE_NAME = "Metadata Summaries"
+
+class MetadataSummariesPipeline:
+    def __init__(self):
+        pass
+
+    def summarize(self):
+        config = ConfigurationManager()
+        prepare_base_model_config = config.get_prepare_base_model_config()
+        summaries = MetadataSummaries(config=prepare_base_model_config)
+        summaries.summarize()
+
+
+if __name__ == "__main__":
+    try:
+        logger.info(f">>>>>> stage {STAGE_NAME} started <<<<<<")
+        metadata_summaries = MetadataSummariesPipeline()
+        metadata_summaries.summarize()
+        logger.info(f">>>>>> stage {STAGE_NAME} completed <<<<<<\n\n")
+    except Exception as e:
+        logger.exception(e)
+        raise e
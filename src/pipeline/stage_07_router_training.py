@@ -0,0 +1,39 @@
+import os
+
+from logger import logger
+from main.router_training import RouterTraining
+from config.configuration import ConfigurationManager
+
+from dotenv import load_dotenv
+load_dotenv()
+
+## load the API Keys
+os.environ['OPENAI_API_KEY']=os.getenv("OPENAI_API_KEY")
+os.environ['GROQ_API_KEY']=os.getenv("GROQ_API_KEY")
+
+
+STAGE_NAME = "Router Training"
+
+class RouterTrainingPipeline:
+    def __init__(self):
+        pass
+
+    def train(self):
+        config = ConfigurationManager()
+        prepare_base_model_config = config.get_prepare_base_model_config()
+        test_ingestion_config = config.get_test_ingestion_config()
+        router_training = RouterTraining(config=prepare_base_model_config,
+                                         testset_path=test_ingestion_config.testset_path)
+        router_training.label_testset()
+        router_training.train()
+
+
+if __name__ == "__main__":
+    try:
+        logger.info(f">>>>>> stage {STAGE_NAME} started <<<<<<")
+        router_training = RouterTrainingPipeline()
+        router_training.train()
+        logger.info(f">>>>>> stage {STAGE_NAME} completed <<<<<<\n\n")
+    except Exception as e:
+        logger.exception(e)
+        raise e
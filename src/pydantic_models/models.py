@@ -1,3 +1,5 @@
+from typing import List
+
 from pydantic import BaseModel
 
 class Payload(BaseModel):
@@ -6,6 +8,17 @@ class Payload(BaseModel):
     user_id: str
     log_langfuse: bool
     stream_tokens: bool
+    skip_followups: bool = False
+
+class BatchQuery(BaseModel):
+    query: str
+    parent_asin: str
+
+class BatchPayload(BaseModel):
+    user_id: str
+    queries: List[BatchQuery]
+    log_langfuse: bool = False
+    skip_followups: bool = False
 
 class scoreTrace(BaseModel):
     run_id: str
@@ -1,7 +1,11 @@
+import asyncio
 import json
 import os
+import re
+import time
 import uuid
 from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Any
 
@@ -15,9 +19,24 @@ from langfuse.callback import CallbackHandler
 
 from logger import logger
 from config.configuration import ConfigurationManager
+from components.agents import aretrieve, retrieve_many, routing_engine
 from pipeline.generation import Generate
 from pipeline.stage_01_prepare_base_model import PrepareBaseTrainingPipeline
-from pydantic_models.models import Payload, scoreTrace
+from pydantic_models.models import BatchPayload, Payload, scoreTrace
+from utils.database import dispose_engine, pool_stats
+from utils.embeddings import embedding_registry
+from utils.executor import execution_layer
+from utils.repository import product_repository
+from utils.index_builder import embed_documents, init_worker
+from utils.vector_cache import vector_store_cache
+from utils.metadata_store import metadata_store
+from utils.summary_cache import summary_cache
+from utils.embedding_store import embedding_store
+from utils.llm_registry import llm_registry
+from utils.answer_cache import CachedAnswer, answer_cache
+from utils.query_embeddings import query_embedding_cache
+from utils.embedding_batcher import embedding_batcher
+from utils.prefetch import PrefetchedRetriever, prefetcher
 
 load_dotenv()
 
@@ -64,15 +83,89 @@ class ClientApp:
     def __init__(self):
         config = ConfigurationManager()
         prepare_base_model_config = config.get_prepare_base_model_config()
+        llm_registry.configure(config.get_llm_config())
+        embedding_registry.configure(prepare_base_model_config.embedding_backend, prepare_base_model_config.onnx_dir)
+        self.config = prepare_base_model_config
         self.generate = Generate(config=prepare_base_model_config)
+        vector_store_cache.configure(max_bytes=prepare_base_model_config.vector_cache_max_bytes)
+        metadata_store.configure(max_entries=prepare_base_model_config.metadata_cache_entries)
+        query_embedding_cache.configure(capacity=prepare_base_model_config.query_embedding_cache_entries)
+        embedding_batcher.configure(
+            window_ms=prepare_base_model_config.embedding_batch_window_ms,
+            max_batch=prepare_base_model_config.embedding_batch_max_size,
+        )
+        summary_cache.configure(prepare_base_model_config.summary_cache_path)
+        embedding_store.configure(prepare_base_model_config.embedding_store_path,
+                                  prepare_base_model_config.embedding_store_max_bytes)
+        answer_cache.configure(
+            max_entries=prepare_base_model_config.answer_cache_entries,
+            ttl_seconds=prepare_base_model_config.answer_cache_ttl_seconds,
+            threshold=prepare_base_model_config.answer_cache_threshold,
+            embedding_model=prepare_base_model_config.embedding_model,
+        )
+        routing_engine.configure(
+            router=prepare_base_model_config.router,
+            model_path=prepare_base_model_config.router_model_path,
+            threshold=prepare_base_model_config.router_confidence_threshold,
+            log_path=prepare_base_model_config.router_log_path,
+            embedding_model=prepare_base_model_config.embedding_model,
+        )
+        prefetcher.configure(
+            mode=prepare_base_model_config.prefetch_mode,
+            followups=prepare_base_model_config.prefetch_followups,
+            max_concurrent=prepare_base_model_config.prefetch_max_concurrent,
+            foreground_limit=prepare_base_model_config.prefetch_foreground_limit,
+            ttl_seconds=prepare_base_model_config.prefetch_ttl_seconds,
+            idle_seconds=prepare_base_model_config.prefetch_idle_seconds,
+        )
+        execution_layer.configure(
+            io_workers=prepare_base_model_config.io_workers,
+            cpu_workers=prepare_base_model_config.cpu_workers,
+            start_method=prepare_base_model_config.cpu_start_method,
+            initializer=init_worker,
+            initargs=(prepare_base_model_config.embedding_model, prepare_base_model_config.embedding_backend,
+                      prepare_base_model_config.onnx_dir, prepare_base_model_config.embedding_store_path,
+                      prepare_base_model_config.embedding_store_max_bytes),
+        )
 
         prepare_base = PrepareBaseTrainingPipeline()
         self.app = prepare_base.graph()
+        # Same workflow ending after generate, for requests that skip follow-up questions
+        self.answer_app = prepare_base.graph(followups=False)
 
 
 clapp = ClientApp()
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the shared embedding model once and warm it before serving traffic
+    embedding_registry.warmup([clapp.config.embedding_model])
+    clapp.generate.migrate_user_cache()
+    clapp.generate.check_embeddings(embedding_registry.dimension(clapp.config.embedding_model))
+    clapp.generate.prebuilt.refresh()
+
+    # Background task evicting expired and over-budget cache entries
+    cache_task = asyncio.create_task(clapp.generate.cache_manager.run_sweeper())
+    prefetch_task = asyncio.create_task(prefetcher.run_sweeper())
+    try:
+        yield
+    finally:
+        prefetcher.cancel_all()
+        for task in (cache_task, prefetch_task):
+            task.cancel()
+            try:
+                await task  # Wait for the task to be cancelled
+            except asyncio.CancelledError:
+                pass
+        execution_layer.shutdown()
+        await llm_registry.aclose()
+        await product_repository.close()
+        dispose_engine()
+
+app.router.lifespan_context = lifespan
+
+
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     # Start time
@@ -96,50 +189,32 @@ async def log_requests(request: Request, call_next):
     return response
 
 
-# Define a background task to delete cache files older than 1 hour
-# async def clear_outdated_cache():
-#     while True:
-#         current_time = datetime.utcnow()
-#         for cache_key, creation_time in list(cache_creation_times.items()):
-#             if (current_time - creation_time) > timedelta(hour=1):
-#                 try:
-#                     # Remove cache files
-#                     if os.path.exists(f"{faiss_dir}/{cache_key}") and os.path.isdir(f"{faiss_dir}/{cache_key}"):
-#                         shutil.rmtree(f"{faiss_dir}/{cache_key}")
-#                     if os.path.exists(f"{meta_dir}/{cache_key}.csv") and os.path.isfile(f"{meta_dir}/{cache_key}.csv"):
-#                         os.remove(f"{meta_dir}/{cache_key}.csv")
-
-#                     # Remove from cache tracking
-#                     vector_store_cache.remove(cache_key)
-#                     del cache_creation_times[cache_key]
-
-#                     logger.info(f"Cache automatically cleared for {cache_key}")
-#                 except Exception as e:
-#                     logger.error(f"Error clearing cache for {cache_key}: {e}")
-
-#         # Wait an hour before the next check
-#         await asyncio.sleep(3600)
-
-
-# # Use lifespan to manage startup and shutdown events
-# @asynccontextmanager
-# async def lifespan(app: FastAPI):
-#     # Startup tasks
-#     cache_task = asyncio.create_task(clear_outdated_cache())
-#     try:
-#         yield
-#     finally:
-#         cache_task.cancel()
-#         await cache_task  # Wait for the task to be cancelled
-
-# app.router.lifespan_context = lifespan
-
-
 @app.get("/")
 async def health():
     return {"status": "🤙"} 
 
 
+@app.get("/metrics")
+async def metrics(token: str = Depends(verify_token)):
+    return {
+        "embeddings": embedding_registry.stats(),
+        "query_embeddings": query_embedding_cache.stats(),
+        "embedding_batches": embedding_batcher.stats(),
+        "vector_store_cache": vector_store_cache.stats(),
+        "metadata_store": metadata_store.stats(),
+        "metadata_summaries": summary_cache.stats(),
+        "embedding_store": embedding_store.stats(),
+        "answer_cache": answer_cache.stats(),
+        "prefetch": prefetcher.stats(),
+        "products": clapp.generate.stats(),
+        "disk_cache": clapp.generate.cache_manager.stats(),
+        "executor": execution_layer.stats(),
+        "database": pool_stats(),
+        "llm": llm_registry.stats(),
+        "router": routing_engine.stats(),
+    }
+
+
 @app.get("/initialize")
 async def initialize(
     token: str = Depends(verify_token),
@@ -169,6 +244,78 @@ async def annotate(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def lookup_answer(asin: str, question: str):
+    """Look up a semantically equal question already answered for the product.
+
+    Returns the review set version and question vector to store the new
+    answer under, and the cached answer if there is one.
+    """
+    if not clapp.config.answer_cache_enabled:
+        return None, None, None
+    version = clapp.generate.review_version(asin)
+    vector = await execution_layer.run_io(answer_cache.embed, question)
+    return version, vector, answer_cache.get(asin, version, vector)
+
+
+def store_answer(asin: str, version, vector, output: dict):
+    if vector is not None:
+        answer_cache.put(asin, version, vector, output["question"], output["answer"], output["followup_questions"])
+
+
+async def lookup_prefetched(session_id: str, question: str):
+    """Answer or documents prefetched for a suggested follow-up the session clicked."""
+    prefetched = await prefetcher.get(session_id, question)
+    if prefetched is None:
+        return None, None
+    if prefetched.kind == "answer":
+        return prefetched.result, None
+    return None, PrefetchedRetriever(documents=prefetched.result)
+
+
+def prefetch_followups(session_id: str, asin: str, retriever_path, metadata_path, followup_questions: list):
+    """Speculatively retrieve or answer the suggested follow-ups in the background."""
+    if not prefetcher.enabled:
+        return
+
+    async def fetch(question: str):
+        clapp.generate.acquire(asin)
+        try:
+            if prefetcher.mode == "answer":
+                response = await clapp.app.ainvoke({
+                    "question": question,
+                    "meta_data": str(metadata_path),
+                    "retriever": str(retriever_path),
+                })
+                return CachedAnswer(question, response["answer"].content,
+                                    response["followup_questions"], time.time())
+            state = await aretrieve(
+                {"question": question, "retriever": str(retriever_path)},
+                embedding_model=clapp.config.embedding_model,
+                backend=clapp.config.retrieval_backend,
+            )
+            return state["documents"]
+        finally:
+            clapp.generate.release(asin)
+
+    prefetcher.schedule(session_id, followup_questions, fetch)
+
+
+def replay_answer(question: str, cached, stream_tokens: bool):
+    """Replay a cached answer as the SSE events a graph run would produce."""
+    if stream_tokens:
+        for content in re.findall(r"\S+\s*", cached.answer):
+            yield f"data: {json.dumps({'type': 'token', 'content': content})}\n\n"
+    output = {
+        "run_id": None,
+        "question": question,
+        "answer": cached.answer,
+        "cached": True,
+    }
+    yield f"data: {json.dumps({'type': 'message', 'content': output})}\n\n"
+    followups = {"run_id": None, "followup_questions": cached.followup_questions}
+    yield f"data: {json.dumps({'type': 'followups', 'content': followups})}\n\n"
+
+
 @app.post("/dev-invoke")
 async def invoke(
     token: str = Depends(verify_token),
@@ -180,58 +327,205 @@ async def invoke(
 
     asin = payload.parent_asin
     user_id = payload.user_id
-    cache_key = f"{user_id}-{asin}"
+    # Artifacts are shared per product, the conversation session stays per user
+    session_id = f"{user_id}-{asin}"
 
-    # Ensure paths exist
-    retriever_path, metadata_path = await clapp.generate.initialize(
-        asin, user_id, returnPath=True
-    )
-
-    if not os.path.exists(retriever_path):
-        logger.error(
-            f"Retriever not initialized for ASIN: {payload.parent_asin} and User ID: {payload.user_id}"
-        )
-        return JSONResponse(
-            content={"status": "Retriever not initialized"}, status_code=400
-        )
-    if not os.path.exists(metadata_path):
-        logger.error(
-            f"Meta-Data not initialized for ASIN: {payload.parent_asin} and User ID: {payload.user_id}"
-        )
-        return JSONResponse(
-            content={"status": "Meta-Data not initialized"}, status_code=400
+    # Held from initialization on, so the sweeper cannot remove the version being served
+    clapp.generate.acquire(asin)
+    try:
+        # Ensure paths exist
+        retriever_path, metadata_path = await clapp.generate.initialize(
+            asin, user_id, returnPath=True
         )
 
-    agent = clapp.app
+        if not clapp.generate.retriever_ready(asin):
+            logger.error(
+                f"Retriever not initialized for ASIN: {payload.parent_asin} and User ID: {payload.user_id}"
+            )
+            return JSONResponse(
+                content={"status": "Retriever not initialized"}, status_code=400
+            )
+        if not os.path.exists(metadata_path):
+            logger.error(
+                f"Meta-Data not initialized for ASIN: {payload.parent_asin} and User ID: {payload.user_id}"
+            )
+            return JSONResponse(
+                content={"status": "Meta-Data not initialized"}, status_code=400
+            )
+
+        version, vector, cached = await lookup_answer(asin, payload.query)
+        retriever = str(retriever_path)
+        if cached is None:
+            cached, prefetched_retriever = await lookup_prefetched(session_id, payload.query)
+            if prefetched_retriever is not None:
+                retriever = prefetched_retriever
+        if cached is not None:
+            logger.info(f"Cached answer for ASIN: {asin} and User ID: {payload.user_id}")
+            prefetch_followups(session_id, asin, retriever_path, metadata_path, cached.followup_questions)
+            return {
+                "run_id": None,
+                "question": payload.query,
+                "answer": cached.answer,
+                "followup_questions": cached.followup_questions,
+                "cached": True,
+            }
+
+        agent = clapp.answer_app if payload.skip_followups else clapp.app
     
-    if payload.log_langfuse:
-        run_id = str(uuid.uuid4())
-        langfuse_handler = CallbackHandler(
-            user_id=f"{payload.user_id}", session_id=f"{cache_key}"
+        run_id, config = None, {}
+        if payload.log_langfuse:
+            run_id = str(uuid.uuid4())
+            langfuse_handler = CallbackHandler(
+                user_id=f"{payload.user_id}", session_id=session_id
+            )
+            config = {"callbacks": [langfuse_handler], "run_id": run_id}
+        prefetcher.begin_foreground()
+        try:
+            response = await agent.ainvoke(
+                {
+                    "question": payload.query,
+                    "meta_data": str(metadata_path),
+                    "retriever": retriever,
+                },
+                config=config,
+            )
+
+            logger.info(f"Agent response generated for User ID: {payload.user_id}")
+            output = {
+                "run_id": run_id,
+                "question": response["question"],
+                "answer": response["answer"].content,
+                "followup_questions": response.get("followup_questions", []),
+                "cached": False,
+            }
+            logger.debug(f"Final response: {output}")
+            if not payload.skip_followups:
+                store_answer(asin, version, vector, output)
+                prefetch_followups(session_id, asin, retriever_path, metadata_path, output["followup_questions"])
+            return output
+        except Exception as e:
+            logger.error(f"Error invoking agent for User ID: {payload.user_id} - {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            prefetcher.end_foreground()
+    finally:
+        clapp.generate.release(asin)
+
+
+@app.post("/dev-batch-invoke")
+async def batch_invoke(
+    token: str = Depends(verify_token),
+    payload: BatchPayload = Body(..., description="json for a batch of user queries"),
+):
+    items = payload.queries
+    logger.info(f"Received batch of {len(items)} queries for User ID: {payload.user_id}")
+    if len(items) > clapp.config.batch_max_queries:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(items)} queries exceeds the limit of {clapp.config.batch_max_queries}",
         )
-        config = {"callbacks": [langfuse_handler], "run_id": run_id}
+
+    start = time.perf_counter()
+    results = [
+        {"question": item.query, "parent_asin": item.parent_asin, "error": None}
+        for item in items
+    ]
+
+    # Each product is initialized once, however many questions it has
+    asins = list(dict.fromkeys(item.parent_asin for item in items))
+    # Held from initialization on, so the sweeper cannot remove a version being served
+    for asin in asins:
+        clapp.generate.acquire(asin)
     try:
-        response = await agent.ainvoke(
-            {
-                "question": payload.query,
-                "meta_data": str(metadata_path),
-                "retriever": str(retriever_path),
-            },
-            config=config,
+        initialized = await asyncio.gather(
+            *(clapp.generate.initialize(asin, payload.user_id, returnPath=True) for asin in asins),
+            return_exceptions=True,
         )
-
-        logger.info(f"Agent response generated for User ID: {payload.user_id}")
-        output = {
-            "run_id": run_id,
-            "question": response["question"],
-            "answer": response["answer"].content,
-            "followup_questions": response["followup_questions"],
-        }
-        logger.debug(f"Final response: {output}")
-        return output
-    except Exception as e:
-        logger.error(f"Error invoking agent for User ID: {payload.user_id} - {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        paths = dict(zip(asins, initialized))
+
+        # One encoder call for all the questions of the batch, its failure is reported on each of them
+        if items:
+            try:
+                vectors = await execution_layer.run_cpu(
+                    embed_documents, [item.query for item in items], clapp.config.embedding_model
+                )
+            except Exception as e:
+                logger.error(f"Error embedding batch queries for User ID: {payload.user_id} - {e}")
+                vectors = e
+
+        # One index search per product, with all its questions as a single query matrix
+        documents = {}
+        for asin in asins:
+            positions = [i for i, item in enumerate(items) if item.parent_asin == asin]
+            try:
+                if isinstance(paths[asin], Exception):
+                    raise paths[asin]
+                if isinstance(vectors, Exception):
+                    raise vectors
+                retriever_path, metadata_path = paths[asin]
+                if not clapp.generate.retriever_ready(asin):
+                    raise ValueError("Retriever not initialized")
+                if not os.path.exists(metadata_path):
+                    raise ValueError("Meta-Data not initialized")
+                found = await execution_layer.run_io(
+                    retrieve_many, str(retriever_path), vectors[positions],
+                    clapp.config.embedding_model, clapp.config.retrieval_backend,
+                )
+                documents.update(zip(positions, found))
+            except Exception as e:
+                logger.error(f"Error preparing batch queries for ASIN: {asin} - {e}")
+                for i in positions:
+                    results[i]["error"] = getattr(e, "detail", None) or str(e)
+
+        agent = clapp.answer_app if payload.skip_followups else clapp.app
+        semaphore = asyncio.Semaphore(clapp.config.batch_max_concurrency)
+
+        async def run(i: int):
+            asin = items[i].parent_asin
+            config = {}
+            if payload.log_langfuse:
+                run_id = str(uuid.uuid4())
+                langfuse_handler = CallbackHandler(
+                    user_id=f"{payload.user_id}", session_id=f"{payload.user_id}-{asin}"
+                )
+                config = {"callbacks": [langfuse_handler], "run_id": run_id}
+
+            async with semaphore:
+                prefetcher.begin_foreground()
+                try:
+                    response = await agent.ainvoke(
+                        {
+                            "question": items[i].query,
+                            "meta_data": str(paths[asin][1]),
+                            "retriever": PrefetchedRetriever(documents=documents[i]),
+                        },
+                        config=config,
+                    )
+                    results[i].update({
+                        "run_id": config.get("run_id"),
+                        "answer": response["answer"].content,
+                        "followup_questions": response.get("followup_questions", []),
+                    })
+                except Exception as e:
+                    logger.error(f"Error invoking agent for batch query {i} of User ID: {payload.user_id} - {e}")
+                    results[i]["error"] = str(e)
+                finally:
+                    prefetcher.end_foreground()
+
+        await asyncio.gather(*(run(i) for i in documents))
+    finally:
+        for asin in asins:
+            clapp.generate.release(asin)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "results": results,
+        "queries": len(items),
+        "products": len(asins),
+        "errors": sum(result["error"] is not None for result in results),
+        "elapsed_seconds": round(elapsed, 4),
+        "queries_per_second": round(len(items) / elapsed, 4) if elapsed else 0.0,
+    }
 
 
 async def message_generator(
@@ -244,87 +538,129 @@ async def message_generator(
     """
     asin = payload.parent_asin
     user_id = payload.user_id
-    cache_key = f"{user_id}-{asin}"
-    logger.info(f"Initializing message generator for cache key: {cache_key}")
+    session_id = f"{user_id}-{asin}"
+    logger.info(f"Initializing message generator for session: {session_id}")
 
-    # Ensure paths exist
-    retriever_path, metadata_path = await clapp.generate.initialize(
-        asin, user_id, returnPath=True
-    )
-
-    if not os.path.exists(retriever_path):
-        logger.error(
-            f"Retriever not initialized for ASIN: {payload.parent_asin} and User ID: {payload.user_id}"
-        )
-        yield JSONResponse(
-            content={"status": "Retriever not initialized"}, status_code=400
-        )
-    if not os.path.exists(metadata_path):
-        logger.error(
-            f"Meta-Data not initialized for ASIN: {payload.parent_asin} and User ID: {payload.user_id}"
-        )
-        yield JSONResponse(
-            content={"status": "Meta-Data not initialized"}, status_code=400
+    # Held until the stream ends, as in invoke
+    clapp.generate.acquire(asin)
+    try:
+        # Ensure paths exist
+        retriever_path, metadata_path = await clapp.generate.initialize(
+            asin, user_id, returnPath=True
         )
 
-    agent = clapp.app
-    if payload.log_langfuse:
-        run_id = str(uuid.uuid4())
-        langfuse_handler = CallbackHandler(
-            user_id=f"{payload.user_id}", session_id=f"{cache_key}"
-        )
-        config = {"callbacks": [langfuse_handler], "run_id": run_id}
-    if payload.stream_tokens == 0:
-        stream_tokens = False
-
-    logger.info("Starting event stream processing for agent.")
-
-    # Process streamed events from the graph and yield messages over the SSE stream.
-    async for event in agent.astream_events(
-        {
-            "question": payload.query,
-            "meta_data": str(metadata_path),
-            "retriever": str(retriever_path),
-        },
-        version="v2",
-        config=config,
-    ):
-        if not event:
-            logger.warning("Received empty event in stream.")
-            continue
-
-        # Yield tokens streamed from LLMs.
-        if (
-            event["event"] == "on_chat_model_stream"
-            and stream_tokens == True
-            and any(t.startswith("seq:step:2") for t in event.get("tags", []))
-            and event["metadata"]["langgraph_node"] == "generate"
-        ):
-            content = event["data"]["chunk"].content
-            if content:
-                logger.debug(f"Streaming token: {content}")
-                yield f"data: {json.dumps({'type': 'token', 'content': content})}\n\n"
-            continue
-
-        # Yield messages written to the graph state after node execution finishes.
-        if (event["event"] == "on_chain_end") and (
-            (any(t.startswith("seq:step:2") for t in event.get("tags", [])))
-            and (
-                (event["metadata"]["langgraph_node"] == "final")
-                and (event["metadata"]["langgraph_triggers"] == ["generate"])
+        if not clapp.generate.retriever_ready(asin):
+            logger.error(
+                f"Retriever not initialized for ASIN: {payload.parent_asin} and User ID: {payload.user_id}"
             )
-        ):
-            answer = event["data"]["output"]["answer"].content
-            followup_questions = event["data"]["output"]["followup_questions"]
-            output = {
-                "run_id": run_id,
-                "question": payload.query,
-                "answer": answer,
-                "followup_questions": followup_questions,
-            }
-            logger.info(f"Yielding final response for User ID: {payload.user_id}")
-            logger.debug(f"Final response: {output}")
-            yield f"data: {json.dumps({'type': 'message', 'content': output})}\n\n"
+            yield JSONResponse(
+                content={"status": "Retriever not initialized"}, status_code=400
+            )
+        if not os.path.exists(metadata_path):
+            logger.error(
+                f"Meta-Data not initialized for ASIN: {payload.parent_asin} and User ID: {payload.user_id}"
+            )
+            yield JSONResponse(
+                content={"status": "Meta-Data not initialized"}, status_code=400
+            )
+
+        if payload.stream_tokens == 0:
+            stream_tokens = False
+
+        version, vector, cached = await lookup_answer(asin, payload.query)
+        retriever = str(retriever_path)
+        if cached is None:
+            cached, prefetched_retriever = await lookup_prefetched(session_id, payload.query)
+            if prefetched_retriever is not None:
+                retriever = prefetched_retriever
+        if cached is not None:
+            logger.info(f"Cached answer for ASIN: {asin} and User ID: {payload.user_id}")
+            prefetch_followups(session_id, asin, retriever_path, metadata_path, cached.followup_questions)
+            for message in replay_answer(payload.query, cached, stream_tokens):
+                yield message
+            yield "data: [DONE]\n\n"
+            return
+
+        agent = clapp.answer_app if payload.skip_followups else clapp.app
+        run_id, config = None, {}
+        if payload.log_langfuse:
+            run_id = str(uuid.uuid4())
+            langfuse_handler = CallbackHandler(
+                user_id=f"{payload.user_id}", session_id=session_id
+            )
+            config = {"callbacks": [langfuse_handler], "run_id": run_id}
+
+        logger.info("Starting event stream processing for agent.")
+
+        prefetcher.begin_foreground()
+        try:
+            # Process streamed events from the graph and yield messages over the SSE stream.
+            async for event in agent.astream_events(
+                {
+                    "question": payload.query,
+                    "meta_data": str(metadata_path),
+                    "retriever": retriever,
+                },
+                version="v2",
+                config=config,
+            ):
+                if not event:
+                    logger.warning("Received empty event in stream.")
+                    continue
+
+                # Yield tokens streamed from LLMs.
+                if (
+                    event["event"] == "on_chat_model_stream"
+                    and stream_tokens == True
+                    and any(t.startswith("seq:step:2") for t in event.get("tags", []))
+                    and event["metadata"]["langgraph_node"] == "generate"
+                ):
+                    content = event["data"]["chunk"].content
+                    if content:
+                        logger.debug(f"Streaming token: {content}")
+                        yield f"data: {json.dumps({'type': 'token', 'content': content})}\n\n"
+                    continue
+
+                # Yield the answer as soon as generate finishes, follow-ups are still being generated.
+                if (
+                    event["event"] == "on_chain_end"
+                    and event["name"] == "generate"
+                    and event["metadata"]["langgraph_node"] == "generate"
+                ):
+                    answer = event["data"]["output"]["answer"].content
+                    output = {
+                        "run_id": run_id,
+                        "question": payload.query,
+                        "answer": answer,
+                        "cached": False,
+                    }
+                    logger.info(f"Yielding final response for User ID: {payload.user_id}")
+                    logger.debug(f"Final response: {output}")
+                    yield f"data: {json.dumps({'type': 'message', 'content': output})}\n\n"
+                    continue
+
+                # Yield the follow-up questions written to the graph state by the final node.
+                if (event["event"] == "on_chain_end") and (
+                    (any(t.startswith("seq:step:2") for t in event.get("tags", [])))
+                    and (
+                        (event["metadata"]["langgraph_node"] == "final")
+                        and (event["metadata"]["langgraph_triggers"] == ["generate"])
+                    )
+                ):
+                    followup_questions = event["data"]["output"]["followup_questions"]
+                    followups = {"run_id": run_id, "followup_questions": followup_questions}
+                    logger.info(f"Yielding follow-up questions for User ID: {payload.user_id}")
+                    store_answer(asin, version, vector, {
+                        "question": payload.query,
+                        "answer": answer,
+                        "followup_questions": followup_questions,
+                    })
+                    prefetch_followups(session_id, asin, retriever_path, metadata_path, followup_questions)
+                    yield f"data: {json.dumps({'type': 'followups', 'content': followups})}\n\n"
+        finally:
+            prefetcher.end_foreground()
+    finally:
+        clapp.generate.release(asin)
 
     logger.info("Message stream complete. Sending [DONE] signal.")
     yield "data: [DONE]\n\n"
@@ -0,0 +1,181 @@
+import time
+import threading
+from collections import OrderedDict
+from itertools import count
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from logger import logger
+from utils.embeddings import DEFAULT_EMBEDDING_MODEL
+from utils.query_embeddings import query_embedding_cache
+
+
+class CachedAnswer(NamedTuple):
+    question: str
+    answer: str
+    followup_questions: list
+    created_at: float
+
+
+class _ProductAnswers:
+    """Answers cached for one product, with their question vectors stacked in one matrix."""
+
+    def __init__(self, version: str, dim: int):
+        self.version = version
+        self.ids = []
+        self.answers = []
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+
+
+    def append(self, entry_id: int, vector: np.ndarray, answer: CachedAnswer):
+        self.ids.append(entry_id)
+        self.answers.append(answer)
+        self.vectors = np.vstack([self.vectors, vector[None, :]])
+
+
+    def remove(self, positions: list):
+        keep = np.setdiff1d(np.arange(len(self.ids)), positions)
+        self.ids = [self.ids[i] for i in keep]
+        self.answers = [self.answers[i] for i in keep]
+        self.vectors = self.vectors[keep]
+
+
+class AnswerCache:
+    """Semantic cache of graph answers per product.
+
+    A question is embedded and compared by cosine similarity with the
+    questions already answered for the same product. Above `threshold` the
+    stored answer and follow-ups are returned without running the graph.
+    Entries expire after `ttl_seconds`, are dropped when the product's review
+    set version changes, and the least recently used ones are evicted beyond
+    `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: int = 3600, threshold: float = 0.9,
+                 embedding_model: str = DEFAULT_EMBEDDING_MODEL):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.embedding_model = embedding_model
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self._products = {}
+        self._order = OrderedDict()
+        self._ids = count()
+        self._lock = threading.Lock()
+
+
+    def configure(self, max_entries: int, ttl_seconds: int, threshold: float, embedding_model: str):
+        with self._lock:
+            self.max_entries = max_entries
+            self.ttl_seconds = ttl_seconds
+            self.threshold = threshold
+            if embedding_model != self.embedding_model:
+                self._clear()
+            self.embedding_model = embedding_model
+            self._evict()
+
+
+    def embed(self, question: str) -> np.ndarray:
+        vector = query_embedding_cache.embed(question, self.embedding_model)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+
+    def _product(self, asin: str, version: str) -> Optional[_ProductAnswers]:
+        product = self._products.get(asin)
+        if product is None:
+            return None
+
+        # A rebuilt index means the reviews changed, answers based on the old set are dropped
+        if product.version != version:
+            self._drop(asin)
+            self.invalidations += 1
+            logger.info(f"Answer cache invalidated for ASIN: {asin}")
+            return None
+
+        cutoff = time.time() - self.ttl_seconds
+        expired = [i for i, answer in enumerate(product.answers) if answer.created_at < cutoff]
+        if expired:
+            for i in expired:
+                self._order.pop(product.ids[i], None)
+            product.remove(expired)
+            self.expirations += len(expired)
+            if not product.ids:
+                del self._products[asin]
+                return None
+        return product
+
+
+    def get(self, asin: str, version: str, vector: np.ndarray) -> Optional[CachedAnswer]:
+        with self._lock:
+            product = self._product(asin, version)
+            if product is None:
+                self.misses += 1
+                return None
+
+            scores = product.vectors @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            self._order.move_to_end(product.ids[best])
+            self.hits += 1
+            return product.answers[best]
+
+
+    def put(self, asin: str, version: str, vector: np.ndarray, question: str,
+            answer: str, followup_questions: list):
+        with self._lock:
+            product = self._product(asin, version)
+            if product is None:
+                product = self._products[asin] = _ProductAnswers(version, vector.shape[0])
+
+            entry_id = next(self._ids)
+            product.append(entry_id, vector, CachedAnswer(question, answer, followup_questions, time.time()))
+            self._order[entry_id] = asin
+            self._evict()
+
+
+    def _evict(self):
+        while len(self._order) > self.max_entries:
+            entry_id, asin = self._order.popitem(last=False)
+            product = self._products[asin]
+            product.remove([product.ids.index(entry_id)])
+            if not product.ids:
+                del self._products[asin]
+            self.evictions += 1
+
+
+    def _drop(self, asin: str):
+        product = self._products.pop(asin)
+        for entry_id in product.ids:
+            self._order.pop(entry_id, None)
+
+
+    def _clear(self):
+        self._products.clear()
+        self._order.clear()
+
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "entries": len(self._order),
+            "products": len(self._products),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / requests, 4) if requests else 0.0,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+        }
+
+
+answer_cache = AnswerCache()
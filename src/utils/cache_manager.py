@@ -0,0 +1,262 @@
+import os
+import time
+import uuid
+import shutil
+import asyncio
+import threading
+from pathlib import Path
+
+from pandas import DataFrame
+
+from logger import logger
+from utils.vector_cache import vector_store_cache
+
+
+def _dir_bytes(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+class DiskCacheManager:
+    """Byte-budgeted, TTL-aware manager of the product artifacts in cache/faiss and cache/meta.
+
+    Indexes are written to a fresh version directory under `faiss_dir/.versions`
+    and published by atomically swapping the `faiss_dir/<asin>` symlink, so a
+    reader never sees a half-written index. Metadata Parquet files are
+    written to a temp file and renamed into place. Entries expire `ttl_seconds` after they
+    were written, and the least recently accessed ones are evicted once the
+    total size exceeds `max_bytes`. With `keep_expired`, expired entries stay
+    on disk to be updated incrementally on next access instead of being swept.
+    A replaced version is deleted by the sweeper once its product is no
+    longer in use, since a reader may still be loading it.
+    """
+
+    def __init__(self, faiss_dir, meta_dir, max_bytes: int, ttl_seconds: int,
+                 sweep_interval_seconds: int, in_use=None, keep_expired: bool = False):
+        self.faiss_dir = Path(faiss_dir)
+        self.meta_dir = Path(meta_dir)
+        self.versions_dir = self.faiss_dir / ".versions"
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self.in_use = in_use or (lambda key: False)
+        self.keep_expired = keep_expired
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = {}
+        self._retired = {}
+        self._lock = threading.Lock()
+
+        self.versions_dir.mkdir(parents=True, exist_ok=True)
+
+
+    def index_path(self, key: str) -> Path:
+        return self.faiss_dir / key
+
+
+    def metadata_path(self, key: str) -> Path:
+        return self.meta_dir / f"{key}.parquet"
+
+
+    def contains(self, key: str) -> bool:
+        """Look up a key, counting the hit or miss and refreshing its access time."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry):
+                self.misses += 1
+                return False
+            self.hits += 1
+            entry["accessed_at"] = time.time()
+            return True
+
+
+    def touch(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._entries[key]["accessed_at"] = time.time()
+
+
+    def renew(self, key: str):
+        """Restart the TTL of an entry found to be up to date."""
+        with self._lock:
+            if key in self._entries:
+                self._entries[key]["created_at"] = time.time()
+
+
+    def new_version_path(self, key: str) -> Path:
+        return self.versions_dir / f"{key}-{uuid.uuid4().hex}"
+
+
+    def write(self, key: str, vector_db, meta_df: DataFrame):
+        version_path = self.new_version_path(key)
+        vector_db.save_local(version_path)
+        self.publish(key, version_path, meta_df)
+
+
+    def publish(self, key: str, version_path: Path, meta_df: DataFrame):
+        """Publish an index already saved at `version_path` together with its metadata."""
+        index_path, metadata_path = self.index_path(key), self.metadata_path(key)
+
+        self._publish_index(key, index_path, version_path)
+        vector_store_cache.invalidate(index_path)
+        logger.info(f"VectorDB saved at: {index_path}")
+
+        self.publish_metadata(key, meta_df)
+
+        now = time.time()
+        with self._lock:
+            self._entries[key] = {
+                "created_at": now,
+                "accessed_at": now,
+                "size": _dir_bytes(version_path) + metadata_path.stat().st_size,
+            }
+
+
+    def publish_metadata(self, key: str, meta_df: DataFrame) -> Path:
+        metadata_path = self.metadata_path(key)
+        tmp_metadata_path = self.meta_dir / f".tmp-{key}-{uuid.uuid4().hex}.parquet"
+        # Stored as strings, the values are only rendered into the metadata prompt
+        meta_df.astype(str).to_parquet(tmp_metadata_path, index=False)
+        os.replace(tmp_metadata_path, metadata_path)
+        logger.info(f"Metadata saved at: {metadata_path}")
+        return metadata_path
+
+
+    def _publish_index(self, key: str, index_path: Path, version_path: Path):
+        if index_path.is_dir() and not index_path.is_symlink():
+            # A legacy plain directory cannot be swapped for a symlink, drop it first
+            shutil.rmtree(index_path, ignore_errors=True)
+
+        previous = index_path.resolve() if index_path.is_symlink() else None
+        tmp_link = self.faiss_dir / f".tmp-{version_path.name}"
+        os.symlink(version_path.resolve(), tmp_link, target_is_directory=True)
+        os.replace(tmp_link, index_path)
+
+        if previous is not None and previous != version_path.resolve():
+            with self._lock:
+                self._retired.setdefault(key, []).append(previous)
+
+
+    def scan(self):
+        """Register product artifacts already on disk, e.g. after a restart."""
+        for index_path in self.faiss_dir.iterdir():
+            key = index_path.name
+            metadata_path = self.metadata_path(key)
+            if key.startswith(".") or not index_path.is_dir() or not metadata_path.exists():
+                continue
+
+            created_at = index_path.lstat().st_mtime
+            with self._lock:
+                self._entries[key] = {
+                    "created_at": created_at,
+                    "accessed_at": created_at,
+                    "size": _dir_bytes(index_path.resolve()) + metadata_path.stat().st_size,
+                }
+        logger.info(f"Disk cache registered {len(self._entries)} products")
+
+
+    def remove(self, key: str):
+        index_path, metadata_path = self.index_path(key), self.metadata_path(key)
+
+        target = index_path.resolve() if index_path.is_symlink() else index_path
+        if index_path.is_symlink():
+            index_path.unlink()
+        shutil.rmtree(target, ignore_errors=True)
+        if metadata_path.exists():
+            os.remove(metadata_path)
+
+        vector_store_cache.invalidate(index_path)
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+    def clear(self):
+        with self._lock:
+            keys = list(self._entries)
+        for key in keys:
+            self.remove(key)
+        logger.info(f"Disk cache cleared {len(keys)} products")
+
+
+    def _expired(self, entry: dict) -> bool:
+        return (time.time() - entry["created_at"]) > self.ttl_seconds
+
+
+    def sweep(self):
+        """Drop expired entries, then evict least recently accessed ones until within budget."""
+        with self._lock:
+            entries = {key: dict(entry) for key, entry in self._entries.items()}
+
+        for key, entry in list(entries.items()):
+            if self._expired(entry) and not self.keep_expired and not self.in_use(key):
+                self.remove(key)
+                entries.pop(key)
+                self.expirations += 1
+                logger.info(f"Cache expired for {key}")
+
+        total_bytes = sum(entry["size"] for entry in entries.values())
+        for key, entry in sorted(entries.items(), key=lambda item: item[1]["accessed_at"]):
+            if total_bytes <= self.max_bytes:
+                break
+            if self.in_use(key):
+                continue
+            self.remove(key)
+            total_bytes -= entry["size"]
+            self.evictions += 1
+            logger.info(f"Cache evicted for {key}")
+
+        self._remove_retired()
+        self._remove_orphans()
+
+
+    def _remove_retired(self):
+        with self._lock:
+            retired = {key: paths for key, paths in self._retired.items() if not self.in_use(key)}
+            for key in retired:
+                self._retired.pop(key)
+        for paths in retired.values():
+            for path in paths:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+    def _remove_orphans(self):
+        # Leftovers of writes interrupted by a crash, replaced versions still in use are kept
+        live = {path.resolve() for path in self.faiss_dir.iterdir() if path.is_symlink()}
+        with self._lock:
+            live.update(path for paths in self._retired.values() for path in paths)
+        cutoff = time.time() - self.sweep_interval_seconds
+        for version_path in self.versions_dir.iterdir():
+            if version_path.resolve() not in live and version_path.stat().st_mtime < cutoff:
+                shutil.rmtree(version_path, ignore_errors=True)
+        for tmp_path in [*self.faiss_dir.glob(".tmp-*"), *self.meta_dir.glob(".tmp-*")]:
+            if tmp_path.lstat().st_mtime < cutoff:
+                tmp_path.unlink(missing_ok=True)
+
+
+    async def run_sweeper(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval_seconds)
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.error(f"Error sweeping disk cache: {e}")
+
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        with self._lock:
+            total_bytes = sum(entry["size"] for entry in self._entries.values())
+            entries = len(self._entries)
+        return {
+            "entries": entries,
+            "total_bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / requests, 4) if requests else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,318 @@
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from langchain.schema import Document
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+
+from logger import logger
+
+STATE_FILE = "partitions.json"
+
+
+class CatalogIndex:
+    """One catalog-wide review index, partitioned by product.
+
+    Vectors of a product occupy one contiguous row range of an append-only
+    float32 file that is memory mapped for search, so a query only scans the
+    rows of its own product instead of the whole catalog. Documents are
+    stored as JSON lines next to a row -> byte offset table, and only the k
+    results of a search are read back. Re-adding a product appends a new
+    range and leaves the old one dead until the next compaction, which is
+    how a partition older than the cache TTL is refreshed.
+    """
+
+    def __init__(self, path, compact_ratio: float = 0.5):
+        self.path = Path(path)
+        self.compact_ratio = compact_ratio
+        self.searches = 0
+        self.compactions = 0
+        self._lock = threading.Lock()
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._state = self._read_state()
+        self._vectors = None
+        self._offsets = None
+        self._open()
+
+
+    def _read_state(self) -> dict:
+        state_path = self.path / STATE_FILE
+        if not state_path.exists():
+            return {"generation": 0, "dim": None, "rows": 0, "partitions": {}, "document_bytes": 0, "added_at": {}}
+        with open(state_path, "r") as f:
+            return json.load(f)
+
+
+    def _write_state(self, state: dict):
+        # Rows become visible only once the state pointing at them is renamed into place
+        tmp_path = self.path / f".{STATE_FILE}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path / STATE_FILE)
+
+
+    def _files(self, generation: int):
+        return (
+            self.path / f"vectors-{generation}.f32",
+            self.path / f"offsets-{generation}.i64",
+            self.path / f"documents-{generation}.jsonl",
+        )
+
+
+    def _open(self):
+        rows, dim = self._state["rows"], self._state["dim"]
+        if rows == 0:
+            self._vectors, self._offsets = None, None
+            return
+        vectors_path, offsets_path, _ = self._files(self._state["generation"])
+        self._vectors = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(rows, dim))
+        self._offsets = np.memmap(offsets_path, dtype=np.int64, mode="r", shape=(rows,))
+
+
+    def contains(self, asin: str) -> bool:
+        return asin in self._state["partitions"]
+
+
+    def partition_version(self, asin: str) -> Optional[str]:
+        """Changes whenever the product is re-added or the index is compacted."""
+        state = self._state
+        partition = state["partitions"].get(asin)
+        if partition is None:
+            return None
+        return f"{state['generation']}:{partition[0]}:{partition[1]}"
+
+
+    def expired(self, asin: str, ttl_seconds: int) -> bool:
+        """Whether the product's partition was added more than `ttl_seconds` ago and should be re-added."""
+        # Partitions written before the time was recorded are refreshed once
+        added_at = self._state.get("added_at", {}).get(asin)
+        return added_at is None or (time.time() - added_at) > ttl_seconds
+
+
+    def add(self, asin: str, vectors: np.ndarray, documents: List[Document]):
+        """Append the vectors and documents of a product, replacing any previous range."""
+        self.add_many([(asin, vectors, documents)])
+
+
+    def add_many(self, products: list):
+        """Append several `(asin, vectors, documents)` products with one state update.
+
+        Every product is validated before anything is written, and each file
+        is first cut back to the size the state accounts for, so bytes left
+        by a failed or interrupted call never shift the rows of later products.
+        """
+        with self._lock:
+            state = dict(self._state, partitions=dict(self._state["partitions"]),
+                         added_at=dict(self._state.get("added_at", {})))
+            products = self._validate(products, state)
+            vectors_path, offsets_path, documents_path = self._files(state["generation"])
+
+            with open(vectors_path, "ab") as vectors_file, open(offsets_path, "ab") as offsets_file, \
+                    open(documents_path, "ab") as documents_file:
+                for f, size in ((vectors_file, state["rows"] * (state["dim"] or 0) * 4),
+                                (offsets_file, state["rows"] * 8),
+                                (documents_file, self._document_bytes(state))):
+                    f.truncate(size)
+                    f.seek(size)
+
+                for asin, vectors, documents in products:
+                    start = state["rows"]
+                    if documents:
+                        offsets = np.empty(len(documents), dtype=np.int64)
+                        for i, document in enumerate(documents):
+                            offsets[i] = documents_file.tell()
+                            record = {"page_content": document.page_content, "metadata": document.metadata}
+                            documents_file.write(json.dumps(record, default=str).encode() + b"\n")
+                        offsets_file.write(offsets.tobytes())
+                        vectors_file.write(vectors.tobytes())
+
+                    state["rows"] = start + len(documents)
+                    state["partitions"][asin] = [start, state["rows"]]
+                    state["added_at"][asin] = time.time()
+                state["document_bytes"] = documents_file.tell()
+
+            self._write_state(state)
+            self._state = state
+            self._open()
+
+            if self.dead_rows() > self.compact_ratio * state["rows"]:
+                self._compact()
+
+        logger.info(f"Catalog index added {len(products)} products, {state['rows']} rows in total")
+
+
+    def _validate(self, products: list, state: dict) -> list:
+        """Check every product against the index dimension, setting it for an empty index."""
+        validated = []
+        for asin, vectors, documents in products:
+            if len(vectors) != len(documents):
+                raise ValueError("Number of vectors and documents must match")
+            if documents:
+                vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+                if vectors.ndim != 2:
+                    raise ValueError(f"Expected a 2-d array of vectors, got {vectors.ndim} dimensions")
+                if state["dim"] is None:
+                    state["dim"] = vectors.shape[1]
+                elif vectors.shape[1] != state["dim"]:
+                    raise ValueError(f"Expected vectors of dimension {state['dim']}, got {vectors.shape[1]}")
+            validated.append((asin, vectors, documents))
+        return validated
+
+
+    def _document_bytes(self, state: dict) -> int:
+        if "document_bytes" in state:
+            return state["document_bytes"]
+        if state["rows"] == 0:
+            return 0
+        # States written before the size was recorded end with the last document
+        last_offset = int(self._offsets[state["rows"] - 1])
+        with open(self._files(state["generation"])[2], "rb") as f:
+            f.seek(last_offset)
+            return last_offset + len(f.readline())
+
+
+    def clear(self):
+        """Drop every product, e.g. when the embedding model changes."""
+        with self._lock:
+            generation = self._state["generation"] + 1
+            self._state = {"generation": generation, "dim": None, "rows": 0, "partitions": {}, "document_bytes": 0,
+                           "added_at": {}}
+            self._write_state(self._state)
+            self._open()
+            for old_file in self._files(generation - 2):
+                old_file.unlink(missing_ok=True)
+        logger.info("Catalog index cleared")
+
+
+    def dead_rows(self) -> int:
+        live = sum(end - start for start, end in self._state["partitions"].values())
+        return self._state["rows"] - live
+
+
+    def compact(self):
+        with self._lock:
+            self._compact()
+
+
+    def _compact(self):
+        """Rewrite the live ranges into a new generation of files."""
+        state = self._state
+        generation = state["generation"] + 1
+        vectors_path, offsets_path, documents_path = self._files(generation)
+        old_documents_path = self._files(state["generation"])[2]
+
+        partitions, rows = {}, 0
+        with open(vectors_path, "wb") as vectors_file, open(offsets_path, "wb") as offsets_file, \
+                open(documents_path, "wb") as documents_file, open(old_documents_path, "rb") as old_documents:
+            for asin, (start, end) in state["partitions"].items():
+                vectors_file.write(np.ascontiguousarray(self._vectors[start:end]).tobytes())
+                offsets = np.empty(end - start, dtype=np.int64)
+                for i, offset in enumerate(self._offsets[start:end]):
+                    old_documents.seek(int(offset))
+                    offsets[i] = documents_file.tell()
+                    documents_file.write(old_documents.readline())
+                offsets_file.write(offsets.tobytes())
+                partitions[asin] = [rows, rows + (end - start)]
+                rows += end - start
+            document_bytes = documents_file.tell()
+
+        self._state = dict(state, generation=generation, rows=rows, partitions=partitions,
+                           document_bytes=document_bytes)
+        self._write_state(self._state)
+        self._open()
+
+        # Searches may still read the previous generation, only the one before it is removed
+        for old_file in self._files(generation - 2):
+            old_file.unlink(missing_ok=True)
+        self.compactions += 1
+        logger.info(f"Catalog index compacted to {rows} rows")
+
+
+    def search(self, asin: str, query: np.ndarray, k: int = 4) -> List[Document]:
+        """Exact L2 search over the rows of one product, nearest first."""
+        return self.search_many(asin, np.asarray(query, dtype=np.float32)[None, :], k)[0]
+
+
+    def search_many(self, asin: str, queries: np.ndarray, k: int = 4) -> List[List[Document]]:
+        """Search several queries against one product with a single distance matrix."""
+        # Snapshot, a concurrent add or compaction swaps these without touching the old ones
+        state, vectors, offsets = self._state, self._vectors, self._offsets
+        partition = state["partitions"].get(asin)
+        if partition is None or partition[0] == partition[1]:
+            return [[] for _ in range(len(queries))]
+
+        start, end = partition
+        rows = vectors[start:end]
+        queries = np.asarray(queries, dtype=np.float32)
+        # |r - q|^2 = |r|^2 - 2 r.q + |q|^2 for every (query, row) pair
+        distances = ((rows ** 2).sum(axis=1)[None, :] - 2 * queries @ rows.T
+                     + (queries ** 2).sum(axis=1)[:, None])
+        k = min(k, rows.shape[0])
+        self.searches += len(queries)
+
+        results = []
+        with open(self._files(state["generation"])[2], "rb") as f:
+            for query_distances in distances:
+                nearest = np.argpartition(query_distances, k - 1)[:k]
+                nearest = nearest[np.argsort(query_distances[nearest])]
+                documents = []
+                for row in nearest:
+                    f.seek(int(offsets[start + row]))
+                    record = json.loads(f.readline())
+                    documents.append(Document(page_content=record["page_content"], metadata=record["metadata"]))
+                results.append(documents)
+        return results
+
+
+    def as_retriever(self, asin: str, embeddings: Embeddings, k: int = 4) -> "CatalogRetriever":
+        return CatalogRetriever(index=self, asin=asin, embeddings=embeddings, k=k)
+
+
+    def stats(self) -> dict:
+        state = self._state
+        return {
+            "products": len(state["partitions"]),
+            "rows": state["rows"],
+            "dead_rows": self.dead_rows(),
+            "dim": state["dim"],
+            "generation": state["generation"],
+            "searches": self.searches,
+            "compactions": self.compactions,
+        }
+
+
+class CatalogRetriever(BaseRetriever):
+    """Retriever over one product's partition of the catalog index."""
+
+    index: CatalogIndex
+    asin: str
+    embeddings: Embeddings
+    k: int = 4
+
+    class Config:
+        arbitrary_types_allowed = True
+
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        query_vector = self.embeddings.embed_query(query)
+        return self.index.search(self.asin, query_vector, k=self.k)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_catalog_index(path) -> CatalogIndex:
+    """Return the catalog index opened for `path`, shared by the whole process."""
+    key = str(Path(path).resolve())
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = CatalogIndex(path)
+        return _indexes[key]
@@ -1,14 +1,111 @@
 import os
+import time
+import threading
 import pg8000
 import sqlalchemy
+from sqlalchemy.pool import QueuePool
 from google.cloud.sql.connector import Connector, IPTypes
 
+from logger import logger
+from entity.config_entity import DatabaseConfig
+
+_engine = None
+_connector = None
+_config = None
+_lock = threading.Lock()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool recording how long callers wait for a pooled connection, and how long new ones take to open.
+
+    Opening a connection happens inside a checkout, its time is reported
+    separately so the wait only covers the pool queue.
+    """
+
+    checkouts = 0
+    wait_seconds_total = 0.0
+    wait_seconds_max = 0.0
+    connects = 0
+    connect_seconds_total = 0.0
+    _stats_lock = threading.Lock()
+    _checkout = threading.local()
+
+    def _create_connection(self):
+        start = time.perf_counter()
+        try:
+            return super()._create_connection()
+        finally:
+            elapsed = time.perf_counter() - start
+            TimedQueuePool._checkout.connect_seconds = getattr(TimedQueuePool._checkout, "connect_seconds", 0.0) + elapsed
+            with TimedQueuePool._stats_lock:
+                TimedQueuePool.connects += 1
+                TimedQueuePool.connect_seconds_total += elapsed
+
+    def _do_get(self):
+        # QueuePool retries by calling _do_get again, only the outermost call is recorded
+        checkout = TimedQueuePool._checkout
+        if getattr(checkout, "depth", 0):
+            checkout.depth += 1
+            try:
+                return super()._do_get()
+            finally:
+                checkout.depth -= 1
+
+        checkout.depth, checkout.connect_seconds = 1, 0.0
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            checkout.depth = 0
+            wait = max(time.perf_counter() - start - checkout.connect_seconds, 0.0)
+            with TimedQueuePool._stats_lock:
+                TimedQueuePool.checkouts += 1
+                TimedQueuePool.wait_seconds_total += wait
+                TimedQueuePool.wait_seconds_max = max(TimedQueuePool.wait_seconds_max, wait)
+
+
+def get_credentials() -> dict:
+    return {
+        'INSTANCE_CONNECTION_NAME': os.getenv("INSTANCE_CONNECTION_NAME"),
+        'DB_USER': os.getenv("DB_USER"),
+        'DB_PASS': os.getenv("DB_PASS"),
+        'DB_NAME': os.getenv("DB_NAME")
+    }
+
+
+def configure_engine(config: DatabaseConfig):
+    """Set the pool options used when the shared engine is first created."""
+    global _config
+    _config = config
+
+
+def load_database_config() -> DatabaseConfig:
+    if _config is None:
+        from config.configuration import ConfigurationManager
+        configure_engine(ConfigurationManager().get_database_config())
+    return _config
+
+
+def create_engine(credentials, config: DatabaseConfig) -> sqlalchemy.engine.base.Engine:
+    global _connector
+    pool_options = dict(
+        poolclass=TimedQueuePool,
+        pool_size=config.pool_size,
+        max_overflow=config.max_overflow,
+        pool_pre_ping=config.pool_pre_ping,
+        pool_recycle=config.pool_recycle_seconds,
+        pool_timeout=config.pool_timeout_seconds,
+    )
+
+    # A plain DSN (e.g. a local Postgres for testing) bypasses the Cloud SQL connector
+    database_url = os.getenv("DATABASE_URL")
+    if database_url:
+        return sqlalchemy.create_engine(database_url, **pool_options)
 
-def connect_with_db(credentials) -> sqlalchemy.engine.base.Engine:
     ip_type = IPTypes.PRIVATE if os.getenv("PRIVATE_IP") else IPTypes.PUBLIC
-    connector = Connector()
+    _connector = _connector or Connector()
     def getconn() -> pg8000.dbapi.Connection:
-        conn: pg8000.dbapi.Connection = connector.connect(
+        conn: pg8000.dbapi.Connection = _connector.connect(
             credentials['INSTANCE_CONNECTION_NAME'],
             "pg8000",
             user=credentials['DB_USER'],
@@ -20,5 +117,54 @@ def connect_with_db(credentials) -> sqlalchemy.engine.base.Engine:
     pool = sqlalchemy.create_engine(
         "postgresql+pg8000://",
         creator=getconn,
+        **pool_options,
     )
-    return pool
\ No newline at end of file
+    return pool
+
+
+def get_engine(credentials=None) -> sqlalchemy.engine.base.Engine:
+    """Return the engine shared by the whole process, creating it on first use."""
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                config = load_database_config()
+                _engine = create_engine(credentials or get_credentials(), config)
+                logger.info(f"Database engine created with pool_size={config.pool_size}, max_overflow={config.max_overflow}")
+    return _engine
+
+
+def connect_with_db(credentials) -> sqlalchemy.engine.base.Engine:
+    return get_engine(credentials)
+
+
+def dispose_engine():
+    global _engine, _connector
+    with _lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+        if _connector is not None:
+            _connector.close()
+            _connector = None
+    logger.info("Database engine disposed")
+
+
+def pool_stats() -> dict:
+    with TimedQueuePool._stats_lock:
+        checkouts, connects = TimedQueuePool.checkouts, TimedQueuePool.connects
+        stats = {
+            "checkouts": checkouts,
+            "checkout_wait_avg_seconds": round(TimedQueuePool.wait_seconds_total / checkouts, 6) if checkouts else 0.0,
+            "checkout_wait_max_seconds": round(TimedQueuePool.wait_seconds_max, 6),
+            "connects": connects,
+            "connect_avg_seconds": round(TimedQueuePool.connect_seconds_total / connects, 6) if connects else 0.0,
+        }
+    if _engine is not None:
+        pool = _engine.pool
+        stats.update({
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        })
+    return stats
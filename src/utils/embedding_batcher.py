@@ -0,0 +1,181 @@
+import os
+import time
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+from logger import logger
+from utils.embeddings import embedding_registry, DEFAULT_EMBEDDING_MODEL
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+WAIT_MS_BUCKETS = (1, 2, 5, 10, 25, 50, 100)
+
+
+class Histogram:
+    """Counts of observations per upper bound, the last bucket holds everything above."""
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+
+    def observe(self, value: float):
+        index = next((i for i, bound in enumerate(self.bounds) if value <= bound), len(self.bounds))
+        self.counts[index] += 1
+        self.total += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+
+    def stats(self) -> dict:
+        labels = [f"le_{bound}" for bound in self.bounds] + [f"gt_{self.bounds[-1]}"]
+        return {
+            "buckets": dict(zip(labels, self.counts)),
+            "avg": round(self.total / self.count, 4) if self.count else 0.0,
+            "max": round(self.max, 4),
+        }
+
+
+class _Queue:
+    """Pending query encodes of one model, drained by its own worker thread."""
+
+    def __init__(self):
+        self.items = []
+        self.ready = threading.Condition()
+        self.worker = None
+
+
+class EmbeddingBatcher:
+    """Coalesces single query encodes from concurrent requests into batched forward passes.
+
+    A caller thread enqueues its text and blocks on a future. The model's
+    worker thread waits up to `window_ms` after the first pending text, or
+    until `max_batch` texts are queued, encodes them with one
+    `embed_documents` call and resolves every future. With `window_ms=0` or
+    `max_batch=1` texts are encoded directly in the calling thread.
+    """
+
+    def __init__(self, window_ms: float = 3.0, max_batch: int = 32):
+        self._queues = {}
+        self._lock = threading.Lock()
+        self.configure(window_ms, max_batch)
+        os.register_at_fork(after_in_child=self._reset)
+
+
+    def configure(self, window_ms: float, max_batch: int):
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        self._reset()
+
+
+    def _reset(self):
+        # Worker threads do not survive a fork, the child starts with empty queues
+        self._queues = {}
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.failed = 0
+        self.forward_seconds = 0.0
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms = Histogram(WAIT_MS_BUCKETS)
+        self._stats_lock = threading.Lock()
+
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_ms > 0 and self.max_batch > 1
+
+
+    def embed(self, text: str, model_name: str = DEFAULT_EMBEDDING_MODEL) -> np.ndarray:
+        if not self.enabled:
+            start = time.perf_counter()
+            vector = np.asarray(embedding_registry.get(model_name).embed_query(text), dtype=np.float32)
+            self._record([0.0], time.perf_counter() - start)
+            return vector
+
+        future = Future()
+        queue = self._queue(model_name)
+        with queue.ready:
+            queue.items.append((text, future, time.perf_counter()))
+            queue.ready.notify()
+        return future.result()
+
+
+    def _queue(self, model_name: str) -> _Queue:
+        with self._lock:
+            queue = self._queues.get(model_name)
+            if queue is None:
+                queue = self._queues[model_name] = _Queue()
+            if queue.worker is None or not queue.worker.is_alive():
+                queue.worker = threading.Thread(target=self._work, args=(model_name, queue),
+                                                name=f"verta-embed-batch-{model_name}", daemon=True)
+                queue.worker.start()
+            return queue
+
+
+    def _work(self, model_name: str, queue: _Queue):
+        while True:
+            with queue.ready:
+                while not queue.items:
+                    queue.ready.wait()
+                deadline = queue.items[0][2] + self.window_ms / 1000
+                while len(queue.items) < self.max_batch:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    queue.ready.wait(remaining)
+                batch, queue.items = queue.items[:self.max_batch], queue.items[self.max_batch:]
+
+            self._encode(model_name, batch)
+
+
+    def _encode(self, model_name: str, batch: list):
+        start = time.perf_counter()
+        waits = [(start - enqueued_at) * 1000 for _, _, enqueued_at in batch]
+        # Identical questions asked at the same time are encoded once
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        try:
+            vectors = np.asarray(embedding_registry.get(model_name).embed_documents(texts), dtype=np.float32)
+        except Exception as e:
+            logger.error(f"Batched query embedding of {len(texts)} texts failed: {e}")
+            with self._stats_lock:
+                self.failed += len(batch)
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        rows = {text: row for row, text in enumerate(texts)}
+        self._record(waits, time.perf_counter() - start, len(texts))
+        for text, future, _ in batch:
+            future.set_result(vectors[rows[text]].copy())
+
+
+    def _record(self, waits: list, forward_seconds: float, encoded: int = 1):
+        with self._stats_lock:
+            self.batches += 1
+            self.items += len(waits)
+            self.forward_seconds += forward_seconds
+            self.batch_sizes.observe(encoded)
+            for wait in waits:
+                self.queue_wait_ms.observe(wait)
+
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.window_ms,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "items": self.items,
+            "failed": self.failed,
+            "avg_batch_size": round(self.items / self.batches, 4) if self.batches else 0.0,
+            "forward_seconds": round(self.forward_seconds, 4),
+            "batch_size": self.batch_sizes.stats(),
+            "queue_wait_ms": self.queue_wait_ms.stats(),
+        }
+
+
+embedding_batcher = EmbeddingBatcher()
@@ -0,0 +1,298 @@
+import os
+import time
+import uuid
+import fcntl
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from logger import logger
+from utils.embeddings import embedding_registry, DEFAULT_EMBEDDING_MODEL
+
+DEFAULT_PATH = "cache/review_embeddings"
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+INDEX_FILE = "index.sqlite3"
+# SQLite limits the number of bound parameters of one statement
+QUERY_CHUNK = 900
+
+
+def _chunks(items: list, size: int = QUERY_CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class EmbeddingStore:
+    """Persistent, content-addressed store of review embeddings on local disk.
+
+    A vector is keyed by a hash of the model, the embedding backend and the
+    text, so a review is embedded once however many indexes it goes into.
+    Vectors are written to immutable float32 shard files, one per call,
+    read back through memory maps. A SQLite index maps each key to its shard
+    and row, and records when the vector was last used. Several worker
+    processes can share one store.
+
+    Once the shards exceed `max_bytes`, the least recently used vectors are
+    dropped from the index. Compaction then rewrites shards that are mostly
+    dead, and merges small shards once there are more than `max_shards`.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes: int = DEFAULT_MAX_BYTES,
+                 shard_rows: int = 65536, max_shards: int = 256):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.shard_rows = shard_rows
+        self.max_shards = max_shards
+        self._connection = None
+        self._shards = {}
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset)
+
+
+    def configure(self, path, max_bytes: int):
+        with self._lock:
+            self._close()
+            self.path = Path(path)
+            self.max_bytes = max_bytes
+
+
+    def _reset(self):
+        # An SQLite connection must not be shared with a forked child
+        self._connection = None
+        self._shards = {}
+        self._lock = threading.Lock()
+
+
+    def _close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        self._shards = {}
+
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.path / INDEX_FILE, timeout=30, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS shards (
+                                        name TEXT PRIMARY KEY,
+                                        rows INTEGER,
+                                        dim INTEGER,
+                                        created_at REAL
+                                        )""")
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS vectors (
+                                        key BLOB PRIMARY KEY,
+                                        shard TEXT,
+                                        row INTEGER,
+                                        last_used REAL
+                                        )""")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS vectors_shard ON vectors (shard)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS vectors_last_used ON vectors (last_used)")
+            # Counters live in the index so hits in worker processes are reported by the API
+            self._connection.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+            self._connection.executemany("INSERT OR IGNORE INTO counters VALUES (?, 0)",
+                                         [("hits",), ("misses",), ("evictions",), ("compactions",)])
+            self._connection.commit()
+        return self._connection
+
+
+    def _key(self, model_id: str, text: str) -> bytes:
+        return hashlib.blake2b(f"{model_id}\0{text}".encode(), digest_size=16).digest()
+
+
+    def _shard(self, name: str, rows: int, dim: int) -> np.memmap:
+        shard = self._shards.get(name)
+        if shard is None:
+            shard = self._shards[name] = np.memmap(self.path / f"{name}.f32", dtype=np.float32,
+                                                   mode="r", shape=(rows, dim))
+        return shard
+
+
+    def _write_shard(self, connection: sqlite3.Connection, vectors: np.ndarray) -> str:
+        name = f"shard-{uuid.uuid4().hex}"
+        tmp_path = self.path / f".tmp-{name}.f32"
+        with open(tmp_path, "wb") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        os.replace(tmp_path, self.path / f"{name}.f32")
+        connection.execute("INSERT INTO shards VALUES (?, ?, ?, ?)", (name, len(vectors), vectors.shape[1], time.time()))
+        return name
+
+
+    def _count(self, connection: sqlite3.Connection, name: str, value: int):
+        if value:
+            connection.execute("UPDATE counters SET value = value + ? WHERE name = ?", (value, name))
+
+
+    def get(self, keys: list) -> dict:
+        """Vectors of the keys found in the store, refreshing their last use."""
+        found = {}
+        with self._lock:
+            connection = self._connect()
+            rows = []
+            for chunk in _chunks(keys):
+                rows += connection.execute(
+                    f"""SELECT v.key, v.shard, v.row, s.rows, s.dim FROM vectors v JOIN shards s ON v.shard = s.name
+                        WHERE v.key IN ({', '.join('?' * len(chunk))})""", chunk,
+                ).fetchall()
+
+            by_shard = {}
+            for key, shard, row, shard_rows, dim in rows:
+                by_shard.setdefault((shard, shard_rows, dim), []).append((key, row))
+            for (shard, shard_rows, dim), entries in by_shard.items():
+                try:
+                    vectors = self._shard(shard, shard_rows, dim)[[row for _, row in entries]]
+                except OSError:
+                    # Compacted away by another process since the lookup, embedded again
+                    continue
+                found.update((key, vector) for (key, _), vector in zip(entries, vectors))
+
+            now = time.time()
+            for chunk in _chunks(list(found)):
+                connection.execute(f"UPDATE vectors SET last_used = ? WHERE key IN ({', '.join('?' * len(chunk))})",
+                                   [now, *chunk])
+            connection.commit()
+        return found
+
+
+    def put(self, keys: list, vectors: np.ndarray):
+        with self._lock:
+            connection = self._connect()
+            name = self._write_shard(connection, vectors)
+            now = time.time()
+            connection.executemany("INSERT OR REPLACE INTO vectors VALUES (?, ?, ?, ?)",
+                                   [(key, name, row, now) for row, key in enumerate(keys)])
+            connection.commit()
+            shards = connection.execute("SELECT COUNT(*) FROM shards").fetchone()[0]
+
+        if self.total_bytes() > self.max_bytes or shards > self.max_shards:
+            self.evict()
+            self.compact()
+
+
+    def embed(self, texts: list, model_name: str = DEFAULT_EMBEDDING_MODEL) -> np.ndarray:
+        """Embeddings of `texts`, encoding only the ones not in the store yet."""
+        model_id = f"{model_name}:{embedding_registry.backend}"
+        keys = [self._key(model_id, text) for text in texts]
+        found = self.get(list(dict.fromkeys(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        if missing:
+            encoded = np.asarray(embedding_registry.get(model_name).embed_documents(list(missing.values())),
+                                 dtype=np.float32)
+            self.put(list(missing), encoded)
+            found.update(zip(missing, encoded))
+
+        with self._lock:
+            connection = self._connect()
+            self._count(connection, "hits", len(texts) - len(missing))
+            self._count(connection, "misses", len(missing))
+            connection.commit()
+
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            total = self._connect().execute("SELECT SUM(rows * dim * 4) FROM shards").fetchone()[0]
+        return total or 0
+
+
+    def evict(self):
+        """Drop the least recently used vectors until the live ones fit in 90% of `max_bytes`."""
+        with self._lock:
+            connection = self._connect()
+            live_bytes, row_bytes = connection.execute(
+                "SELECT SUM(s.dim * 4), MAX(s.dim * 4) FROM vectors v JOIN shards s ON v.shard = s.name"
+            ).fetchone()
+            excess = (live_bytes or 0) - int(self.max_bytes * 0.9)
+            if excess <= 0:
+                return
+            evicted = -(-excess // row_bytes)
+            connection.execute("DELETE FROM vectors WHERE key IN (SELECT key FROM vectors ORDER BY last_used LIMIT ?)",
+                               (evicted,))
+            self._count(connection, "evictions", evicted)
+            connection.commit()
+        logger.info(f"Embedding store evicted {evicted} vectors")
+
+
+    def compact(self, live_ratio: float = 0.5):
+        """Rewrite mostly dead shards, and small shards once there are too many, into full ones."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / ".compact.lock", "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # Another process is compacting
+
+            with self._lock:
+                connection = self._connect()
+                shards = connection.execute(
+                    """SELECT s.name, s.rows, s.dim, COUNT(v.key) FROM shards s
+                       LEFT JOIN vectors v ON v.shard = s.name GROUP BY s.name"""
+                ).fetchall()
+                merge_small = len(shards) > self.max_shards
+                candidates = [(name, rows, dim) for name, rows, dim, live in shards
+                              if live < live_ratio * rows or (merge_small and rows < self.shard_rows)]
+                if not candidates:
+                    return
+
+                # Shards of different dimensions (models) are rewritten separately
+                for dim in {dim for _, _, dim in candidates}:
+                    keys, vectors = [], []
+                    for name, rows, shard_dim in candidates:
+                        if shard_dim != dim:
+                            continue
+                        live = connection.execute("SELECT key, row FROM vectors WHERE shard = ? ORDER BY row",
+                                                  (name,)).fetchall()
+                        if live:
+                            keys += [key for key, _ in live]
+                            vectors.append(self._shard(name, rows, dim)[[row for _, row in live]])
+                    vectors = np.concatenate(vectors) if vectors else np.empty((0, dim), dtype=np.float32)
+
+                    for start in range(0, len(keys), self.shard_rows):
+                        name = self._write_shard(connection, vectors[start:start + self.shard_rows])
+                        connection.executemany("UPDATE vectors SET shard = ?, row = ? WHERE key = ?",
+                                               [(name, row, key) for row, key in
+                                                enumerate(keys[start:start + self.shard_rows])])
+
+                removed = [name for name, _, _ in candidates]
+                connection.executemany("DELETE FROM shards WHERE name = ?", [(name,) for name in removed])
+                self._count(connection, "compactions", 1)
+                connection.commit()
+
+                # Readers that already mapped a removed shard keep reading it until they drop the map
+                for name in removed:
+                    self._shards.pop(name, None)
+                    (self.path / f"{name}.f32").unlink(missing_ok=True)
+        logger.info(f"Embedding store compacted {len(removed)} shards")
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            connection = self._connect()
+            counters = dict(connection.execute("SELECT name, value FROM counters").fetchall())
+            entries = connection.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+            shards, total_bytes = connection.execute("SELECT COUNT(*), SUM(rows * dim * 4) FROM shards").fetchone()
+        requests = counters["hits"] + counters["misses"]
+        return {
+            "entries": entries,
+            "shards": shards,
+            "total_bytes": total_bytes or 0,
+            "max_bytes": self.max_bytes,
+            "hits": counters["hits"],
+            "misses": counters["misses"],
+            "hit_ratio": round(counters["hits"] / requests, 4) if requests else 0.0,
+            "evictions": counters["evictions"],
+            "compactions": counters["compactions"],
+        }
+
+
+embedding_store = EmbeddingStore()
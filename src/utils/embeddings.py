@@ -0,0 +1,124 @@
+import os
+import time
+import resource
+import threading
+
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from logger import logger
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_BACKENDS = ("torch", "onnx-int8")
+DEFAULT_ONNX_DIR = "artifact/onnx"
+
+
+def _rss_bytes() -> int:
+    """Current resident set size of the process in bytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is reported in KB on Linux, it is the peak and not the current RSS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _parameter_bytes(embeddings: Embeddings) -> int:
+    if hasattr(embeddings, "model_bytes"):
+        return embeddings.model_bytes
+    try:
+        return sum(p.numel() * p.element_size() for p in embeddings.client.parameters())
+    except Exception:
+        return 0
+
+
+class EmbeddingRegistry:
+    """Process-wide registry of embedding models.
+
+    Each model is loaded once, shared by every node and pipeline stage, and
+    guarded by a lock so concurrent first callers don't load it twice. The
+    `torch` backend runs the model with PyTorch in fp32, `onnx-int8` runs an
+    int8-quantized ONNX export of it, exported to `onnx_dir` on first use.
+    """
+
+    def __init__(self, backend: str = "torch", onnx_dir=DEFAULT_ONNX_DIR):
+        self._models = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self.configure(backend, onnx_dir)
+
+
+    def configure(self, backend: str, onnx_dir=DEFAULT_ONNX_DIR):
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend {backend}, expected one of {EMBEDDING_BACKENDS}")
+        with self._lock:
+            if backend != getattr(self, "backend", backend):
+                # Models loaded with the previous backend are reloaded on next use
+                self._models, self._stats = {}, {}
+            self.backend = backend
+            self.onnx_dir = onnx_dir
+
+
+    def get(self, model_name: str = DEFAULT_EMBEDDING_MODEL) -> Embeddings:
+        model = self._models.get(model_name)
+        if model is not None:
+            return model
+
+        with self._lock:
+            if model_name not in self._models:
+                self._models[model_name] = self._load(model_name)
+            return self._models[model_name]
+
+
+    def _load(self, model_name: str) -> Embeddings:
+        logger.info(f"Loading embedding model: {model_name} ({self.backend})")
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+
+        if self.backend == "onnx-int8":
+            from utils.onnx_embeddings import OnnxEmbeddings
+            model = OnnxEmbeddings(model_name, self.onnx_dir)
+        else:
+            model = HuggingFaceEmbeddings(model_name=model_name)
+
+        load_seconds = time.perf_counter() - start
+        self._stats[model_name] = {
+            "backend": self.backend,
+            "dimension": None,
+            "load_seconds": round(load_seconds, 4),
+            "warmup_seconds": None,
+            "rss_delta_bytes": max(_rss_bytes() - rss_before, 0),
+            "parameter_bytes": _parameter_bytes(model),
+        }
+        logger.info(f"Embedding model {model_name} loaded in {load_seconds:.2f}s")
+        return model
+
+
+    def warmup(self, model_names: list):
+        """Load every model and run a dummy encode so the first request doesn't pay for it."""
+        for model_name in model_names:
+            model = self.get(model_name)
+            start = time.perf_counter()
+            vector = model.embed_query("warmup")
+            self._stats[model_name]["warmup_seconds"] = round(time.perf_counter() - start, 4)
+            self._stats[model_name]["dimension"] = len(vector)
+            logger.info(f"Embedding model {model_name} warmed up")
+
+
+    def dimension(self, model_name: str = DEFAULT_EMBEDDING_MODEL) -> int:
+        dimension = self._stats.get(model_name, {}).get("dimension")
+        if dimension is None:
+            self.warmup([model_name])
+            dimension = self._stats[model_name]["dimension"]
+        return dimension
+
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "models": {name: dict(stat) for name, stat in self._stats.items()},
+            "process_rss_bytes": _rss_bytes(),
+        }
+
+
+embedding_registry = EmbeddingRegistry()
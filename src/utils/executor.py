@@ -0,0 +1,128 @@
+import asyncio
+import threading
+import multiprocessing
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from logger import logger
+
+
+class PoolMetrics:
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+
+    def start(self):
+        with self._lock:
+            self.submitted += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+
+    def finish(self, failed: bool):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+            self.failed += int(failed)
+
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "in_flight": self.in_flight,
+            "queue_depth": max(self.in_flight - self.max_workers, 0),
+            "max_in_flight": self.max_in_flight,
+        }
+
+
+class ExecutionLayer:
+    """Runs blocking work off the event loop.
+
+    I/O-bound work (DB queries, file writes) goes to a bounded thread pool,
+    CPU-bound work (embedding, index builds) to a process pool. With
+    `cpu_workers=0` CPU work falls back to the thread pool.
+    """
+
+    def __init__(self, io_workers: int = 16, cpu_workers: int = 0, start_method: str = "spawn"):
+        self._io_pool = None
+        self._cpu_pool = None
+        self.configure(io_workers, cpu_workers, start_method)
+
+
+    def configure(self, io_workers: int, cpu_workers: int, start_method: str = "spawn",
+                  initializer=None, initargs=()):
+        self.shutdown()
+        self.io_workers = io_workers
+        self.cpu_workers = cpu_workers
+        self.start_method = start_method
+        self.initializer = initializer
+        self.initargs = initargs
+        self.io_metrics = PoolMetrics(io_workers)
+        self.cpu_metrics = PoolMetrics(cpu_workers or io_workers)
+
+
+    @property
+    def io_pool(self) -> ThreadPoolExecutor:
+        if self._io_pool is None:
+            self._io_pool = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="verta-io")
+        return self._io_pool
+
+
+    @property
+    def cpu_pool(self):
+        if self.cpu_workers <= 0:
+            return self.io_pool
+        if self._cpu_pool is None:
+            self._cpu_pool = ProcessPoolExecutor(
+                max_workers=self.cpu_workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+                initializer=self.initializer,
+                initargs=self.initargs,
+            )
+            logger.info(f"Started CPU process pool with {self.cpu_workers} workers")
+        return self._cpu_pool
+
+
+    async def _run(self, pool, metrics: PoolMetrics, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        metrics.start()
+        failed = True
+        try:
+            result = await loop.run_in_executor(pool, partial(fn, *args, **kwargs))
+            failed = False
+            return result
+        finally:
+            metrics.finish(failed)
+
+
+    async def run_io(self, fn, *args, **kwargs):
+        return await self._run(self.io_pool, self.io_metrics, fn, *args, **kwargs)
+
+
+    async def run_cpu(self, fn, *args, **kwargs):
+        return await self._run(self.cpu_pool, self.cpu_metrics, fn, *args, **kwargs)
+
+
+    def shutdown(self):
+        if self._cpu_pool is not None:
+            self._cpu_pool.shutdown(wait=False, cancel_futures=True)
+            self._cpu_pool = None
+        if self._io_pool is not None:
+            self._io_pool.shutdown(wait=False, cancel_futures=True)
+            self._io_pool = None
+
+
+    def stats(self) -> dict:
+        return {"io": self.io_metrics.stats(), "cpu": self.cpu_metrics.stats()}
+
+
+execution_layer = ExecutionLayer()
@@ -0,0 +1,137 @@
+import re
+import json
+import uuid
+import hashlib
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from langchain_community.vectorstores import FAISS
+
+from logger import logger
+from utils.embeddings import embedding_registry
+from utils.embedding_store import embedding_store
+
+STATE_FILE = "incremental.json"
+# Review timestamps are TEXT like '2019-10-30 18:35:35.344', the SQL delta query uses the same pattern
+TIMESTAMP_PATTERN = re.compile(r"^[0-9]{4}-[0-9]{2}-[0-9]{2}")
+
+
+def review_key(asin, timestamp, text: str) -> str:
+    """Identity of a review row, the database computes the same key with md5(text)."""
+    return f"{asin}:{timestamp}:{hashlib.md5(text.encode()).hexdigest()}"
+
+
+def document_key(doc) -> str:
+    return review_key(doc.metadata.get("asin"), doc.metadata.get("timestamp"), doc.page_content)
+
+
+def parse_timestamp(value) -> Optional[datetime]:
+    """Parse a review timestamp or watermark, None when it is not a date.
+
+    Reviews without a parsable timestamp never move the watermark, and the
+    delta query always returns them, their keys tell whether they are indexed.
+    """
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str) or not TIMESTAMP_PATTERN.match(value.strip()):
+        return None
+    try:
+        return datetime.fromisoformat(value.strip())
+    except ValueError:
+        return None
+
+
+def watermark(timestamps, current=None) -> Optional[str]:
+    """Latest of the parsable timestamps and the current watermark, as a string for the state file."""
+    parsed = [ts for ts in map(parse_timestamp, [current, *timestamps]) if ts is not None]
+    return max(parsed).isoformat(sep=" ") if parsed else None
+
+
+def load_state(index_path) -> Optional[dict]:
+    """Watermark, review keys and tombstones of an index, None for indexes built before they were tracked."""
+    state_path = Path(index_path) / STATE_FILE
+    if not state_path.exists():
+        return None
+    with open(state_path, "r") as f:
+        return json.load(f)
+
+
+def save_state(index_path, state: dict):
+    with open(Path(index_path) / STATE_FILE, "w") as f:
+        json.dump(state, f)
+
+
+def new_state(review_docs: list, ids: list) -> dict:
+    return {
+        "watermark": watermark(doc.metadata.get("timestamp") for doc in review_docs),
+        "keys": {document_key(doc): id_ for doc, id_ in zip(review_docs, ids)},
+        "tombstones": [],
+    }
+
+
+def tombstone_count(index_path) -> int:
+    state = load_state(index_path)
+    return len(state["tombstones"]) if state else 0
+
+
+def is_live(metadata: dict) -> bool:
+    return not metadata.get("deleted")
+
+
+def add_documents(vectordb: FAISS, state: dict, review_docs: list, model_name: str) -> int:
+    """Embed and add reviews not in the index yet, moving the watermark forward."""
+    new_docs = list({document_key(doc): doc for doc in review_docs if document_key(doc) not in state["keys"]}.values())
+    if not new_docs:
+        return 0
+
+    texts = [doc.page_content for doc in new_docs]
+    ids = [str(uuid.uuid4()) for _ in new_docs]
+    vectordb.add_embeddings(list(zip(texts, embedding_store.embed(texts, model_name))),
+                            metadatas=[doc.metadata for doc in new_docs], ids=ids)
+    state["keys"].update((document_key(doc), id_) for doc, id_ in zip(new_docs, ids))
+    state["watermark"] = watermark((doc.metadata.get("timestamp") for doc in new_docs), state["watermark"])
+    return len(new_docs)
+
+
+def tombstone(vectordb: FAISS, state: dict, live_keys: set) -> int:
+    """Hide reviews no longer in the database, their rows stay in the index until compaction."""
+    deleted = [key for key in state["keys"] if key not in live_keys]
+    for key in deleted:
+        id_ = state["keys"].pop(key)
+        doc = vectordb.docstore.search(id_)
+        doc.metadata["deleted"] = True
+        state["tombstones"].append(id_)
+    return len(deleted)
+
+
+def compact(vectordb: FAISS, state: dict, ratio: float) -> bool:
+    """Physically remove tombstoned rows once they exceed `ratio` of the index, without re-embedding."""
+    if not state["tombstones"] or len(state["tombstones"]) <= ratio * vectordb.index.ntotal:
+        return False
+    vectordb.delete(state["tombstones"])
+    state["tombstones"] = []
+    return True
+
+
+def update_index(source_path, target_path, review_docs: list, live_keys: Optional[set], model_name: str,
+                 compact_ratio: float = 0.2) -> dict:
+    """Apply new and deleted reviews to the index at `source_path` and save the result at `target_path`.
+
+    Runs inside a worker process. Only reviews missing from the index are
+    embedded. The source index is left untouched, so readers keep using it
+    until the caller publishes `target_path`.
+    """
+    source_path = Path(source_path).resolve()
+    vectordb = FAISS.load_local(str(source_path), embedding_registry.get(model_name),
+                                allow_dangerous_deserialization=True)
+    state = load_state(source_path)
+
+    added = add_documents(vectordb, state, review_docs, model_name)
+    deleted = tombstone(vectordb, state, live_keys) if live_keys is not None else 0
+    compacted = compact(vectordb, state, compact_ratio)
+
+    vectordb.save_local(str(target_path))
+    save_state(target_path, state)
+    logger.info(f"Index {source_path.name} updated: {added} reviews added, {deleted} deleted, compacted: {compacted}")
+    return {"added": added, "deleted": deleted, "compacted": compacted, "rows": vectordb.index.ntotal}
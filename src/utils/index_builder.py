@@ -0,0 +1,55 @@
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+from langchain_community.vectorstores import FAISS
+
+from utils.embeddings import embedding_registry
+from utils.embedding_store import embedding_store
+from utils.incremental_index import new_state, save_state
+
+
+def init_worker(model_name: str, backend: str = "torch", onnx_dir=None, store_path=None, store_max_bytes=None):
+    """Process pool initializer, loads the embedding model once per worker."""
+    embedding_registry.configure(backend, onnx_dir or embedding_registry.onnx_dir)
+    if store_path is not None:
+        embedding_store.configure(store_path, store_max_bytes)
+    embedding_registry.get(model_name)
+
+
+def build_vector_store(review_docs: list, model_name: str, query_embeddings=None, ids=None) -> FAISS:
+    """FAISS index of the review documents, reviews already in the embedding store are not encoded again."""
+    texts = [doc.page_content for doc in review_docs]
+    vectors = embedding_store.embed(texts, model_name)
+    return FAISS.from_embeddings(
+        text_embeddings=list(zip(texts, vectors)),
+        embedding=query_embeddings or embedding_registry.get(model_name),
+        metadatas=[doc.metadata for doc in review_docs],
+        ids=ids,
+    )
+
+
+def build_index(review_docs: list, path, model_name: str) -> str:
+    """Embed the review documents and save the FAISS index at `path`.
+
+    Runs inside a worker process, the index is handed back through the
+    filesystem rather than pickled back to the caller. The watermark and
+    review keys saved with it allow later incremental updates.
+    """
+    ids = [str(uuid.uuid4()) for _ in review_docs]
+    vectordb = build_vector_store(review_docs, model_name, ids=ids)
+    vectordb.save_local(path)
+    save_state(path, new_state(review_docs, ids))
+    return str(Path(path))
+
+
+def embed_reviews(texts: list, model_name: str) -> np.ndarray:
+    """Embed review texts inside a worker process through the embedding store, for the catalog index."""
+    return embedding_store.embed(texts, model_name)
+
+
+def embed_documents(texts: list, model_name: str) -> np.ndarray:
+    """Embed texts inside a worker process, for batched queries."""
+    embeddings = embedding_registry.get(model_name)
+    return np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
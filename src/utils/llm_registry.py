@@ -0,0 +1,174 @@
+import time
+import threading
+from typing import Any
+from uuid import UUID
+
+import httpx
+from langchain_groq import ChatGroq
+from langchain_openai import ChatOpenAI
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+
+from logger import logger
+from entity.config_entity import LLMConfig
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class LLMMetrics(BaseCallbackHandler):
+    """Callback recording in-flight calls and latency of one model."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.latency_seconds_total = 0.0
+        self.latency_seconds_max = 0.0
+        self._started = {}
+        self._lock = threading.Lock()
+
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any):
+        with self._lock:
+            self._started[run_id] = time.perf_counter()
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+
+    def _finish(self, run_id: UUID, error: bool):
+        with self._lock:
+            start = self._started.pop(run_id, None)
+            if start is None:
+                return
+            latency = time.perf_counter() - start
+            self.in_flight -= 1
+            self.calls += 1
+            self.errors += int(error)
+            self.latency_seconds_total += latency
+            self.latency_seconds_max = max(self.latency_seconds_max, latency)
+
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        self._finish(run_id, error=False)
+
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._finish(run_id, error=True)
+
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "latency_avg_seconds": round(self.latency_seconds_total / self.calls, 4) if self.calls else 0.0,
+            "latency_max_seconds": round(self.latency_seconds_max, 4),
+        }
+
+
+class LLMRegistry:
+    """Process-wide registry of chat model clients.
+
+    One client is created per (provider, model, params) and reused by every
+    node. All clients share one sync and one async httpx pool, so connections
+    to the providers are kept alive across requests instead of being set up
+    per call.
+    """
+
+    def __init__(self):
+        self._config = None
+        self._clients = {}
+        self._metrics = {}
+        self._http_client = None
+        self._http_async_client = None
+        self._lock = threading.Lock()
+
+
+    def configure(self, config: LLMConfig):
+        self._config = config
+
+
+    def _load_config(self) -> LLMConfig:
+        if self._config is None:
+            from config.configuration import ConfigurationManager
+            self.configure(ConfigurationManager().get_llm_config())
+        return self._config
+
+
+    def _http_options(self) -> dict:
+        config = self._load_config()
+        return dict(
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive_connections,
+                keepalive_expiry=config.keepalive_expiry_seconds,
+            ),
+            timeout=httpx.Timeout(config.timeout_seconds, connect=config.connect_timeout_seconds),
+            http2=config.http2 and HTTP2_AVAILABLE,
+        )
+
+
+    @staticmethod
+    def provider(model: str) -> str:
+        return "openai" if 'gpt' in model else "groq"
+
+
+    def get(self, model: str, **params) -> BaseChatModel:
+        key = (self.provider(model), model, tuple(sorted(params.items())))
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = self._create(*key[:2], params)
+            return self._clients[key]
+
+
+    def _create(self, provider: str, model: str, params: dict) -> BaseChatModel:
+        if self._http_client is None:
+            options = self._http_options()
+            self._http_client = httpx.Client(**options)
+            self._http_async_client = httpx.AsyncClient(**options)
+            logger.info(f"LLM HTTP pools created with http2={options['http2']}")
+
+        metrics = self._metrics.setdefault(model, LLMMetrics(model))
+        client_options = dict(
+            model_name=model,
+            http_client=self._http_client,
+            http_async_client=self._http_async_client,
+            callbacks=[metrics],
+            **params,
+        )
+        logger.info(f"Creating {provider} client for model: {model}")
+        if provider == "openai":
+            return ChatOpenAI(**client_options)
+        return ChatGroq(**client_options)
+
+
+    async def aclose(self):
+        with self._lock:
+            http_client, http_async_client = self._http_client, self._http_async_client
+            self._clients, self._http_client, self._http_async_client = {}, None, None
+        if http_client is not None:
+            http_client.close()
+        if http_async_client is not None:
+            await http_async_client.aclose()
+
+
+    def stats(self) -> dict:
+        return {
+            "clients": len(self._clients),
+            "http2": bool(self._config and self._config.http2 and HTTP2_AVAILABLE),
+            "models": {model: metrics.stats() for model, metrics in self._metrics.items()},
+        }
+
+
+llm_registry = LLMRegistry()
@@ -0,0 +1,116 @@
+import os
+import json
+import hashlib
+import threading
+from dataclasses import dataclass, fields
+from collections import OrderedDict
+
+import pyarrow.parquet as pq
+
+from logger import logger
+
+DEFAULT_MAX_ENTRIES = 1024
+
+
+@dataclass(frozen=True, slots=True)
+class ProductMetadata:
+    """Metadata of one product together with its rendered metadata prompt and content hash."""
+
+    parent_asin: str
+    main_category: str
+    title: str
+    average_rating: str
+    rating_number: str
+    features: str
+    description: str
+    price: str
+    store: str
+    categories: str
+    details: str
+    prompt: str
+    content_hash: str
+
+
+    @classmethod
+    def from_row(cls, row: dict, prompt: str) -> "ProductMetadata":
+        values = {field.name: str(row.get(field.name)) for field in fields(cls)
+                  if field.name not in ("prompt", "content_hash")}
+        content_hash = hashlib.sha256(json.dumps(values, sort_keys=True).encode()).hexdigest()[:16]
+
+        # Rendered once here instead of on every question, braces are escaped for the chat template
+        rendered = prompt.format(**dict(values, details=values["details"].replace('{', '[')))
+        rendered = rendered.replace('{', '{{').replace('}', '}}')
+        return cls(**values, prompt=rendered, content_hash=content_hash)
+
+
+    @classmethod
+    def from_frame(cls, meta_df, prompt: str) -> "ProductMetadata":
+        return cls.from_row(meta_df.iloc[0].to_dict(), prompt)
+
+
+class MetadataStore:
+    """Bounded LRU cache of product metadata records loaded from Parquet files.
+
+    Entries are keyed by file path and prompt, and validated against the
+    file mtime so rewritten metadata is reloaded on next access.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def configure(self, max_entries: int):
+        with self._lock:
+            self.max_entries = max_entries
+            self._evict()
+
+
+    def load(self, path, prompt: str) -> ProductMetadata:
+        path = str(path)
+        key = (path, hash(prompt))
+        mtime = os.path.getmtime(path)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == mtime:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        rows = pq.read_table(path).to_pylist()
+        record = ProductMetadata.from_row(rows[0], prompt)
+
+        with self._lock:
+            self._entries[key] = (mtime, record)
+            self._entries.move_to_end(key)
+            self._evict()
+
+        return record
+
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            key, _ = self._entries.popitem(last=False)
+            self.evictions += 1
+            logger.info(f"Metadata cache evicted: {key[0]}")
+
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / requests, 4) if requests else 0.0,
+        }
+
+
+metadata_store = MetadataStore()
@@ -0,0 +1,133 @@
+import json
+from pathlib import Path
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from logger import logger
+
+MODEL_FILE = "model-int8.onnx"
+CONFIG_FILE = "embedding.json"
+POOLING_MODES = ("mean", "cls")
+
+
+def export_int8(model_name: str, output_dir) -> Path:
+    """Export a sentence-transformers model to ONNX and quantize its weights to int8.
+
+    The tokenizer and the pooling settings are saved next to the model, so
+    serving only needs onnxruntime and the tokenizer, not PyTorch.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer, pooling = model[0], model[1]
+
+    pooling_mode = pooling.get_pooling_mode_str()
+    if pooling_mode not in POOLING_MODES:
+        raise ValueError(f"Unsupported pooling mode {pooling_mode} for {model_name}, expected one of {POOLING_MODES}")
+
+    tokenizer = transformer.tokenizer
+    inputs = tokenizer(["export"], return_tensors="pt")
+    input_names = list(inputs.keys())
+    fp32_path = output_dir / "model-fp32.onnx"
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    auto_model = transformer.auto_model.eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            auto_model,
+            args=tuple(inputs[name] for name in input_names),
+            f=str(fp32_path),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+
+    model_path = output_dir / MODEL_FILE
+    quantize_dynamic(str(fp32_path), str(model_path), weight_type=QuantType.QInt8)
+    fp32_path.unlink()
+    tokenizer.save_pretrained(output_dir)
+
+    with open(output_dir / CONFIG_FILE, "w") as f:
+        json.dump({
+            "model_name": model_name,
+            "dimension": model.get_sentence_embedding_dimension(),
+            "max_seq_length": model.max_seq_length,
+            "pooling": pooling_mode,
+            "normalize": any(isinstance(module, Normalize) for module in model),
+        }, f, indent=2)
+    logger.info(f"Exported {model_name} to {model_path} with int8 weights")
+    return model_path
+
+
+class OnnxEmbeddings(Embeddings):
+    """Sentence embeddings from an int8-quantized ONNX export of the model, run by onnxruntime.
+
+    Pooling and normalization replicate the sentence-transformers pipeline,
+    so vectors have the same dimension as the PyTorch model and can be
+    searched against indexes built with it.
+    """
+
+    def __init__(self, model_name: str, model_dir, batch_size: int = 32):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        model_dir = Path(model_dir) / model_name.replace("/", "--")
+        if not (model_dir / MODEL_FILE).exists():
+            export_int8(model_name, model_dir)
+
+        with open(model_dir / CONFIG_FILE, "r") as f:
+            self.config = json.load(f)
+        self.model_name = model_name
+        self.model_path = model_dir / MODEL_FILE
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = onnxruntime.InferenceSession(str(self.model_path), providers=["CPUExecutionProvider"])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+
+
+    @property
+    def dimension(self) -> int:
+        return self.config["dimension"]
+
+
+    @property
+    def model_bytes(self) -> int:
+        return self.model_path.stat().st_size
+
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        inputs = self.tokenizer(texts, padding=True, truncation=True,
+                                max_length=self.config["max_seq_length"], return_tensors="np")
+        hidden = self.session.run(None, {name: value for name, value in inputs.items() if name in self.input_names})[0]
+
+        if self.config["pooling"] == "cls":
+            vectors = hidden[:, 0]
+        else:
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        if self.config["normalize"]:
+            vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors.astype(np.float32)
+
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = [text.replace("\n", " ") for text in texts]
+        if not texts:
+            return []
+        return np.concatenate([
+            self._encode(texts[start:start + self.batch_size]) for start in range(0, len(texts), self.batch_size)
+        ]).tolist()
+
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
@@ -0,0 +1,99 @@
+import os
+import json
+import threading
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from logger import logger
+
+
+class PrebuiltArtifact(NamedTuple):
+    index_path: Path
+    metadata_path: Path
+    version: str
+
+
+class PrebuiltIndexes:
+    """Product indexes prebuilt offline by the data pipeline, listed in a manifest.
+
+    The manifest is re-read whenever its mtime changes, so a new pipeline run
+    is picked up without a restart. A manifest built with a different
+    embedding model than the one used for queries is ignored.
+    """
+
+    def __init__(self, manifest_path, embedding_model: str):
+        self.manifest_path = Path(manifest_path) if manifest_path else None
+        self.embedding_model = embedding_model
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._products = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+
+    def refresh(self):
+        if self.manifest_path is None or not self.manifest_path.exists():
+            return
+
+        mtime = self.manifest_path.stat().st_mtime
+        if mtime == self._mtime:
+            return
+
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            self._mtime = mtime
+            try:
+                with open(self.manifest_path, "r") as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Error reading prebuilt manifest {self.manifest_path}: {e}")
+                return
+
+            if manifest.get("embedding_model") != self.embedding_model:
+                logger.warning(
+                    f"Prebuilt manifest uses {manifest.get('embedding_model')}, "
+                    f"expected {self.embedding_model}, ignoring it"
+                )
+                self._products, self.version = {}, None
+                return
+
+            # Artifact paths are relative to the manifest so the directory can be synced anywhere
+            root = self.manifest_path.parent
+            self._products = {
+                asin: PrebuiltArtifact(
+                    index_path=root / entry["index_path"],
+                    metadata_path=root / entry["metadata_path"],
+                    version=entry["version"],
+                )
+                for asin, entry in manifest.get("products", {}).items()
+            }
+            self.version = manifest.get("version")
+            logger.info(f"Loaded prebuilt manifest {self.version} with {len(self._products)} products")
+
+
+    def products(self) -> dict:
+        self.refresh()
+        return dict(self._products)
+
+
+    def get(self, asin: str) -> Optional[PrebuiltArtifact]:
+        self.refresh()
+        artifact = self._products.get(asin)
+        if artifact is None or not os.path.exists(artifact.index_path / "index.faiss"):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return artifact
+
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "version": self.version,
+            "products": len(self._products),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / requests, 4) if requests else 0.0,
+        }
@@ -0,0 +1,211 @@
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, List, NamedTuple, Optional
+
+from langchain.schema import Document
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+from logger import logger
+from utils.query_embeddings import normalize_query
+
+PREFETCH_MODES = ("off", "retrieval", "answer")
+
+
+class Prefetched(NamedTuple):
+    kind: str
+    result: Any
+    created_at: float
+
+
+class PrefetchedRetriever(BaseRetriever):
+    """Returns documents retrieved ahead of time, in place of the product index."""
+
+    documents: List[Document]
+
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.documents
+
+
+class _Session:
+    def __init__(self):
+        self.tasks = {}
+        self.last_active = time.monotonic()
+
+
+class SpeculativePrefetcher:
+    """Background work for the follow-up questions suggested to a session.
+
+    After a response, the top `followups` suggestions are retrieved (mode
+    `retrieval`) or fully answered (mode `answer`) in the background and
+    kept per session for `ttl_seconds`. Speculative work is capped at
+    `max_concurrent` tasks, is not started while more than
+    `foreground_limit` foreground runs are in flight, and running tasks are
+    cancelled when foreground load exceeds it. Sessions idle for
+    `idle_seconds` have their work cancelled and dropped.
+    """
+
+    def __init__(self, mode: str = "off", followups: int = 2, max_concurrent: int = 4,
+                 foreground_limit: int = 8, ttl_seconds: int = 300, idle_seconds: int = 120):
+        self.sessions = {}
+        self.foreground_in_flight = 0
+        self.in_flight = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.cancelled = 0
+        self.expired = 0
+        self.hits = 0
+        self.misses = 0
+        self.configure(mode, followups, max_concurrent, foreground_limit, ttl_seconds, idle_seconds)
+
+
+    def configure(self, mode: str, followups: int, max_concurrent: int,
+                  foreground_limit: int, ttl_seconds: int, idle_seconds: int):
+        if mode not in PREFETCH_MODES:
+            raise ValueError(f"Unknown prefetch mode {mode}, expected one of {PREFETCH_MODES}")
+        self.mode = mode
+        self.followups = followups
+        self.max_concurrent = max_concurrent
+        self.foreground_limit = foreground_limit
+        self.ttl_seconds = ttl_seconds
+        self.idle_seconds = idle_seconds
+
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+
+    def begin_foreground(self):
+        self.foreground_in_flight += 1
+        if self.foreground_in_flight > self.foreground_limit:
+            self.cancel_all()
+
+
+    def end_foreground(self):
+        self.foreground_in_flight -= 1
+
+
+    def schedule(self, session_id: str, questions: list, fetch: Callable[[str], Awaitable[Any]]):
+        """Start speculative work for the suggested questions of a session, within the budget."""
+        if not self.enabled:
+            return
+        session = self.sessions.setdefault(session_id, _Session())
+        session.last_active = time.monotonic()
+
+        for question in [q for q in questions if q.strip()][:self.followups]:
+            key = normalize_query(question)
+            if key in session.tasks:
+                continue
+            if self.in_flight >= self.max_concurrent or self.foreground_in_flight > self.foreground_limit:
+                self.skipped += 1
+                continue
+            # Counted from scheduling, a task cancelled before it starts still releases its slot
+            self.in_flight += 1
+            self.started += 1
+            task = asyncio.create_task(self._run(question, fetch))
+            task.add_done_callback(self._done)
+            session.tasks[key] = task
+
+
+    async def _run(self, question: str, fetch) -> Optional[Prefetched]:
+        try:
+            result = await fetch(question)
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"Speculative prefetch failed for question '{question}': {e}")
+            return None
+        self.completed += 1
+        return Prefetched(self.mode, result, time.monotonic())
+
+
+    def _done(self, task: asyncio.Task):
+        self.in_flight -= 1
+        if task.cancelled():
+            self.cancelled += 1
+
+
+    async def get(self, session_id: str, question: str) -> Optional[Prefetched]:
+        """Prefetched result for a question the session asks, waiting for it if still running."""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        session.last_active = time.monotonic()
+
+        task = session.tasks.pop(normalize_query(question), None)
+        if task is None:
+            self.misses += 1
+            return None
+        try:
+            prefetched = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            prefetched = None
+        if prefetched is None:
+            self.misses += 1
+            return None
+        if time.monotonic() - prefetched.created_at > self.ttl_seconds:
+            self.expired += 1
+            self.misses += 1
+            return None
+        self.hits += 1
+        return prefetched
+
+
+    def cancel_all(self):
+        for session in self.sessions.values():
+            for task in session.tasks.values():
+                task.cancel()
+
+
+    def sweep(self):
+        """Cancel the work of idle sessions and drop expired results."""
+        now = time.monotonic()
+        for session_id, session in list(self.sessions.items()):
+            if now - session.last_active > self.idle_seconds:
+                for task in session.tasks.values():
+                    task.cancel()
+                del self.sessions[session_id]
+                continue
+
+            for key, task in list(session.tasks.items()):
+                if not task.done():
+                    continue
+                prefetched = None if task.cancelled() else task.result()
+                if prefetched is None:
+                    del session.tasks[key]
+                elif now - prefetched.created_at > self.ttl_seconds:
+                    del session.tasks[key]
+                    self.expired += 1
+
+
+    async def run_sweeper(self, interval_seconds: int = 30):
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Error sweeping prefetch sessions: {e}")
+
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "mode": self.mode,
+            "sessions": len(self.sessions),
+            "in_flight": self.in_flight,
+            "started": self.started,
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "cancelled": self.cancelled,
+            "expired": self.expired,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+prefetcher = SpeculativePrefetcher()
@@ -0,0 +1,114 @@
+import threading
+from collections import OrderedDict
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from utils.embeddings import embedding_registry, DEFAULT_EMBEDDING_MODEL
+from utils.embedding_batcher import embedding_batcher
+
+DEFAULT_CAPACITY = 4096
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.split())
+
+
+class _Ring:
+    """Preallocated float32 rows for one model, slots reused in LRU order once full."""
+
+    def __init__(self, capacity: int, dim: int):
+        self.vectors = np.empty((capacity, dim), dtype=np.float32)
+        self.slots = OrderedDict()
+
+
+class QueryEmbeddingCache:
+    """Process-wide LRU cache of query embeddings.
+
+    Keyed by model name and whitespace-normalized text. Vectors live in one
+    preallocated float32 array per model instead of per-entry Python lists,
+    so a cached query costs `dim * 4` bytes plus its key.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._rings = {}
+        self._lock = threading.Lock()
+
+
+    def configure(self, capacity: int):
+        with self._lock:
+            if capacity != self.capacity:
+                self._rings = {}
+            self.capacity = capacity
+
+
+    def embed(self, text: str, model_name: str = DEFAULT_EMBEDDING_MODEL) -> np.ndarray:
+        key = normalize_query(text)
+
+        with self._lock:
+            ring = self._rings.get(model_name)
+            slot = ring.slots.get(key) if ring is not None else None
+            if slot is not None:
+                ring.slots.move_to_end(key)
+                self.hits += 1
+                return ring.vectors[slot].copy()
+            self.misses += 1
+
+        # Misses from concurrent requests share one forward pass
+        vector = embedding_batcher.embed(key, model_name)
+
+        with self._lock:
+            ring = self._rings.get(model_name)
+            if ring is None:
+                ring = self._rings[model_name] = _Ring(self.capacity, vector.shape[0])
+            if key not in ring.slots and self.capacity > 0:
+                if len(ring.slots) < self.capacity:
+                    slot = len(ring.slots)
+                else:
+                    _, slot = ring.slots.popitem(last=False)
+                    self.evictions += 1
+                ring.vectors[slot] = vector
+                ring.slots[key] = slot
+
+        return vector
+
+
+    def wrap(self, model_name: str = DEFAULT_EMBEDDING_MODEL) -> "CachedQueryEmbeddings":
+        return CachedQueryEmbeddings(self, model_name)
+
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "entries": sum(len(ring.slots) for ring in self._rings.values()),
+            "capacity": self.capacity,
+            "bytes": sum(ring.vectors.nbytes for ring in self._rings.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / requests, 4) if requests else 0.0,
+        }
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Embeddings whose `embed_query` goes through the query cache, documents are embedded as usual."""
+
+    def __init__(self, cache: QueryEmbeddingCache, model_name: str):
+        self.cache = cache
+        self.model_name = model_name
+
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return embedding_registry.get(self.model_name).embed_documents(texts)
+
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.cache.embed(text, self.model_name).tolist()
+
+
+query_embedding_cache = QueryEmbeddingCache()
@@ -0,0 +1,161 @@
+import os
+import asyncio
+from typing import Optional
+
+import asyncpg
+import pandas as pd
+from sqlalchemy import text
+
+from logger import logger
+from utils.database import get_credentials, load_database_config
+from utils.incremental_index import parse_timestamp
+
+REVIEW_COLUMNS = ["parent_asin", "asin", "helpful_vote", "timestamp", "verified_purchase", "title", "text"]
+META_COLUMNS = ["parent_asin", "main_category", "title", "average_rating", "rating_number",
+                "features", "description", "price", "store", "categories", "details"]
+
+REVIEW_QUERY = f"SELECT {', '.join(REVIEW_COLUMNS)} FROM userreviews ur WHERE ur.parent_asin = $1"
+META_QUERY = f"SELECT {', '.join(META_COLUMNS)} FROM metadata md WHERE md.parent_asin = $1"
+# Reviews at or after an index watermark, rows already indexed are skipped by their key. Timestamps
+# are TEXT, only values matching incremental_index.TIMESTAMP_PATTERN are cast, the others always match
+REVIEW_DELTA_QUERY = (f"{REVIEW_QUERY} AND CASE WHEN ur.timestamp ~ '^[0-9]{{4}}-[0-9]{{2}}-[0-9]{{2}}' "
+                      "THEN CAST(ur.timestamp AS TIMESTAMP) >= $2 ELSE TRUE END")
+# Identity of every review, same key as incremental_index.review_key but md5 is computed
+# server side so review texts are not transferred
+REVIEW_KEYS_QUERY = "SELECT ur.asin, ur.timestamp, md5(ur.text) FROM userreviews ur WHERE ur.parent_asin = $1 AND ur.text IS NOT NULL"
+
+
+def _sqlalchemy_query(query: str):
+    return text(query.replace("$1", ":asin"))
+
+
+def fetch_reviews(engine, asin: str) -> pd.DataFrame:
+    """Sync lookup of a product's reviews, used by the offline pipeline stages."""
+    with engine.begin() as connection:
+        result = connection.execute(_sqlalchemy_query(REVIEW_QUERY), {"asin": asin})
+        return pd.DataFrame(result.fetchall(), columns=REVIEW_COLUMNS)
+
+
+def fetch_product_data(engine, asin: str):
+    """Sync lookup of a product's reviews and metadata over one connection."""
+    with engine.begin() as connection:
+        review_result = connection.execute(_sqlalchemy_query(REVIEW_QUERY), {"asin": asin})
+        review_df = pd.DataFrame(review_result.fetchall(), columns=REVIEW_COLUMNS)
+
+        meta_result = connection.execute(_sqlalchemy_query(META_QUERY), {"asin": asin})
+        meta_df = pd.DataFrame(meta_result.fetchall(), columns=META_COLUMNS)
+
+    return review_df, meta_df
+
+
+class ProductRepository:
+    """Async access to product reviews and metadata over an asyncpg pool.
+
+    Queries are parameterized and run through asyncpg's statement cache, so
+    they are prepared server-side once per connection. Rows are streamed
+    with a cursor straight into per-column buffers.
+    """
+
+    def __init__(self, prefetch: int = 500):
+        self.prefetch = prefetch
+        self._pool = None
+        self._connector = None
+        self._lock = asyncio.Lock()
+
+
+    async def connect(self) -> asyncpg.Pool:
+        if self._pool is not None:
+            return self._pool
+
+        async with self._lock:
+            if self._pool is None:
+                config = load_database_config()
+                pool_options = dict(
+                    min_size=1,
+                    max_size=config.pool_size + config.max_overflow,
+                    max_inactive_connection_lifetime=config.pool_recycle_seconds,
+                )
+
+                # A plain DSN (e.g. a local Postgres for testing) bypasses the Cloud SQL connector
+                database_url = os.getenv("DATABASE_URL")
+                if database_url:
+                    dsn = database_url.replace("+pg8000", "").replace("+asyncpg", "")
+                    self._pool = await asyncpg.create_pool(dsn, **pool_options)
+                else:
+                    self._pool = await asyncpg.create_pool(connect=await self._cloud_sql_connect(), **pool_options)
+                logger.info("Async database pool created")
+
+        return self._pool
+
+
+    async def _cloud_sql_connect(self):
+        from google.cloud.sql.connector import IPTypes, create_async_connector
+
+        credentials = get_credentials()
+        ip_type = IPTypes.PRIVATE if os.getenv("PRIVATE_IP") else IPTypes.PUBLIC
+        self._connector = await create_async_connector()
+
+        async def getconn(*args, **kwargs) -> asyncpg.Connection:
+            return await self._connector.connect_async(
+                credentials['INSTANCE_CONNECTION_NAME'],
+                "asyncpg",
+                user=credentials['DB_USER'],
+                password=credentials['DB_PASS'],
+                db=credentials['DB_NAME'],
+                ip_type=ip_type,
+            )
+        return getconn
+
+
+    async def _fetch_columns(self, connection: asyncpg.Connection, query: str, columns: list, *args) -> pd.DataFrame:
+        buffers = [[] for _ in columns]
+        async for record in connection.cursor(query, *args, prefetch=self.prefetch):
+            for buffer, value in zip(buffers, record.values()):
+                buffer.append(value)
+        return pd.DataFrame(dict(zip(columns, buffers)))
+
+
+    async def fetch_product_data(self, asin: str):
+        pool = await self.connect()
+
+        # asyncpg runs one statement at a time per connection, so both lookups
+        # share a single checkout and transaction instead of two round-trips to the pool
+        async with pool.acquire() as connection:
+            async with connection.transaction(readonly=True):
+                review_df = await self._fetch_columns(connection, REVIEW_QUERY, REVIEW_COLUMNS, asin)
+                meta_df = await self._fetch_columns(connection, META_QUERY, META_COLUMNS, asin)
+
+        return review_df, meta_df
+
+
+    async def fetch_product_delta(self, asin: str, watermark: Optional[str]):
+        """Reviews at or after `watermark`, the keys of all current reviews and the metadata, in one snapshot.
+
+        Without a parsable watermark every review is returned.
+        """
+        pool = await self.connect()
+        since = parse_timestamp(watermark)
+
+        async with pool.acquire() as connection:
+            async with connection.transaction(readonly=True, isolation="repeatable_read"):
+                if since is None:
+                    review_df = await self._fetch_columns(connection, REVIEW_QUERY, REVIEW_COLUMNS, asin)
+                else:
+                    review_df = await self._fetch_columns(connection, REVIEW_DELTA_QUERY, REVIEW_COLUMNS, asin, since)
+                live_keys = {f"{row['asin']}:{row['timestamp']}:{row['md5']}"
+                             for row in await connection.fetch(REVIEW_KEYS_QUERY, asin)}
+                meta_df = await self._fetch_columns(connection, META_QUERY, META_COLUMNS, asin)
+
+        return review_df, live_keys, meta_df
+
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+        if self._connector is not None:
+            await self._connector.close_async()
+            self._connector = None
+
+
+product_repository = ProductRepository()
@@ -0,0 +1,66 @@
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+class CentroidRouterModel:
+    """Nearest-centroid classifier over normalized question embeddings.
+
+    Each route is represented by the mean embedding of the questions logged
+    with it. Confidence is the cosine margin between the best and the second
+    best route, so ambiguous questions can be sent to the LLM supervisor.
+    """
+
+    def __init__(self, labels: List[str], centroids: np.ndarray, embedding_model: str):
+        self.labels = list(labels)
+        self.centroids = _normalize(np.asarray(centroids, dtype=np.float32))
+        self.embedding_model = embedding_model
+
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, labels: List[str], embedding_model: str) -> "CentroidRouterModel":
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        labels = np.asarray(labels)
+        classes = sorted(set(labels.tolist()))
+        centroids = np.stack([vectors[labels == label].mean(axis=0) for label in classes])
+        return cls(classes, centroids, embedding_model)
+
+
+    def predict(self, vector: np.ndarray) -> Tuple[str, float]:
+        scores = self.centroids @ _normalize(np.asarray(vector, dtype=np.float32))
+        if len(scores) == 1:
+            return self.labels[0], 1.0
+        second, best = np.argsort(scores)[-2:]
+        return self.labels[best], float(scores[best] - scores[second])
+
+
+    def evaluate(self, vectors: np.ndarray, labels: List[str], threshold: float) -> dict:
+        """Accuracy of all predictions, and coverage and accuracy of the confident ones."""
+        predictions = [self.predict(vector) for vector in vectors]
+        correct = np.array([label == expected for (label, _), expected in zip(predictions, labels)])
+        confident = np.array([confidence >= threshold for _, confidence in predictions])
+        return {
+            "samples": len(labels),
+            "accuracy": round(float(correct.mean()), 4) if len(labels) else 0.0,
+            "coverage": round(float(confident.mean()), 4) if len(labels) else 0.0,
+            "confident_accuracy": round(float(correct[confident].mean()), 4) if confident.any() else 0.0,
+        }
+
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, labels=np.array(self.labels), centroids=self.centroids,
+                 embedding_model=np.array(self.embedding_model))
+
+
+    @classmethod
+    def load(cls, path) -> "CentroidRouterModel":
+        data = np.load(path)
+        return cls(data["labels"].tolist(), data["centroids"], str(data["embedding_model"]))
@@ -0,0 +1,41 @@
+import asyncio
+
+from logger import logger
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one execution.
+
+    The first caller starts the work as a task, later callers for the same key
+    await that task instead of repeating it. The result, or the exception, is
+    delivered to every caller. The task is shielded so a disconnecting caller
+    doesn't cancel the work for the others.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._inflight = {}
+
+
+    async def do(self, key, fn, *args, **kwargs):
+        task = self._inflight.get(key)
+
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+            logger.info(f"Coalesced request for in-flight key: {key}")
+
+        return await asyncio.shield(task)
+
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+        }
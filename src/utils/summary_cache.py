@@ -0,0 +1,112 @@
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from functools import lru_cache
+from typing import Optional
+
+from langchain.schema import Document
+
+from logger import logger
+from utils.metadata_store import ProductMetadata
+
+DEFAULT_PATH = "cache/summaries.sqlite3"
+
+
+@lru_cache(maxsize=32)
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode()).hexdigest()[:16]
+
+
+class SummaryCache:
+    """Persistent cache of product metadata summaries in SQLite.
+
+    A summary is keyed by (ASIN, metadata content hash, model, prompt hash),
+    so it is reused until the metadata row, the model or the prompt changes.
+    Tokens spent producing each summary are stored with it to report the
+    tokens saved by hits.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = Path(path)
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self._connection = None
+        self._lock = threading.Lock()
+
+
+    def configure(self, path):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+            self.path = Path(path)
+
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS summaries (
+                                        parent_asin TEXT,
+                                        content_hash TEXT,
+                                        model TEXT,
+                                        prompt_hash TEXT,
+                                        summary TEXT,
+                                        tokens INTEGER,
+                                        created_at REAL,
+                                        PRIMARY KEY (parent_asin, content_hash, model, prompt_hash)
+                                        )""")
+            self._connection.commit()
+        return self._connection
+
+
+    def _key(self, record: ProductMetadata, model: str, prompt: str) -> tuple:
+        return (record.parent_asin, record.content_hash, model, prompt_hash(prompt))
+
+
+    def get(self, record: ProductMetadata, model: str, prompt: str) -> Optional[Document]:
+        with self._lock:
+            row = self._connect().execute(
+                """SELECT summary, tokens FROM summaries
+                   WHERE parent_asin = ? AND content_hash = ? AND model = ? AND prompt_hash = ?""",
+                self._key(record, model, prompt),
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.tokens_saved += row[1] or 0
+
+        return Document(page_content=row[0], metadata={"source": "Metadata"})
+
+
+    def put(self, record: ProductMetadata, model: str, prompt: str, summary: str, tokens: int = 0):
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (*self._key(record, model, prompt), summary, tokens, time.time()),
+            )
+            connection.commit()
+        logger.info(f"Metadata summary cached for ASIN: {record.parent_asin}")
+
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        with self._lock:
+            entries = self._connect().execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / requests, 4) if requests else 0.0,
+            "tokens_saved": self.tokens_saved,
+        }
+
+
+summary_cache = SummaryCache()
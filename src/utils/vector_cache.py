@@ -0,0 +1,108 @@
+import os
+import threading
+from pathlib import Path
+from collections import OrderedDict
+
+from langchain_community.vectorstores import FAISS
+
+from logger import logger
+from utils.incremental_index import tombstone_count
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def _index_mtime(path: str) -> float:
+    return os.path.getmtime(os.path.join(path, "index.faiss"))
+
+
+def _index_bytes(path: str) -> int:
+    """On-disk size of the index and pickled docstore, used as the in-memory footprint."""
+    return sum(f.stat().st_size for f in Path(path).iterdir() if f.is_file())
+
+
+class VectorStoreCache:
+    """Bounded LRU cache of deserialized FAISS vector stores.
+
+    Entries are keyed by index path and validated against the mtime of
+    `index.faiss`, so an index rewritten on disk is reloaded on next access.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def configure(self, max_bytes: int):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+
+    def load(self, path, embeddings) -> FAISS:
+        path = str(path)
+        mtime = _index_mtime(path)
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry["mtime"] == mtime:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry["vectordb"]
+            self.misses += 1
+
+        vectordb = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+        # Rows of deleted reviews still in the index, retrieval fetches past them
+        vectordb.tombstones = tombstone_count(path)
+        size = _index_bytes(path)
+
+        with self._lock:
+            self._drop(path)
+            self._entries[path] = {"mtime": mtime, "vectordb": vectordb, "size": size}
+            self.total_bytes += size
+            self._evict()
+
+        return vectordb
+
+
+    def invalidate(self, path):
+        with self._lock:
+            if self._drop(str(path)):
+                logger.info(f"VectorDB cache invalidated for: {path}")
+
+
+    def _drop(self, path: str) -> bool:
+        entry = self._entries.pop(path, None)
+        if entry is None:
+            return False
+        self.total_bytes -= entry["size"]
+        return True
+
+
+    def _evict(self):
+        # Always keep the most recent entry, even if it alone exceeds the budget
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            path, entry = self._entries.popitem(last=False)
+            self.total_bytes -= entry["size"]
+            self.evictions += 1
+            logger.info(f"VectorDB cache evicted: {path}")
+
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "total_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / requests, 4) if requests else 0.0,
+        }
+
+
+vector_store_cache = VectorStoreCache()
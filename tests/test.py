@@ -2,21 +2,44 @@ import os
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
 
+import json
+import asyncio
+import numpy as np
 import pandas as pd
 import pytest
+from dataclasses import replace
 import sqlalchemy
 from fastapi import status
 from unittest.mock import MagicMock, Mock
+from concurrent.futures import ThreadPoolExecutor
 from httpx import AsyncClient
 from langchain.schema import Document
 from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings
 
-from src.components.agents import metadata_node, retrieve, supervisor_agent
+from src.components.agents import metadata_node, retrieve, supervisor_agent, RoutingEngine
 from src.serve import app
-from src.components.nodes import final_llm_node, followup_node, route_question
+from src.components.nodes import final_llm_node, followup_node, afollowup_node, route_question
 from src.config.configuration import ConfigurationManager
+from src.main.graph import Graph
 from src.utils.database import connect_with_db
+from src.utils.vector_cache import VectorStoreCache
+from src.utils.cache_manager import DiskCacheManager
+from src.utils.single_flight import SingleFlight
+from src.utils.prebuilt import PrebuiltIndexes
+from src.utils.catalog_index import CatalogIndex
+from src.utils.metadata_store import MetadataStore, ProductMetadata
+from src.utils.summary_cache import SummaryCache
+from src.utils.llm_registry import LLMRegistry
+from src.utils.answer_cache import AnswerCache
+from src.utils.query_embeddings import QueryEmbeddingCache
+from src.utils.embedding_batcher import EmbeddingBatcher
+from src.utils.onnx_embeddings import OnnxEmbeddings
+from src.utils.embedding_store import EmbeddingStore, embedding_store
+from src.utils.index_builder import build_index
+from src.utils.incremental_index import update_index, load_state, is_live, document_key
+from src.utils.prefetch import SpeculativePrefetcher
+from src.utils.router_model import CentroidRouterModel
 
 # load the API Keys
 os.environ["HF_TOKEN"] = os.getenv("HF_TOKEN")
@@ -174,6 +197,341 @@ def test_retrieve():
     assert "documents" in result
 
 
+# Test the in-memory FAISS cache
+def test_vector_store_cache(tmp_path):
+    docs = [Document(page_content="This is a review.")]
+    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    FAISS.from_documents(documents=docs, embedding=embeddings).save_local(tmp_path)
+
+    cache = VectorStoreCache()
+    first = cache.load(tmp_path, embeddings)
+    second = cache.load(tmp_path, embeddings)
+    assert first is second
+    assert cache.stats()["hits"] == 1
+
+    cache.invalidate(tmp_path)
+    assert cache.load(tmp_path, embeddings) is not first
+
+
+# Test a replaced index version is kept until its product is no longer in use
+def test_disk_cache_retired_versions(tmp_path):
+    in_use = {"B072K6TLJX"}
+    cache = DiskCacheManager(tmp_path / "faiss", tmp_path / "meta", max_bytes=1 << 30, ttl_seconds=3600,
+                             sweep_interval_seconds=300, in_use=lambda key: key in in_use)
+    (tmp_path / "meta").mkdir()
+    meta_df = pd.DataFrame({"parent_asin": ["B072K6TLJX"]})
+
+    versions = []
+    for _ in range(2):
+        versions.append(cache.new_version_path("B072K6TLJX"))
+        versions[-1].mkdir()
+        cache.publish("B072K6TLJX", versions[-1], meta_df)
+    assert cache.index_path("B072K6TLJX").resolve() == versions[1].resolve()
+
+    cache.sweep()
+    assert versions[0].exists()
+    in_use.clear()
+    cache.sweep()
+    assert not versions[0].exists() and versions[1].exists()
+
+
+# Test coalescing of concurrent builds
+@pytest.mark.asyncio
+async def test_single_flight():
+    single_flight = SingleFlight()
+    builds = []
+
+    async def build(asin):
+        builds.append(asin)
+        await asyncio.sleep(0.01)
+        return asin
+
+    results = await asyncio.gather(*[single_flight.do("B072K6TLJX", build, "B072K6TLJX") for _ in range(5)])
+    assert results == ["B072K6TLJX"] * 5
+    assert builds == ["B072K6TLJX"]
+    assert single_flight.stats()["coalesced"] == 4
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("build failed")
+
+    results = await asyncio.gather(*[single_flight.do("B072K6TLJX", fail) for _ in range(3)], return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+# Test lookup of indexes prebuilt by the data pipeline
+def test_prebuilt_indexes(tmp_path):
+    index_dir = tmp_path / "B072K6TLJX" / "20241201T020000" / "index"
+    index_dir.mkdir(parents=True)
+    (index_dir / "index.faiss").touch()
+    manifest = {
+        "version": "20241201T020000",
+        "embedding_model": "all-MiniLM-L6-v2",
+        "products": {"B072K6TLJX": {
+            "version": "20241201T020000",
+            "index_path": "B072K6TLJX/20241201T020000/index",
+            "metadata_path": "B072K6TLJX/20241201T020000/metadata.parquet",
+        }},
+    }
+    (tmp_path / "manifest.json").write_text(json.dumps(manifest))
+
+    prebuilt = PrebuiltIndexes(tmp_path / "manifest.json", "all-MiniLM-L6-v2")
+    assert prebuilt.get("B072K6TLJX").index_path == index_dir
+    assert prebuilt.get("B000000000") is None
+
+    # A manifest built with another embedding model is not usable for queries
+    assert PrebuiltIndexes(tmp_path / "manifest.json", "all-mpnet-base-v2").get("B072K6TLJX") is None
+
+
+# Test product-restricted search in the catalog index
+def test_catalog_index(tmp_path):
+    index = CatalogIndex(tmp_path)
+    index.add("B072K6TLJX", np.eye(3, dtype=np.float32), [Document(page_content=f"review {i}") for i in range(3)])
+    index.add("B000000000", np.eye(3, dtype=np.float32), [Document(page_content="other product")] * 3)
+
+    documents = index.search("B072K6TLJX", np.array([0, 1, 0], dtype=np.float32), k=2)
+    assert documents[0].page_content == "review 1"
+    assert all(doc.page_content != "other product" for doc in documents)
+
+    # Re-adding a product replaces its range, compaction drops the old one
+    index.add("B072K6TLJX", np.eye(3, dtype=np.float32)[:1], [Document(page_content="updated")])
+    index.compact()
+    assert index.stats()["dead_rows"] == 0
+    assert CatalogIndex(tmp_path).search("B072K6TLJX", np.zeros(3, dtype=np.float32))[0].page_content == "updated"
+
+
+# Test catalog partitions expire after the TTL until the product is re-added
+def test_catalog_index_expiry(tmp_path):
+    index = CatalogIndex(tmp_path)
+    index.add("B072K6TLJX", np.eye(3, dtype=np.float32)[:1], [Document(page_content="review")])
+    assert not index.expired("B072K6TLJX", 3600)
+    assert index.expired("B072K6TLJX", -1)
+
+    index.add("B072K6TLJX", np.eye(3, dtype=np.float32)[1:2], [Document(page_content="refreshed")])
+    index.compact()
+    reopened = CatalogIndex(tmp_path)
+    assert not reopened.expired("B072K6TLJX", 3600)
+    assert reopened.search("B072K6TLJX", np.zeros(3, dtype=np.float32))[0].page_content == "refreshed"
+
+
+# Test a failed append leaves no bytes that shift the rows of later products
+def test_catalog_index_failed_append(tmp_path):
+    index = CatalogIndex(tmp_path)
+    index.add("B072K6TLJX", np.eye(3, dtype=np.float32), [Document(page_content=f"review {i}") for i in range(3)])
+
+    with pytest.raises(ValueError):
+        index.add_many([("B000000001", np.eye(3, dtype=np.float32)[:1], [Document(page_content="valid")]),
+                        ("B000000002", np.eye(4, dtype=np.float32)[:1], [Document(page_content="wrong dimension")])])
+    assert not index.contains("B000000001")
+
+    # Bytes written by a call interrupted before its state update
+    for path in index._files(0):
+        with open(path, "ab") as f:
+            f.write(b"\0" * 12)
+
+    index.add("B000000003", np.eye(3, dtype=np.float32)[2:], [Document(page_content="appended")])
+    reopened = CatalogIndex(tmp_path)
+    assert reopened.search("B000000003", np.array([0, 0, 1], dtype=np.float32))[0].page_content == "appended"
+    assert reopened.search("B072K6TLJX", np.array([0, 1, 0], dtype=np.float32))[0].page_content == "review 1"
+
+
+# Test the parsed and pre-rendered product metadata cache
+def test_metadata_store(tmp_path):
+    path = tmp_path / "B072K6TLJX.parquet"
+    pd.DataFrame({"parent_asin": ["B072K6TLJX"], "title": ["Test Product"], "details": ["{'Color': 'Red'}"]}).to_parquet(path)
+
+    store = MetadataStore(max_entries=1)
+    record = store.load(path, "{title} {details}")
+    assert record.title == "Test Product"
+    assert record.prompt == "Test Product ['Color': 'Red'}}"
+    assert store.load(path, "{title} {details}") is record
+    assert store.stats()["hits"] == 1
+
+
+# Test metadata summaries are reused until the metadata changes
+def test_summary_cache(tmp_path):
+    cache = SummaryCache(tmp_path / "summaries.sqlite3")
+    record = ProductMetadata.from_row({"parent_asin": "B072K6TLJX", "title": "Test Product"}, "{title}")
+
+    assert cache.get(record, "llama-3.1-8b-instant", "{title}") is None
+    cache.put(record, "llama-3.1-8b-instant", "{title}", "A test product.", tokens=120)
+    assert cache.get(record, "llama-3.1-8b-instant", "{title}").page_content == "A test product."
+    assert cache.stats()["tokens_saved"] == 120
+
+    changed = ProductMetadata.from_row({"parent_asin": "B072K6TLJX", "title": "Renamed Product"}, "{title}")
+    assert cache.get(changed, "llama-3.1-8b-instant", "{title}") is None
+    assert cache.get(record, "gpt-4o-mini", "{title}") is None
+
+
+# Test the parallel topology joins Metadata and retrieval before generate
+def test_parallel_graph():
+    graph = Graph(config=replace(config, graph_topology="parallel")).create_graph()
+    assert "supervisor" not in graph.nodes
+
+    edges = {(edge.source, edge.target) for edge in graph.get_graph().edges}
+    assert ("__start__", "Metadata") in edges
+    assert ("__start__", "Review-Vectorstore") in edges
+    assert ("Metadata", "generate") in edges and ("Review-Vectorstore", "generate") in edges
+
+
+# Test the answer-only graph used with skip_followups ends after generate
+def test_graph_without_followups():
+    graph = Graph(config=config).create_graph(followups=False)
+    assert "final" not in graph.nodes
+
+    edges = {(edge.source, edge.target) for edge in graph.get_graph().edges}
+    assert ("generate", "__end__") in edges
+
+
+# Test chat model clients are shared per model and params
+def test_llm_registry():
+    registry = LLMRegistry()
+    registry.configure(configManager.get_llm_config())
+
+    llm = registry.get(config.metadata_model)
+    assert registry.get(config.metadata_model) is llm
+    assert registry.get(config.metadata_model, temperature=0) is not llm
+    assert registry.get(config.supervisor_model).http_client is llm.http_client
+    assert LLMRegistry.provider(config.supervisor_model) == "openai"
+
+
+# Test similar questions reuse an answer until the review set changes
+def test_answer_cache():
+    cache = AnswerCache(max_entries=2, ttl_seconds=3600, threshold=0.9)
+    question = np.array([1.0, 0.0], dtype=np.float32)
+    similar = np.array([0.96, 0.28], dtype=np.float32)
+
+    cache.put("B072K6TLJX", "v1", question, "Is it durable?", "Yes.", ["Is it waterproof?"])
+    assert cache.get("B072K6TLJX", "v1", similar).answer == "Yes."
+    assert cache.get("B072K6TLJX", "v1", np.array([0.0, 1.0], dtype=np.float32)) is None
+    assert cache.get("B07ABCDEFG", "v1", question) is None
+
+    assert cache.get("B072K6TLJX", "v2", question) is None
+    assert cache.stats()["invalidations"] == 1 and cache.stats()["entries"] == 0
+
+    for asin in ["A1", "A2", "A3"]:
+        cache.put(asin, "v1", question, "Is it durable?", "Yes.", [])
+    assert cache.stats()["entries"] == 2 and cache.get("A1", "v1", question) is None
+
+
+# Test query embeddings are reused for the same normalized text
+def test_query_embedding_cache():
+    cache = QueryEmbeddingCache(capacity=1)
+
+    vector = cache.embed("Is it durable?", config.embedding_model)
+    assert np.array_equal(cache.embed("  Is it   durable? ", config.embedding_model), vector)
+    assert cache.stats()["hits"] == 1 and vector.dtype == np.float32
+
+    cache.embed("Is it waterproof?", config.embedding_model)
+    assert cache.stats()["evictions"] == 1 and cache.stats()["entries"] == 1
+
+
+# Test concurrent query encodes share batched forward passes
+def test_embedding_batcher():
+    batcher = EmbeddingBatcher(window_ms=50, max_batch=4)
+    questions = [f"Question {i}?" for i in range(8)]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        vectors = list(pool.map(lambda question: batcher.embed(question, config.embedding_model), questions))
+
+    expected = HuggingFaceEmbeddings(model_name=config.embedding_model).embed_query(questions[0])
+    assert np.allclose(vectors[0], expected, atol=1e-5)
+    assert batcher.stats()["items"] == 8 and batcher.stats()["batches"] < 8
+
+
+# Test the int8 ONNX export keeps the dimension and stays close to the fp32 model
+def test_onnx_embeddings(tmp_path):
+    texts = ["Is it durable?", "The stroller folds flat and fits in a small trunk."]
+    int8 = np.array(OnnxEmbeddings(config.embedding_model, tmp_path).embed_documents(texts))
+    fp32 = np.array(HuggingFaceEmbeddings(model_name=config.embedding_model).embed_documents(texts))
+
+    assert int8.shape == fp32.shape
+    cosine = (int8 * fp32).sum(axis=1) / (np.linalg.norm(int8, axis=1) * np.linalg.norm(fp32, axis=1))
+    assert (cosine > 0.98).all()
+
+
+# Test review embeddings are persisted by content and only new texts are encoded
+def test_embedding_store(tmp_path):
+    store = EmbeddingStore(tmp_path)
+    first = store.embed(["Great stroller.", "Wheels broke."], config.embedding_model)
+
+    reopened = EmbeddingStore(tmp_path)
+    second = reopened.embed(["Wheels broke.", "Too heavy."], config.embedding_model)
+    assert np.array_equal(second[0], first[1])
+    assert reopened.stats()["hits"] == 1 and reopened.stats()["misses"] == 3
+
+    reopened.max_bytes = 0
+    reopened.evict()
+    reopened.compact()
+    assert reopened.stats()["entries"] == 0 and reopened.stats()["shards"] == 0
+
+
+# Test an index is updated with new reviews and hides deleted ones without a rebuild
+def test_incremental_index_update(tmp_path):
+    embedding_store.configure(tmp_path / "store", 1024 * 1024 * 1024)
+    kept = Document(page_content="Great stroller.",
+                    metadata={"asin": "B072K6TLJX", "timestamp": "2019-10-30 18:35:35.344"})
+    deleted = Document(page_content="Wheels broke.",
+                       metadata={"asin": "B072K6TLJX", "timestamp": "2020-01-02 09:00:00"})
+    added = Document(page_content="Too heavy.", metadata={"asin": "B072K6TLJX", "timestamp": "2020-03-15 12:30:01.5"})
+    build_index([kept, deleted], tmp_path / "v1", config.embedding_model)
+    assert load_state(tmp_path / "v1")["watermark"] == "2020-01-02 09:00:00"
+
+    live_keys = {document_key(kept), document_key(added)}
+    result = update_index(tmp_path / "v1", tmp_path / "v2", [kept, added], live_keys, config.embedding_model,
+                          compact_ratio=1.0)
+    assert result["added"] == 1 and result["deleted"] == 1 and result["rows"] == 3
+    assert load_state(tmp_path / "v2")["watermark"] == "2020-03-15 12:30:01.500000"
+
+    vectordb = FAISS.load_local(tmp_path / "v2", HuggingFaceEmbeddings(model_name=config.embedding_model),
+                                allow_dangerous_deserialization=True)
+    docs = vectordb.similarity_search("Wheels broke.", k=3, filter=is_live)
+    assert sorted(doc.page_content for doc in docs) == ["Great stroller.", "Too heavy."]
+
+
+# Test suggested follow-ups are prefetched per session within the budget
+@pytest.mark.asyncio
+async def test_speculative_prefetcher():
+    prefetcher = SpeculativePrefetcher(mode="retrieval", followups=2, max_concurrent=1)
+
+    async def fetch(question):
+        return [Document(page_content=question)]
+
+    prefetcher.schedule("123-B072K6TLJX", ["Is it durable?", "Is it waterproof?"], fetch)
+    assert prefetcher.stats()["skipped"] == 1
+
+    prefetched = await prefetcher.get("123-B072K6TLJX", "Is it  durable?")
+    assert prefetched.result[0].page_content == "Is it durable?"
+    assert await prefetcher.get("123-B072K6TLJX", "Is it waterproof?") is None
+    assert prefetcher.stats()["hits"] == 1 and prefetcher.stats()["misses"] == 1
+
+
+# Test the local router model picks the closest route and reports its margin
+def test_centroid_router_model(tmp_path):
+    vectors = np.array([[1.0, 0.0], [0.9, 0.1], [0.0, 1.0], [0.1, 0.9]], dtype=np.float32)
+    labels = ["Review-Vectorstore", "Review-Vectorstore", "FINISH", "FINISH"]
+    model = CentroidRouterModel.fit(vectors, labels, config.embedding_model)
+    model.save(tmp_path / "centroids.npz")
+    model = CentroidRouterModel.load(tmp_path / "centroids.npz")
+
+    datasource, confidence = model.predict(np.array([1.0, 0.05], dtype=np.float32))
+    assert datasource == "Review-Vectorstore" and confidence > 0.5
+    assert model.predict(np.array([1.0, 1.0], dtype=np.float32))[1] < 0.05
+    assert model.evaluate(vectors, labels, threshold=0.05)["accuracy"] == 1.0
+
+
+# Test the local router finishes once retrieval ran, even when it found nothing
+def test_local_route_after_empty_retrieval(tmp_path):
+    engine = RoutingEngine()
+    engine.configure("centroid", tmp_path / "centroids.npz", 0.5, tmp_path / "decisions.jsonl",
+                     config.embedding_model)
+    state = {"question": "Is it durable?", "documents": []}
+    assert engine.local_route(state) is None
+
+    result = retrieve({**state, "retriever": Mock(invoke=Mock(return_value=[]))})
+    assert engine.local_route({**state, **result}) == ("FINISH", "rule")
+
+
 # Test final_llm_node function
 def test_final_llm_node():
     state = {
@@ -206,6 +564,25 @@ def test_followup_node():
     assert "followup_questions" in result
 
 
+# Test the async followup_node variant and its registration in the graph
+@pytest.mark.asyncio
+async def test_afollowup_node():
+    state = {
+        "question": "Tell me more about the product.",
+        "answer": Mock(content="This product is amazing!"),
+        "meta_summary": Document(page_content="Product details."),
+        "documents": [Document(page_content="Product details.")],
+    }
+
+    result = await afollowup_node(
+        state, prompt=config.prompt_followup, model=config.followup_model
+    )
+    assert "followup_questions" in result
+
+    graph = Graph(config=replace(config, async_nodes=True)).create_graph()
+    assert graph.nodes["final"].bound.afunc is not None
+
+
 @pytest.mark.asyncio
 async def test_health_endpoint():
     """Test the health check endpoint."""
@@ -265,6 +642,23 @@ async def test_invoke_endpoint(valid_headers, test_payload):
         assert response.status_code in {status.HTTP_200_OK, status.HTTP_400_BAD_REQUEST}
 
 
+@pytest.mark.asyncio
+async def test_batch_invoke_endpoint(valid_headers):
+    """Test the batch endpoint returns one result per query, in order."""
+    payload = {
+        "user_id": "ABCD",
+        "queries": [
+            {"query": "Is it durable?", "parent_asin": "B072K6TLJX"},
+            {"query": "Hello", "parent_asin": "B072K6TLJX"},
+        ],
+    }
+    async with AsyncClient(app=app, base_url="http://localhost:80") as client:
+        response = await client.post("/dev-batch-invoke", json=payload, headers=valid_headers)
+        assert response.status_code == status.HTTP_200_OK
+        results = response.json()["results"]
+        assert [result["question"] for result in results] == ["Is it durable?", "Hello"]
+
+
 @pytest.mark.asyncio
 async def test_stream_endpoint(valid_headers, test_payload):
     """Test the stream endpoint for server-sent events."""